@@ -0,0 +1,153 @@
+"""
+Publishes many SNS messages with PublishBatch.
+
+Messages are grouped per topic into batches of at most 10 entries and
+256 KB (the PublishBatch limits), and the batches are sent by a thread pool.
+Entries that fail with a server-side error (SenderFault false, e.g.
+throttling or an internal error) and batches whose call failed with a
+retryable error (throttling, a 5xx response, or a connection error or
+timeout) are retried with exponential backoff and jitter. Entries
+rejected as the sender's fault, too large, or still failing after the last
+attempt are returned as failures instead of raising, so one bad message does
+not fail (and redeliver) the whole invocation.
+
+Environment variables (read by index.py):
+  PUBLISH_CONCURRENCY  - Batches sent in parallel (default 8).
+  PUBLISH_MAX_ATTEMPTS - Attempts per entry (default 3).
+"""
+
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as EndpointConnectionFailure
+
+logger = logging.getLogger()
+
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+BACKOFF_BASE_SECONDS = 0.1
+BACKOFF_MAX_SECONDS = 2.0
+# Call errors worth retrying; anything else fails the batch's entries at once
+RETRYABLE_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "InternalError",
+    "InternalFailure",
+    "ServiceUnavailable",
+    "KMSThrottlingException",
+}
+# Transport errors worth retrying (connection failures and timeouts); other
+# BotoCoreErrors, e.g. ParamValidationError, fail the batch's entries at once
+RETRYABLE_TRANSPORT_ERRORS = (EndpointConnectionFailure, HTTPClientError)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Return whether a failed PublishBatch call is worth retrying"""
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return error.response["Error"]["Code"] in RETRYABLE_ERROR_CODES or status >= 500
+    return isinstance(error, RETRYABLE_TRANSPORT_ERRORS)
+
+
+def entry_size(entry: dict) -> int:
+    return len(entry["Message"].encode()) + len(entry.get("Subject", "").encode())
+
+
+def batches(entries: list[dict]):
+    """Split entries into PublishBatch-sized chunks (10 entries, 256 KB)"""
+    batch: list[dict] = []
+    size = 0
+    for entry in entries:
+        entry_bytes = entry_size(entry)
+        if batch and (len(batch) == MAX_BATCH_ENTRIES or size + entry_bytes > MAX_BATCH_BYTES):
+            yield batch
+            batch, size = [], 0
+        batch.append(entry)
+        size += entry_bytes
+    if batch:
+        yield batch
+
+
+class BatchPublisher:
+    def __init__(self, client, concurrency: int = 8, max_attempts: int = 3):
+        self.client = client
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+
+    def publish(self, messages: dict[str, list[dict]]) -> dict:
+        """
+        Publish {topicArn: [{"id", "message", "subject"?}]}.
+
+        Returns {"published": count, "failed": [{"topicArn", "id", "code", "message"}]}.
+        """
+        work = []
+        failed = []
+        for topic_arn, items in messages.items():
+            entries = []
+            for item in items:
+                entry = {"Id": item["id"], "Message": item["message"]}
+                if item.get("subject"):
+                    entry["Subject"] = item["subject"]
+                if entry_size(entry) > MAX_BATCH_BYTES:
+                    failed.append(
+                        {"topicArn": topic_arn, "id": item["id"], "code": "MessageTooLong", "message": "Message exceeds 256 KB"}
+                    )
+                    continue
+                entries.append(entry)
+            work.extend((topic_arn, batch) for batch in batches(entries))
+
+        published = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch_published, batch_failed in executor.map(lambda args: self.publish_batch(*args), work):
+                published += batch_published
+                failed.extend(batch_failed)
+        return {"published": published, "failed": failed}
+
+    def publish_batch(self, topic_arn: str, entries: list[dict]) -> tuple[int, list[dict]]:
+        """Send one batch, retrying its retryable failures; return (published, failures)"""
+        published = 0
+        failed = []
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                time.sleep(min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 2)) * random.uniform(0.5, 1))
+            # PublishBatch entry IDs only need to be unique within a request
+            by_batch_id = {str(index): entry for index, entry in enumerate(entries)}
+            try:
+                response = self.client.publish_batch(
+                    TopicArn=topic_arn,
+                    PublishBatchRequestEntries=[{**entry, "Id": batch_id} for batch_id, entry in by_batch_id.items()],
+                )
+            except (ClientError, BotoCoreError) as e:
+                code = e.response["Error"]["Code"] if isinstance(e, ClientError) else type(e).__name__
+                if not is_retryable(e) or attempt == self.max_attempts:
+                    logger.error(f"PublishBatch to {topic_arn} failed for {len(entries)} message(s): {e}")
+                    failed.extend(
+                        {"topicArn": topic_arn, "id": entry["Id"], "code": code, "message": str(e)} for entry in entries
+                    )
+                    return published, failed
+                continue
+
+            published += len(response.get("Successful", []))
+            retry = []
+            for failure in response.get("Failed", []):
+                entry = by_batch_id[failure["Id"]]
+                if not failure.get("SenderFault") and attempt < self.max_attempts:
+                    retry.append(entry)
+                else:
+                    failed.append(
+                        {
+                            "topicArn": topic_arn,
+                            "id": entry["Id"],
+                            "code": failure.get("Code"),
+                            "message": failure.get("Message"),
+                        }
+                    )
+            if not retry:
+                break
+            entries = retry
+        return published, failed
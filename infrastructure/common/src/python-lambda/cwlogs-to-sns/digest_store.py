@@ -0,0 +1,301 @@
+"""
+Windowed alert digest for the CloudWatch Logs -> SNS handler.
+
+Instead of one SNS message per subscription delivery, every delivery is
+reduced to a small summary (event counts per log group/stream and its most
+frequent distinct messages) that is stored in a DynamoDB table shared by all
+containers, under the time window it arrived in. Once a window has closed,
+one invocation claims it with a conditional write, merges the summaries and
+publishes a single digest, so the SNS call volume is one message per window
+however many deliveries arrive.
+
+The table uses "window_start" (number, epoch seconds) as partition key,
+"entry_id" (string) as sort key and "expires_at" (epoch seconds) as its TTL
+attribute. Deliveries are identified by a hash of their log group, stream and
+first/last event IDs, so a retried delivery (a Lambda retry, or CloudWatch
+Logs redelivering after throttling) is stored only once: its entry is written
+in one transaction with a marker under DELIVERY_PARTITION that must not exist
+yet, even when the retry arrives in a later window. The entry
+FLUSH_ENTRY_ID of a window records its flush ("flushing" or "published"); a
+claim that was not published within DIGEST_CLAIM_TIMEOUT_SECONDS can be taken
+over, so a crashed flush is retried (the digest may then be published twice).
+The same transaction checks that the window is not claimed yet, so a
+delivery that arrives late is moved to the next window instead of being
+lost; DIGEST_GRACE_SECONDS only makes that rare.
+
+Top messages are approximate: a delivery only keeps its most frequent
+messages, so a message that is rare in every delivery can be undercounted.
+
+Environment variables:
+  DIGEST_TABLE_NAME             - DynamoDB table of the shared store (required in digest mode).
+  DIGEST_WINDOW_SECONDS         - Length of a digest window (default 300).
+  DIGEST_GRACE_SECONDS          - Wait after the end of a window before it is flushed (default 30).
+  DIGEST_LOOKBACK_WINDOWS       - Closed windows checked for a pending flush (default 3).
+  DIGEST_TOP_MESSAGES           - Distinct messages listed in a digest (default 10).
+  DIGEST_MESSAGE_MAX_LENGTH     - Characters of a message kept for grouping (default 256).
+  DIGEST_CLAIM_TIMEOUT_SECONDS  - Age after which an unpublished claim is taken over (default 60).
+  DIGEST_TTL_SECONDS            - How long entries are kept (default 86400).
+  DIGEST_ENDPOINT_URL           - DynamoDB endpoint override, e.g. http://localhost:8000 for
+                                  DynamoDB Local.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+import boto3
+from botocore.exceptions import ClientError
+
+DIGEST_TABLE_NAME = os.environ.get("DIGEST_TABLE_NAME", "")
+DIGEST_WINDOW_SECONDS = int(os.environ.get("DIGEST_WINDOW_SECONDS", "300"))
+DIGEST_GRACE_SECONDS = int(os.environ.get("DIGEST_GRACE_SECONDS", "30"))
+DIGEST_LOOKBACK_WINDOWS = int(os.environ.get("DIGEST_LOOKBACK_WINDOWS", "3"))
+DIGEST_TOP_MESSAGES = int(os.environ.get("DIGEST_TOP_MESSAGES", "10"))
+DIGEST_MESSAGE_MAX_LENGTH = int(os.environ.get("DIGEST_MESSAGE_MAX_LENGTH", "256"))
+DIGEST_CLAIM_TIMEOUT_SECONDS = int(os.environ.get("DIGEST_CLAIM_TIMEOUT_SECONDS", "60"))
+DIGEST_TTL_SECONDS = int(os.environ.get("DIGEST_TTL_SECONDS", "86400"))
+DIGEST_ENDPOINT_URL = os.environ.get("DIGEST_ENDPOINT_URL", "")
+
+FLUSH_ENTRY_ID = "#flush"
+# Partition of the delivery markers (no window starts at 0)
+DELIVERY_PARTITION = "0"
+ADD_MAX_ATTEMPTS = 5
+# Distinct messages kept per delivery, relative to DIGEST_TOP_MESSAGES
+DELIVERY_MESSAGES_FACTOR = 5
+# Bound the digest size (SNS messages are limited to 256 KB)
+MAX_LOG_GROUPS = 20
+MAX_STREAMS_PER_LOG_GROUP = 10
+
+
+def delivery_id(log_group: str, log_stream: str, log_events: list) -> str:
+    """Return an ID that is the same for every delivery of the same batch."""
+    first = log_events[0]["id"] if log_events else ""
+    last = log_events[-1]["id"] if log_events else ""
+    return hashlib.sha256(f"{log_group}\n{log_stream}\n{first}\n{last}".encode()).hexdigest()[:32]
+
+
+def summarize_delivery(log_group: str, log_stream: str, log_events: list) -> dict:
+    """Reduce one subscription delivery to the counts and messages kept in the store."""
+    messages = Counter(event["message"][:DIGEST_MESSAGE_MAX_LENGTH] for event in log_events)
+    return {
+        "events": len(log_events),
+        "streams": {log_group: {log_stream: len(log_events)}},
+        "messages": dict(messages.most_common(DIGEST_TOP_MESSAGES * DELIVERY_MESSAGES_FACTOR)),
+    }
+
+
+def build_digest(window_start: int, entries: list[dict]) -> dict:
+    """Merge the stored delivery summaries of a window into the published digest."""
+    streams: dict[str, Counter] = {}
+    messages: Counter = Counter()
+    for entry in entries:
+        for log_group, counts in entry["streams"].items():
+            streams.setdefault(log_group, Counter()).update(counts)
+        messages.update(entry["messages"])
+
+    log_groups = sorted(streams.items(), key=lambda item: sum(item[1].values()), reverse=True)
+    return {
+        "type": "digest",
+        "windowStart": format_time(window_start),
+        "windowEnd": format_time(window_start + DIGEST_WINDOW_SECONDS),
+        "deliveries": len(entries),
+        "eventCount": sum(entry["events"] for entry in entries),
+        "logGroups": [
+            {
+                "logGroup": log_group,
+                "eventCount": sum(counts.values()),
+                "logStreams": [
+                    {"logStream": log_stream, "eventCount": count}
+                    for log_stream, count in counts.most_common(MAX_STREAMS_PER_LOG_GROUP)
+                ],
+                "otherLogStreams": max(len(counts) - MAX_STREAMS_PER_LOG_GROUP, 0),
+            }
+            for log_group, counts in log_groups[:MAX_LOG_GROUPS]
+        ],
+        "otherLogGroups": max(len(log_groups) - MAX_LOG_GROUPS, 0),
+        "topMessages": [
+            {"message": message, "count": count} for message, count in messages.most_common(DIGEST_TOP_MESSAGES)
+        ],
+    }
+
+
+def format_time(epoch_seconds: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch_seconds))
+
+
+class DynamoDBDigestStore:
+    """Delivery summaries per window and window flush claims, stored in DynamoDB."""
+
+    def __init__(self, table_name: str, window_seconds: int, client=None):
+        self.table_name = table_name
+        self.window_seconds = window_seconds
+        self.client = client or boto3.client("dynamodb")
+
+    def window_start(self, now: float) -> int:
+        return int(now) // self.window_seconds * self.window_seconds
+
+    def closed_windows(self, now: float) -> list[int]:
+        """Return the windows of the lookback that ended at least DIGEST_GRACE_SECONDS ago."""
+        last = self.window_start(now - DIGEST_GRACE_SECONDS) - self.window_seconds
+        return [last - offset * self.window_seconds for offset in reversed(range(DIGEST_LOOKBACK_WINDOWS))]
+
+    def add(self, entry_id: str, summary: dict, now: float) -> int | None:
+        """
+        Store a delivery summary under the first unclaimed window from now and return the window.
+
+        Returns None if the delivery was already stored (in any window).
+
+        Raises:
+            ClientError: If the DynamoDB call fails
+            RuntimeError: If no window could be written after the retries
+        """
+        window_start = self.window_start(now)
+        expires_at = {"N": str(int(now) + DIGEST_TTL_SECONDS)}
+        body = {"S": json.dumps(summary, separators=(",", ":"))}
+        for attempt in range(ADD_MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(0.05 * 2**attempt)
+            try:
+                self.client.transact_write_items(
+                    TransactItems=[
+                        {
+                            "Put": {
+                                "TableName": self.table_name,
+                                "Item": {
+                                    "window_start": {"N": DELIVERY_PARTITION},
+                                    "entry_id": {"S": entry_id},
+                                    "expires_at": expires_at,
+                                },
+                                "ConditionExpression": "attribute_not_exists(entry_id)",
+                            }
+                        },
+                        {
+                            "Put": {
+                                "TableName": self.table_name,
+                                "Item": {
+                                    "window_start": {"N": str(window_start)},
+                                    "entry_id": {"S": entry_id},
+                                    "summary": body,
+                                    "expires_at": expires_at,
+                                },
+                            }
+                        },
+                        {
+                            "ConditionCheck": {
+                                "TableName": self.table_name,
+                                "Key": {"window_start": {"N": str(window_start)}, "entry_id": {"S": FLUSH_ENTRY_ID}},
+                                "ConditionExpression": "attribute_not_exists(entry_id)",
+                            }
+                        },
+                    ]
+                )
+                return window_start
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("TransactionCanceledException", "TransactionConflictException"):
+                    raise
+                reasons = [reason.get("Code") for reason in e.response.get("CancellationReasons", [])]
+                if reasons[:1] == ["ConditionalCheckFailed"]:
+                    return None
+                if reasons[2:3] == ["ConditionalCheckFailed"]:
+                    # The window was flushed meanwhile
+                    window_start += self.window_seconds
+        raise RuntimeError(f"Delivery {entry_id} was not stored after {ADD_MAX_ATTEMPTS} attempts")
+
+    def flush_status(self, window_start: int) -> str | None:
+        """
+        Return "flushing", "published" or None if the window was not claimed.
+
+        Raises:
+            ClientError: If the DynamoDB call fails
+        """
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"window_start": {"N": str(window_start)}, "entry_id": {"S": FLUSH_ENTRY_ID}},
+            ProjectionExpression="flush_status",
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        return item["flush_status"]["S"] if item else None
+
+    def claim(self, window_start: int, now: float) -> bool:
+        """
+        Claim the flush of a window; False if it is published or claimed by another invocation.
+
+        Raises:
+            ClientError: If the DynamoDB call fails
+        """
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "window_start": {"N": str(window_start)},
+                    "entry_id": {"S": FLUSH_ENTRY_ID},
+                    "flush_status": {"S": "flushing"},
+                    "claimed_at": {"N": str(int(now))},
+                    "expires_at": {"N": str(int(now) + DIGEST_TTL_SECONDS)},
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(entry_id) OR (flush_status = :flushing AND claimed_at < :stale)"
+                ),
+                ExpressionAttributeValues={
+                    ":flushing": {"S": "flushing"},
+                    ":stale": {"N": str(int(now) - DIGEST_CLAIM_TIMEOUT_SECONDS)},
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def entries(self, window_start: int) -> list[dict]:
+        """
+        Return the delivery summaries stored under a window.
+
+        Raises:
+            ClientError: If the DynamoDB call fails
+        """
+        entries = []
+        kwargs = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "window_start = :window",
+            "ExpressionAttributeValues": {":window": {"N": str(window_start)}},
+            "ConsistentRead": True,
+        }
+        while True:
+            response = self.client.query(**kwargs)
+            entries.extend(
+                json.loads(item["summary"]["S"]) for item in response["Items"] if item["entry_id"]["S"] != FLUSH_ENTRY_ID
+            )
+            if "LastEvaluatedKey" not in response:
+                return entries
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def mark_published(self, window_start: int) -> None:
+        """
+        Record that the digest of a window was published.
+
+        Raises:
+            ClientError: If the DynamoDB call fails
+        """
+        self.client.update_item(
+            TableName=self.table_name,
+            Key={"window_start": {"N": str(window_start)}, "entry_id": {"S": FLUSH_ENTRY_ID}},
+            UpdateExpression="SET flush_status = :published",
+            ExpressionAttributeValues={":published": {"S": "published"}},
+        )
+
+
+def get_digest_store() -> DynamoDBDigestStore:
+    """
+    Return the digest store configured by the environment.
+
+    Raises:
+        ValueError: If DIGEST_TABLE_NAME is not set
+    """
+    if not DIGEST_TABLE_NAME:
+        raise ValueError("DIGEST_TABLE_NAME must be set in digest mode")
+    client = boto3.client("dynamodb", endpoint_url=DIGEST_ENDPOINT_URL or None)
+    return DynamoDBDigestStore(DIGEST_TABLE_NAME, DIGEST_WINDOW_SECONDS, client)
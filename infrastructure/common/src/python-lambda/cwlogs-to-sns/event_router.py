@@ -0,0 +1,142 @@
+"""
+Routes the log events of a delivery to SNS topics by the terms they contain.
+
+The routing table is a JSON list of rules (ROUTING_RULES, read by index.py):
+
+  [
+    {"name": "fatal", "terms": ["FATAL", "CRITICAL"], "topicArn": "arn:aws:sns:...:oncall"},
+    {"name": "payments", "terms": ["payment declined"], "topicArn": "arn:aws:sns:...:payments", "ignoreCase": true}
+  ]
+
+An event goes to the topic of every rule one of whose terms occurs in its
+message; events that match no rule are returned separately (index.py sends
+them to TOPIC_ARN).
+
+All terms are compiled into one regular expression shaped as a trie (terms
+share their prefixes, like the goto function of Aho-Corasick) and run as a
+lookahead at every position, so each message is scanned once however many
+rules there are. At each position the longest term is reported; the rules of
+the terms it contains are implied, so overlapping terms are all found.
+Case-insensitive terms are matched by a second expression on the lowercased
+message.
+"""
+
+import json
+import re
+
+
+class RoutingRule:
+    __slots__ = ("name", "terms", "topic_arn", "ignore_case")
+
+    def __init__(self, name: str, terms: list[str], topic_arn: str, ignore_case: bool = False):
+        if not terms or not all(terms):
+            raise ValueError(f"Routing rule {name!r} needs at least one non-empty term")
+        self.name = name
+        self.terms = [term.lower() for term in terms] if ignore_case else list(terms)
+        self.topic_arn = topic_arn
+        self.ignore_case = ignore_case
+
+
+def trie_pattern(terms) -> str:
+    """Regular expression matching any of the terms, with shared prefixes factored out"""
+    trie: dict = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy: the longest term at a position wins, shorter ones are implied
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class TermMatcher:
+    """Finds which rules have a term in a text, in one scan"""
+
+    def __init__(self, rules_by_term: dict[str, set[int]]):
+        terms = trie_pattern(rules_by_term)
+        # Finds the first occurrence fast (prefix scan); the lookahead lists all from there
+        self.first = re.compile(terms)
+        self.pattern = re.compile("(?=(" + terms + "))")
+        # A matched term implies every term it contains
+        self.rules_by_term = {
+            term: set().union(*(rules for other, rules in rules_by_term.items() if other in term))
+            for term in rules_by_term
+        }
+
+    def match(self, text: str) -> set[int]:
+        matched: set[int] = set()
+        first = self.first.search(text)
+        if first is None:
+            return matched
+        for term in set(self.pattern.findall(text, first.start())):
+            matched |= self.rules_by_term[term]
+        return matched
+
+
+class EventRouter:
+    def __init__(self, rules: list[RoutingRule]):
+        self.rules = rules
+        self.matchers = []
+        for ignore_case in (False, True):
+            rules_by_term: dict[str, set[int]] = {}
+            for index, rule in enumerate(rules):
+                if rule.ignore_case == ignore_case:
+                    for term in rule.terms:
+                        rules_by_term.setdefault(term, set()).add(index)
+            if rules_by_term:
+                self.matchers.append((TermMatcher(rules_by_term), ignore_case))
+
+    def rules_of(self, message: str) -> set[int]:
+        matched: set[int] = set()
+        for matcher, ignore_case in self.matchers:
+            matched |= matcher.match(message.lower() if ignore_case else message)
+        return matched
+
+    def route(self, log_events: list) -> tuple[dict[str, dict], list]:
+        """
+        Group the events by topic.
+
+        Returns ({topicArn: {"rules": {name: matched events}, "events": [events]}}, unmatched events).
+        An event is listed once per topic, even when several rules of the topic match it.
+        """
+        routes: dict[str, dict] = {}
+        unmatched = []
+        for event in log_events:
+            matched = self.rules_of(event["message"])
+            if not matched:
+                unmatched.append(event)
+                continue
+            topics = {}
+            for index in sorted(matched):
+                rule = self.rules[index]
+                topics.setdefault(rule.topic_arn, []).append(rule.name)
+            for topic_arn, names in topics.items():
+                route = routes.setdefault(topic_arn, {"rules": {}, "events": []})
+                for name in names:
+                    route["rules"][name] = route["rules"].get(name, 0) + 1
+                route["events"].append(event)
+        return routes, unmatched
+
+
+def load_router(rules_json: str) -> EventRouter | None:
+    """Build the router from ROUTING_RULES; None when no rule is configured."""
+    if not rules_json:
+        return None
+    rules = [
+        RoutingRule(
+            name=rule.get("name", f"rule-{index}"),
+            terms=rule["terms"],
+            topic_arn=rule["topicArn"],
+            ignore_case=rule.get("ignoreCase", False),
+        )
+        for index, rule in enumerate(json.loads(rules_json))
+    ]
+    return EventRouter(rules) if rules else None
@@ -2,10 +2,31 @@
 CloudWatch Logs subscription filter destination.
 
 Decodes the gzip+base64 CloudWatch Logs payload, builds a short summary of
-the batch, and publishes it to the SNS log-alert topic.
+the batch, and publishes it to the SNS log-alert topic. The summary lists the
+most frequent message templates of the batch (see template_miner.py).
+
+With ROUTING_RULES set, the events are routed by the terms they contain to
+the topics of a routing table instead (see event_router.py): one summary of
+the matching events is published per topic, and the events that match no
+rule go to TOPIC_ARN. The payload is decoded and scanned once whatever the
+number of rules.
+
+In event mode (ALERT_MODE=event), every log event is published as its own
+SNS message, to its routed topics or TOPIC_ARN, with PublishBatch (see
+batch_publisher.py). Messages that cannot be published are logged and
+returned in "failed"; they do not fail the invocation.
+
+In digest mode (ALERT_MODE=digest), deliveries are aggregated per time window
+in a shared DynamoDB store instead (see digest_store.py) and one digest is
+published per window: by the first invocation after the window closed, or by
+a scheduled invocation with {"flush": true} when no delivery follows.
 
 Environment variables:
-  TOPIC_ARN - ARN of the SNS topic to publish the summary to.
+  TOPIC_ARN  - ARN of the SNS topic to publish the summary to.
+  ALERT_MODE - "summary" (default, one message per delivery), "digest" or "event".
+  TEMPLATE_TOP_K - Templates listed in the summary (default 5, 0 disables mining).
+  ROUTING_RULES  - JSON routing table (default: none, everything goes to TOPIC_ARN;
+                   summary and event modes).
 """
 
 import base64
@@ -13,38 +34,214 @@ import gzip
 import json
 import logging
 import os
+import time
 
 import boto3
 
+from batch_publisher import BatchPublisher
+from digest_store import build_digest, delivery_id, get_digest_store, summarize_delivery
+from event_router import load_router
+from template_miner import TemplateMiner
+
 logger = logging.getLogger()
 
 sns = boto3.client("sns")
 
 TOPIC_ARN = os.environ["TOPIC_ARN"]
+ALERT_MODE = os.environ.get("ALERT_MODE", "summary")
+TEMPLATE_TOP_K = int(os.environ.get("TEMPLATE_TOP_K", "5"))
+# Time left for publishing when template mining stops early
+TEMPLATE_RESERVE_SECONDS = 2
+# Event mode: log messages are truncated so that the encoded JSON message fits
+# an SNS message (256 KB) with room for the subject
+EVENT_MESSAGE_MAX_BYTES = 240 * 1024
+
+digest_store = get_digest_store() if ALERT_MODE == "digest" else None
+router = load_router(os.environ.get("ROUTING_RULES", ""))
+publisher = (
+    BatchPublisher(
+        sns,
+        concurrency=int(os.environ.get("PUBLISH_CONCURRENCY", "8")),
+        max_attempts=int(os.environ.get("PUBLISH_MAX_ATTEMPTS", "3")),
+    )
+    if ALERT_MODE == "event"
+    else None
+)
+# Windows this container saw published; skips the store lookup for them
+published_windows: set[int] = set()
 
 
 def lambda_handler(event, context):
-    compressed_payload = base64.b64decode(event["awslogs"]["data"])
-    payload = json.loads(gzip.decompress(compressed_payload))
+    if ALERT_MODE == "digest":
+        return handle_digest(event, context)
 
+    payload = decode_payload(event)
     log_events = payload.get("logEvents", [])
     log_group = payload.get("logGroup")
     log_stream = payload.get("logStream")
 
     logger.info(f"Received {len(log_events)} log event(s) from {log_group}/{log_stream}")
 
+    if ALERT_MODE == "event":
+        return publish_events(log_group, log_stream, log_events)
+
+    if router is None:
+        message_id = publish_summary(TOPIC_ARN, build_summary(log_group, log_stream, log_events, context))
+        return {"published": True, "messageId": message_id}
+
+    routes, unmatched = router.route(log_events)
+    message_ids = []
+    for topic_arn, route in routes.items():
+        summary = build_summary(log_group, log_stream, route["events"], context)
+        summary["rules"] = route["rules"]
+        message_ids.append(publish_summary(topic_arn, summary))
+    if unmatched:
+        message_ids.append(publish_summary(TOPIC_ARN, build_summary(log_group, log_stream, unmatched, context)))
+    logger.info(f"Routed {len(log_events)} log event(s) in {len(message_ids)} summaries, {len(unmatched)} unmatched")
+    return {"published": bool(message_ids), "messageIds": message_ids}
+
+
+def publish_events(log_group, log_stream, log_events):
+    """Publish one message per log event to its routed topics (or TOPIC_ARN)."""
+    if router is None:
+        targets = {TOPIC_ARN: log_events}
+    else:
+        routes, unmatched = router.route(log_events)
+        targets = {topic_arn: route["events"] for topic_arn, route in routes.items()}
+        if unmatched:
+            targets.setdefault(TOPIC_ARN, []).extend(unmatched)
+
+    subject = f"CloudWatch Logs event: {log_group}"[:100]
+    messages = {
+        topic_arn: [
+            {
+                "id": event["id"],
+                "subject": subject,
+                "message": event_message(log_group, log_stream, event),
+            }
+            for event in events
+        ]
+        for topic_arn, events in targets.items()
+    }
+    result = publisher.publish(messages)
+    logger.info(
+        f"Published {result['published']} message(s) for {len(log_events)} log event(s) "
+        f"to {len(targets)} topic(s), {len(result['failed'])} failed"
+    )
+    for failure in result["failed"]:
+        logger.error(f"Could not publish log event {failure['id']} to {failure['topicArn']}: {failure['code']} {failure['message']}")
+    return {"published": result["published"], "failed": result["failed"]}
+
+
+def event_message(log_group, log_stream, event):
+    message = {
+        "logGroup": log_group,
+        "logStream": log_stream,
+        "id": event["id"],
+        "timestamp": event["timestamp"],
+        "message": event["message"],
+    }
+    body = json.dumps(message, ensure_ascii=False)
+    if len(body.encode()) <= EVENT_MESSAGE_MAX_BYTES:
+        return body
+    # JSON escaping can grow the text (quotes, backslashes, control characters),
+    # so the longest prefix whose encoded message fits is searched for
+    message["truncated"] = True
+    text = event["message"].encode()
+    low, high = 0, min(len(text), EVENT_MESSAGE_MAX_BYTES)
+    while low < high:
+        middle = (low + high + 1) // 2
+        message["message"] = text[:middle].decode(errors="ignore")
+        if len(json.dumps(message, ensure_ascii=False).encode()) <= EVENT_MESSAGE_MAX_BYTES:
+            low = middle
+        else:
+            high = middle - 1
+    message["message"] = text[:low].decode(errors="ignore")
+    return json.dumps(message, ensure_ascii=False)
+
+
+def build_summary(log_group, log_stream, log_events, context):
     summary = {
         "logGroup": log_group,
         "logStream": log_stream,
         "eventCount": len(log_events),
         "firstMessage": log_events[0]["message"] if log_events else None,
     }
+    if TEMPLATE_TOP_K > 0 and log_events:
+        summary.update(mine_templates(log_events, context))
+    return summary
+
 
+def publish_summary(topic_arn, summary):
     response = sns.publish(
-        TopicArn=TOPIC_ARN,
-        Subject=f"CloudWatch Logs alert: {log_group}",
+        TopicArn=topic_arn,
+        Subject=f"CloudWatch Logs alert: {summary['logGroup']}"[:100],
         Message=json.dumps(summary),
     )
+    logger.info(f"Published summary to {topic_arn}, MessageId={response['MessageId']}")
+    return response["MessageId"]
+
+
+def decode_payload(event):
+    compressed_payload = base64.b64decode(event["awslogs"]["data"])
+    return json.loads(gzip.decompress(compressed_payload))
+
+
+def mine_templates(log_events, context):
+    """Cluster the batch into templates, stopping early if the invocation runs out of time."""
+    deadline = None
+    if context is not None:
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - TEMPLATE_RESERVE_SECONDS
+    miner = TemplateMiner()
+    mined = miner.add_all((event["message"] for event in log_events), deadline)
+    result = {"templateCount": len(miner.clusters), "templates": miner.top(TEMPLATE_TOP_K)}
+    if miner.unclustered:
+        result["unclusteredEvents"] = miner.unclustered
+    if mined < len(log_events):
+        logger.warning(f"Template mining stopped after {mined} of {len(log_events)} log event(s)")
+        result["unminedEvents"] = len(log_events) - mined
+    return result
+
+
+def handle_digest(event, context):
+    """Store the delivery in the current window, then flush the closed windows."""
+    now = time.time()
+    result = {"stored": False, "published": []}
+    if "awslogs" in event:
+        payload = decode_payload(event)
+        log_events = payload.get("logEvents", [])
+        log_group = payload.get("logGroup")
+        log_stream = payload.get("logStream")
+        summary = summarize_delivery(log_group, log_stream, log_events)
+        window_start = digest_store.add(delivery_id(log_group, log_stream, log_events), summary, now)
+        if window_start is None:
+            logger.info(f"Skipped a repeated delivery of {len(log_events)} log event(s) from {log_group}/{log_stream}")
+        else:
+            logger.info(f"Stored {len(log_events)} log event(s) from {log_group}/{log_stream} in window {window_start}")
+            result["stored"] = True
 
-    logger.info(f"Published summary to SNS, MessageId={response['MessageId']}")
-    return {"published": True, "messageId": response["MessageId"]}
+    for window_start in digest_store.closed_windows(now):
+        if window_start in published_windows:
+            continue
+        status = digest_store.flush_status(window_start)
+        if status == "published":
+            published_windows.add(window_start)
+            continue
+        if not digest_store.claim(window_start, now):
+            continue
+        entries = digest_store.entries(window_start)
+        if entries:
+            digest = build_digest(window_start, entries)
+            response = sns.publish(
+                TopicArn=TOPIC_ARN,
+                Subject=f"CloudWatch Logs digest: {digest['eventCount']} event(s)"[:100],
+                Message=json.dumps(digest),
+            )
+            logger.info(
+                f"Published digest of window {window_start} ({len(entries)} deliveries), "
+                f"MessageId={response['MessageId']}"
+            )
+            result["published"].append(window_start)
+        digest_store.mark_published(window_start)
+        published_windows.add(window_start)
+    return result
@@ -0,0 +1,135 @@
+"""
+Single-pass log template mining for the CloudWatch Logs -> SNS handler.
+
+Groups the messages of a batch into templates, so that an alert shows what
+kinds of events occurred (with counts and one example each) instead of only
+the first message. Follows Drain (He et al., ICWS 2017):
+
+1. Tokens containing a digit (IDs, numbers, IPs, timestamps) are masked as
+   "<*>" and the message is split on whitespace.
+2. A fixed-depth tree routes the message by token count, then by first token,
+   to a leaf with a short list of clusters.
+3. The message joins the most similar cluster of the leaf (share of equal
+   tokens at least `similarity`); differing positions of the template become
+   "<*>". Otherwise it starts a new cluster.
+
+Every message is handled once, in time linear in its token count and the
+size of its leaf. Memory is bounded: at most `max_clusters` clusters and
+`max_children` first-token branches per length; messages that would need
+more are counted as unclustered. An exact-match cache of masked messages
+skips the tree for repeated messages.
+
+Environment variables (read by index.py):
+  TEMPLATE_TOP_K - Templates included in the SNS summary (default 5, 0 disables mining).
+"""
+
+import re
+import time
+
+MASK = "<*>"
+# A whole token containing a digit; the lookbehind only tries token starts
+MASK_PATTERN = re.compile(r"(?<!\S)\S*\d\S*")
+EXAMPLE_MAX_LENGTH = 256
+# Check the deadline every DEADLINE_CHECK_INTERVAL messages
+DEADLINE_CHECK_INTERVAL = 256
+
+
+class Cluster:
+    """A template with the number of messages it matched and the first of them."""
+
+    __slots__ = ("tokens", "count", "example")
+
+    def __init__(self, tokens: list[str], example: str):
+        self.tokens = tokens
+        self.count = 1
+        self.example = example[:EXAMPLE_MAX_LENGTH]
+
+    def similarity(self, tokens: list[str]) -> float:
+        return sum(1 for template, token in zip(self.tokens, tokens) if template == token) / len(tokens)
+
+    def merge(self, tokens: list[str]) -> None:
+        self.tokens = [template if template == token else MASK for template, token in zip(self.tokens, tokens)]
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+
+class TemplateMiner:
+    """Drain-style clusterer with bounded memory."""
+
+    def __init__(
+        self,
+        similarity: float = 0.5,
+        max_clusters: int = 1000,
+        max_children: int = 100,
+        max_tokens: int = 64,
+        cache_size: int = 10000,
+    ):
+        self.min_similarity = similarity
+        self.max_clusters = max_clusters
+        self.max_children = max_children
+        self.max_tokens = max_tokens
+        self.cache_size = cache_size
+        # token count -> first token -> clusters
+        self.tree: dict[int, dict[str, list[Cluster]]] = {}
+        self.clusters: list[Cluster] = []
+        self.cache: dict[str, Cluster] = {}
+        self.unclustered = 0
+
+    def add(self, message: str) -> Cluster | None:
+        """Assign a message to a cluster; None if it is counted as unclustered."""
+        masked = MASK_PATTERN.sub(MASK, message)
+        cluster = self.cache.get(masked)
+        if cluster is not None:
+            cluster.count += 1
+            return cluster
+
+        tokens = masked.split()[: self.max_tokens] or [""]
+        children = self.tree.setdefault(len(tokens), {})
+        first = tokens[0]
+        if first not in children and len(children) >= self.max_children:
+            first = MASK
+        leaf = children.setdefault(first, [])
+
+        best = None
+        best_similarity = self.min_similarity
+        for candidate in leaf:
+            candidate_similarity = candidate.similarity(tokens)
+            if candidate_similarity >= best_similarity:
+                best, best_similarity = candidate, candidate_similarity
+                if candidate_similarity == 1.0:
+                    break
+        if best is not None:
+            best.count += 1
+            if best_similarity < 1.0:
+                best.merge(tokens)
+        elif len(self.clusters) < self.max_clusters:
+            best = Cluster(tokens, message)
+            leaf.append(best)
+            self.clusters.append(best)
+        else:
+            self.unclustered += 1
+            return None
+
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[masked] = best
+        return best
+
+    def add_all(self, messages, deadline: float | None = None) -> int:
+        """
+        Add messages until the deadline (time.monotonic()) and return how many were added.
+        """
+        added = 0
+        for message in messages:
+            if deadline is not None and added % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() >= deadline:
+                break
+            self.add(message)
+            added += 1
+        return added
+
+    def top(self, k: int) -> list[dict]:
+        """Return the k most frequent templates with their count and example."""
+        clusters = sorted(self.clusters, key=lambda cluster: cluster.count, reverse=True)[:k]
+        return [{"template": cluster.template, "count": cluster.count, "example": cluster.example} for cluster in clusters]
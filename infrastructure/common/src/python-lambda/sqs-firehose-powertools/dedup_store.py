@@ -0,0 +1,171 @@
+"""
+Delivery deduplication for the SQS -> Firehose handler.
+
+SQS delivers messages at least once, so a message that was already sent to
+Firehose can come back (e.g. when its visibility timeout expired before the
+batch finished). Message IDs delivered to Firehose are remembered in a
+per-container LRU cache with a TTL and, when DEDUP_TABLE_NAME is set, in a
+DynamoDB table shared by all containers. The table uses "message_id" (string)
+as partition key and "expires_at" (epoch seconds) as its TTL attribute.
+
+Environment variables:
+  DEDUP_ENABLED      - "true" or "false" (default).
+  DEDUP_CACHE_SIZE   - Message IDs kept per container (default 10000).
+  DEDUP_TTL_SECONDS  - How long a delivered message ID is remembered (default 86400).
+  DEDUP_TABLE_NAME   - DynamoDB table of the shared store (default: no shared store).
+  DEDUP_ENDPOINT_URL - DynamoDB endpoint override, e.g. http://localhost:8000 for
+                       DynamoDB Local.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+import boto3
+
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "false").lower() == "true"
+DEDUP_CACHE_SIZE = int(os.environ.get("DEDUP_CACHE_SIZE", "10000"))
+DEDUP_TTL_SECONDS = int(os.environ.get("DEDUP_TTL_SECONDS", "86400"))
+DEDUP_TABLE_NAME = os.environ.get("DEDUP_TABLE_NAME", "")
+DEDUP_ENDPOINT_URL = os.environ.get("DEDUP_ENDPOINT_URL", "")
+
+# BatchWriteItem limit
+# https://docs.aws.amazon.com/amazondynamodb/latest/APIReference/API_BatchWriteItem.html
+DYNAMODB_MAX_BATCH_WRITE_ITEMS = 25
+DYNAMODB_MAX_UNPROCESSED_RETRIES = 3
+
+
+class LocalDedupCache:
+    """Per-container LRU cache of delivered message IDs with a TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._expires_at: OrderedDict[str, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._expires_at)
+
+    def contains(self, message_id: str) -> bool:
+        expires_at = self._expires_at.get(message_id)
+        if expires_at is None:
+            return False
+        if expires_at <= self.clock():
+            del self._expires_at[message_id]
+            return False
+        self._expires_at.move_to_end(message_id)
+        return True
+
+    def add_many(self, message_ids: Iterable[str]) -> None:
+        expires_at = self.clock() + self.ttl_seconds
+        for message_id in message_ids:
+            self._expires_at[message_id] = expires_at
+            self._expires_at.move_to_end(message_id)
+        # Evict the least recently used IDs
+        while len(self._expires_at) > self.max_entries:
+            self._expires_at.popitem(last=False)
+
+    def clear(self) -> None:
+        self._expires_at.clear()
+
+
+class DynamoDBDedupStore:
+    """Delivered message IDs shared by all containers, stored in DynamoDB."""
+
+    def __init__(self, table_name: str, ttl_seconds: int, client=None):
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.client = client or boto3.client("dynamodb")
+
+    def contains(self, message_id: str) -> bool:
+        """
+        Check whether a message ID was delivered.
+
+        Items past expires_at are ignored, since DynamoDB TTL deletes expired
+        items only eventually.
+
+        Raises:
+            ClientError: If the DynamoDB call fails
+        """
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"message_id": {"S": message_id}},
+            ProjectionExpression="expires_at",
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        return item is not None and int(item["expires_at"]["N"]) > time.time()
+
+    def add_many(self, message_ids: Iterable[str]) -> None:
+        """
+        Remember delivered message IDs with BatchWriteItem.
+
+        Raises:
+            ClientError: If the DynamoDB call fails
+            RuntimeError: If items are still unprocessed after the retries
+        """
+        expires_at = str(int(time.time()) + self.ttl_seconds)
+        requests = [
+            {"PutRequest": {"Item": {"message_id": {"S": message_id}, "expires_at": {"N": expires_at}}}}
+            for message_id in dict.fromkeys(message_ids)
+        ]
+        for start in range(0, len(requests), DYNAMODB_MAX_BATCH_WRITE_ITEMS):
+            pending = {self.table_name: requests[start : start + DYNAMODB_MAX_BATCH_WRITE_ITEMS]}
+            for attempt in range(DYNAMODB_MAX_UNPROCESSED_RETRIES + 1):
+                if attempt:
+                    time.sleep(0.05 * 2**attempt)
+                pending = self.client.batch_write_item(RequestItems=pending).get("UnprocessedItems")
+                if not pending:
+                    break
+            else:
+                raise RuntimeError(f"{len(pending[self.table_name])} dedup items were not written")
+
+
+class DedupStore:
+    """Looks up the local cache first and the shared store on a local miss."""
+
+    def __init__(self, local: LocalDedupCache, shared: DynamoDBDedupStore | None = None):
+        self.local = local
+        self.shared = shared
+
+    def is_delivered(self, message_id: str) -> bool:
+        """
+        Check whether a message was already delivered to Firehose.
+
+        Raises:
+            ClientError: If the shared store cannot be read
+        """
+        if self.local.contains(message_id):
+            return True
+        if self.shared is None or not self.shared.contains(message_id):
+            return False
+        self.local.add_many([message_id])
+        return True
+
+    def mark_delivered(self, message_ids: list[str]) -> None:
+        """
+        Remember messages delivered to Firehose.
+
+        The local cache is always updated, even if writing to the shared store fails.
+
+        Raises:
+            ClientError: If the shared store cannot be written
+        """
+        self.local.add_many(message_ids)
+        if self.shared is not None and message_ids:
+            self.shared.add_many(message_ids)
+
+
+def get_dedup_store() -> DedupStore | None:
+    """
+    Return the dedup store configured by the environment, or None if disabled.
+    """
+    if not DEDUP_ENABLED:
+        return None
+    shared = None
+    if DEDUP_TABLE_NAME:
+        client = boto3.client("dynamodb", endpoint_url=DEDUP_ENDPOINT_URL or None)
+        shared = DynamoDBDedupStore(DEDUP_TABLE_NAME, DEDUP_TTL_SECONDS, client)
+    return DedupStore(LocalDedupCache(DEDUP_CACHE_SIZE, DEDUP_TTL_SECONDS), shared)
@@ -7,12 +7,56 @@ It uses AWS Lambda Powertools for:
 - Distributed tracing (X-Ray)
 - Custom metrics (CloudWatch)
 - Batch processing with partial failure reporting (ReportBatchItemFailures)
+
+Send modes (FIREHOSE_SEND_MODE):
+- "record" (default): each record is sent with its own PutRecord call.
+- "batch": record_handler only enriches and stages records; the batch is then
+  flushed with PutRecordBatch and records whose Firehose entry failed are
+  reported in batchItemFailures.
+
+Record packing (FIREHOSE_RECORD_PACKING=true, implies "batch" send mode):
+the staged newline-delimited records are merged into Firehose records of up
+to 1,000 KiB. A failed packed record fails every message packed into it.
+
+Large batches (SQS batching window with BatchSize up to 10,000) are split into
+PutRecordBatch-sized chunks and up to FIREHOSE_MAX_CONCURRENCY (default 4)
+chunks are sent in parallel.
+
+Records that Firehose rejects with a retryable error (e.g.
+ServiceUnavailableException) are re-sent within the invocation with
+exponential backoff and full jitter, up to FIREHOSE_MAX_RETRY_ATTEMPTS.
+Retrying stops while at least FIREHOSE_RETRY_TIME_RESERVE_MS of the Lambda
+time budget is left, so partial failures are still returned cleanly.
+
+Message bodies are parsed and records serialized with the codec from
+json_codec (orjson when bundled, the standard library otherwise).
+
+Redelivered messages (ApproximateReceiveCount > 1) that were already
+delivered to Firehose are skipped and reported as successful (DEDUP_ENABLED).
+Delivered message IDs are kept by dedup_store (per-container LRU cache, plus a
+shared DynamoDB table when DEDUP_TABLE_NAME is set). They are stored as soon as
+each PutRecord call or PutRecordBatch chunk succeeds, so messages sent before
+an invocation times out or crashes are still recognized when redelivered.
+
+Dynamic partitioning: when PARTITION_KEY_PATHS is set, partition keys are
+read from the parsed message body and added to the record (see partition_keys).
+
+Tracing (X-Ray):
+- Only the libraries in TRACING_PATCH_MODULES (default "botocore") are patched.
+- TRACING_LEVEL "record" (default) adds a subsegment for every record.
+  TRACING_LEVEL "batch" traces the invocation and the Firehose flush only, plus
+  a subsegment for a TRACING_RECORD_SAMPLE_RATE fraction of the records.
 """
 
 import json
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.batch import (
@@ -23,6 +67,10 @@ from aws_lambda_powertools.utilities.batch import (
 from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+from dedup_store import get_dedup_store
+from json_codec import get_codec
+from partition_keys import PARTITION_KEY_FIELD, get_partition_key_extractor
+
 # Environment variables
 POWERTOOLS_METRICS_NAMESPACE = os.environ.get(
     "POWERTOOLS_METRICS_NAMESPACE", "sqs-firehose-namespace"
@@ -31,32 +79,155 @@ POWERTOOLS_SERVICE_NAME = os.environ.get(
     "POWERTOOLS_SERVICE_NAME", "sqs-firehose-service"
 )
 FIREHOSE_DELIVERY_STREAM_NAME = os.environ.get("FIREHOSE_DELIVERY_STREAM_NAME", "")
+FIREHOSE_RECORD_PACKING = os.environ.get("FIREHOSE_RECORD_PACKING", "false").lower() == "true"
+FIREHOSE_SEND_MODE = "batch" if FIREHOSE_RECORD_PACKING else os.environ.get("FIREHOSE_SEND_MODE", "record")
+FIREHOSE_MAX_CONCURRENCY = int(os.environ.get("FIREHOSE_MAX_CONCURRENCY", "4"))
+FIREHOSE_MAX_RETRY_ATTEMPTS = int(os.environ.get("FIREHOSE_MAX_RETRY_ATTEMPTS", "3"))
+FIREHOSE_RETRY_BASE_DELAY_MS = int(os.environ.get("FIREHOSE_RETRY_BASE_DELAY_MS", "100"))
+FIREHOSE_RETRY_MAX_DELAY_MS = int(os.environ.get("FIREHOSE_RETRY_MAX_DELAY_MS", "2000"))
+FIREHOSE_RETRY_TIME_RESERVE_MS = int(os.environ.get("FIREHOSE_RETRY_TIME_RESERVE_MS", "1000"))
+TRACING_LEVEL = os.environ.get("TRACING_LEVEL", "record")
+TRACING_RECORD_SAMPLE_RATE = float(os.environ.get("TRACING_RECORD_SAMPLE_RATE", "0"))
+TRACING_PATCH_MODULES = [
+    module.strip() for module in os.environ.get("TRACING_PATCH_MODULES", "botocore").split(",") if module.strip()
+]
+
+# PutRecordBatch limits
+# https://docs.aws.amazon.com/firehose/latest/APIReference/API_PutRecordBatch.html
+FIREHOSE_MAX_BATCH_RECORDS = 500
+FIREHOSE_MAX_BATCH_BYTES = 4 * 1024 * 1024
+FIREHOSE_MAX_RECORD_BYTES = 1000 * 1024
+
+# Error code given to the entries of a PutRecordBatch call that failed in
+# botocore (connection error, timeout) rather than with a Firehose error
+FIREHOSE_CALL_ERROR_CODE = "BotoCoreError"
+
+# Error codes worth retrying within the invocation (per-record and whole-call)
+FIREHOSE_RETRYABLE_ERROR_CODES = {
+    "ServiceUnavailableException",
+    "InternalFailure",
+    "ThrottlingException",
+    FIREHOSE_CALL_ERROR_CODE,
+}
 
 # Initialize Powertools
 logger = Logger(service=POWERTOOLS_SERVICE_NAME)
-tracer = Tracer(service=POWERTOOLS_SERVICE_NAME)
+tracer = Tracer(service=POWERTOOLS_SERVICE_NAME, patch_modules=TRACING_PATCH_MODULES)
 metrics = Metrics(
     namespace=POWERTOOLS_METRICS_NAMESPACE, service=POWERTOOLS_SERVICE_NAME
 )
 
+
+class FirehoseDeliveryError(Exception):
+    """Raised for a record whose Firehose entry failed during the batch flush."""
+
+
+class FirehoseBatchProcessor(BatchProcessor):
+    """
+    BatchProcessor that flushes staged records to Firehose in one step.
+
+    record_handler stages one (message_id, data) entry per record. Once every
+    record has been handled, the staged entries are sent with PutRecordBatch
+    and records whose entry failed are moved from the successful to the failed
+    messages, so process_partial_response reports exactly those records.
+    """
+
+    def __init__(self, event_type: EventType):
+        super().__init__(event_type=event_type)
+        self.staged_entries: list[tuple[str, bytes]] = []
+
+    def _prepare(self):
+        super()._prepare()
+        self.staged_entries.clear()
+
+    def stage(self, message_id: str, data: bytes) -> None:
+        self.staged_entries.append((message_id, data))
+
+    def process(self) -> list[tuple]:
+        results = super().process()
+        if not self.staged_entries:
+            return results
+
+        entries = [([message_id], data) for message_id, data in self.staged_entries]
+        if FIREHOSE_RECORD_PACKING:
+            entries = pack_entries(entries)
+
+        failed_ids = set(send_batch_to_firehose(entries, self.lambda_context))
+        metrics.add_metric(
+            name="MessagesProcessed",
+            unit=MetricUnit.Count,
+            value=len(self.staged_entries) - len(failed_ids),
+        )
+        if not failed_ids:
+            return results
+
+        self.success_messages = [
+            record for record in self.success_messages if record["messageId"] not in failed_ids
+        ]
+        for index, (status, _, record) in enumerate(results):
+            if status == "success" and record["messageId"] in failed_ids:
+                error = FirehoseDeliveryError(f"Firehose entry failed for message {record['messageId']}")
+                results[index] = self.failure_handler(
+                    record=SQSRecord(record), exception=(type(error), error, None)
+                )
+        return results
+
+
+# JSON codec for parsing message bodies and serializing records
+codec = get_codec()
+
+# Partition keys for Firehose dynamic partitioning (None if not configured)
+partition_key_extractor = get_partition_key_extractor()
+
+# Delivered message IDs, used to skip redelivered messages (None if disabled)
+dedup_store = get_dedup_store()
+
 # Initialize batch processor for SQS
-processor = BatchProcessor(event_type=EventType.SQS)
+if FIREHOSE_SEND_MODE == "batch":
+    processor = FirehoseBatchProcessor(event_type=EventType.SQS)
+else:
+    processor = BatchProcessor(event_type=EventType.SQS)
 
 # Initialize AWS clients
-firehose_client = boto3.client("firehose")
+# Size the connection pool so that concurrent PutRecordBatch calls do not wait for a connection
+firehose_client = boto3.client(
+    "firehose", config=Config(max_pool_connections=max(10, FIREHOSE_MAX_CONCURRENCY))
+)
 
 
-@tracer.capture_method
-def record_handler(record: SQSRecord) -> None:
+def record_handler(record: SQSRecord, lambda_context: LambdaContext | None = None) -> None:
+    """
+    Process an SQS record, in its own X-Ray subsegment if the record is traced.
+
+    Every record is traced with TRACING_LEVEL "record"; with "batch" only a
+    TRACING_RECORD_SAMPLE_RATE fraction of the records is.
+
+    Args:
+        record: SQS record from the event
+        lambda_context: Lambda context, used to bound Firehose retries
+    """
+    # A disabled tracer still builds dummy subsegments, so skip it altogether
+    if tracer.disabled or (TRACING_LEVEL != "record" and random.random() >= TRACING_RECORD_SAMPLE_RATE):
+        return handle_record(record, lambda_context)
+
+    with tracer.provider.in_subsegment("## record_handler") as subsegment:
+        subsegment.put_annotation(key="message_id", value=record.message_id)
+        return handle_record(record, lambda_context)
+
+
+def handle_record(record: SQSRecord, lambda_context: LambdaContext | None = None) -> None:
     """
     Process individual SQS record and send to Firehose.
 
     This function is called for each record in the batch.
     If an exception is raised, the record will be marked as failed
     and returned in batchItemFailures for retry.
+    In "batch" send mode the record is only staged on the processor and
+    sent when the processor flushes the batch.
 
     Args:
         record: SQS record from the event
+        lambda_context: Lambda context, used to bound Firehose retries
     """
     message_id = record.message_id
     message_body = record.body
@@ -68,9 +239,14 @@ def record_handler(record: SQSRecord) -> None:
         logger.error("FIREHOSE_DELIVERY_STREAM_NAME environment variable is not set")
         raise ValueError("FIREHOSE_DELIVERY_STREAM_NAME environment variable is not set")
 
+    # Only redelivered messages can have been delivered to Firehose already
+    if int(record.attributes.approximate_receive_count or 1) > 1 and is_already_delivered(message_id):
+        logger.info("Skipping message already delivered to Firehose", extra={"message_id": message_id})
+        return
+
     # Parse message body if it's JSON
     try:
-        payload = record.json_body
+        payload = codec.loads(message_body)
     except json.JSONDecodeError:
         # If not JSON, use raw body
         payload = {"raw_message": message_body}
@@ -86,9 +262,26 @@ def record_handler(record: SQSRecord) -> None:
         "approximate_receive_count": record.attributes.get("ApproximateReceiveCount"),
         "data": payload,
     }
+    if partition_key_extractor is not None:
+        # Extracted from the already parsed body and serialized with the record
+        partition_keys, missing = partition_key_extractor.extract(payload)
+        enriched_payload[PARTITION_KEY_FIELD] = partition_keys
+        if missing:
+            metrics.add_metric(name="PartitionKeysMissing", unit=MetricUnit.Count, value=missing)
+
+    data = serialize_payload(enriched_payload)
+    if len(data) > FIREHOSE_MAX_RECORD_BYTES:
+        raise ValueError(f"Record size {len(data)} bytes exceeds the Firehose record size limit")
+
+    if FIREHOSE_SEND_MODE == "batch":
+        processor.stage(message_id, data)
+        logger.debug("Staged message", extra={"message_id": message_id})
+        return
 
     # Send to Firehose
-    send_to_firehose(enriched_payload)
+    send_to_firehose(data, lambda_context)
+    if dedup_store is not None:
+        remember_delivered([message_id])
 
     # Record success metric
     metrics.add_metric(name="MessagesProcessed", unit=MetricUnit.Count, value=1)
@@ -99,50 +292,402 @@ def record_handler(record: SQSRecord) -> None:
     )
 
 
-@tracer.capture_method
-def send_to_firehose(payload: dict) -> dict:
+def is_already_delivered(message_id: str) -> bool:
     """
-    Send a single record to Kinesis Firehose.
+    Look up a redelivered message in the dedup store.
+
+    Store errors are logged and treated as a miss, so the message is sent again
+    rather than lost.
+
+    Args:
+        message_id: SQS message ID
+
+    Returns:
+        True if the message was already delivered to Firehose
+    """
+    if dedup_store is None:
+        return False
+    try:
+        delivered = dedup_store.is_delivered(message_id)
+    except Exception as e:
+        logger.warning("Dedup store lookup failed", extra={"message_id": message_id, "error": str(e)})
+        metrics.add_metric(name="DedupStoreErrors", unit=MetricUnit.Count, value=1)
+        return False
+    metrics.add_metric(name="DedupHits" if delivered else "DedupMisses", unit=MetricUnit.Count, value=1)
+    return delivered
+
+
+def remember_delivered(delivered_ids: list[str]) -> None:
+    """
+    Store the IDs of messages that were just delivered to Firehose.
+
+    Called right after each successful put rather than at the end of the
+    batch, so the IDs are kept even if the invocation does not finish.
+
+    Args:
+        delivered_ids: Message IDs whose Firehose record was accepted
+    """
+    if not delivered_ids:
+        return
+    try:
+        dedup_store.mark_delivered(delivered_ids)
+    except Exception as e:
+        # The records are in Firehose already; only duplicate detection is degraded
+        logger.warning("Failed to store delivered message IDs", extra={"error": str(e)})
+        metrics.add_metric(name="DedupStoreErrors", unit=MetricUnit.Count, value=1)
+
+
+def serialize_payload(payload: dict) -> bytes:
+    """
+    Serialize a payload as a newline-delimited JSON record.
 
     Args:
         payload: Dictionary to send to Firehose
 
+    Returns:
+        UTF-8 encoded JSON line
+    """
+    # Convert payload to JSON string with newline for easier processing
+    return codec.dumps_line(payload)
+
+
+def retry_delay(attempt: int, lambda_context: LambdaContext | None) -> float | None:
+    """
+    Compute the backoff delay before a Firehose retry.
+
+    Args:
+        attempt: Retry attempt number, starting at 1
+        lambda_context: Lambda context used to check the remaining time budget
+
+    Returns:
+        Delay in seconds (exponential backoff with full jitter), or None when
+        the retry attempts are exhausted or sleeping would eat into
+        FIREHOSE_RETRY_TIME_RESERVE_MS
+    """
+    if attempt > FIREHOSE_MAX_RETRY_ATTEMPTS:
+        return None
+    delay_ms = random.uniform(
+        0, min(FIREHOSE_RETRY_MAX_DELAY_MS, FIREHOSE_RETRY_BASE_DELAY_MS * 2 ** (attempt - 1))
+    )
+    if (
+        lambda_context is not None
+        and lambda_context.get_remaining_time_in_millis() - delay_ms < FIREHOSE_RETRY_TIME_RESERVE_MS
+    ):
+        return None
+    return delay_ms / 1000
+
+
+def send_to_firehose(data: bytes, lambda_context: LambdaContext | None = None) -> dict:
+    """
+    Send a single record to Kinesis Firehose.
+
+    Not wrapped in a subsegment of its own: it runs for every record and each
+    PutRecord call is already traced through the patched botocore client.
+    Retryable errors are retried with backoff while the time budget allows.
+
+    Args:
+        data: Serialized record to send to Firehose
+        lambda_context: Lambda context used to bound retries
+
     Returns:
         Firehose put_record response
 
     Raises:
-        ClientError: If Firehose API call fails
+        ClientError: If Firehose API call fails and cannot be retried
     """
-    try:
-        # Convert payload to JSON string with newline for easier processing
-        data = json.dumps(payload, ensure_ascii=False, default=str) + "\n"
+    attempt = 0
+    while True:
+        try:
+            response = firehose_client.put_record(
+                DeliveryStreamName=FIREHOSE_DELIVERY_STREAM_NAME,
+                Record={"Data": data},
+            )
+
+            logger.debug(
+                "Sent record to Firehose",
+                extra={
+                    "record_id": response.get("RecordId"),
+                    "encrypted": response.get("Encrypted", False),
+                },
+            )
+            if attempt:
+                metrics.add_metric(name="FirehoseEntriesRescued", unit=MetricUnit.Count, value=1)
+
+            return response
+
+        except ClientError as e:
+            error_code = e.response.get("Error", {}).get("Code", "Unknown")
+            attempt += 1
+            delay = retry_delay(attempt, lambda_context) if error_code in FIREHOSE_RETRYABLE_ERROR_CODES else None
+            if delay is None:
+                logger.error(
+                    "Failed to send record to Firehose",
+                    extra={
+                        "error_code": error_code,
+                        "error_message": str(e),
+                        "retries": attempt - 1,
+                    },
+                )
+                metrics.add_metric(name="FirehoseErrors", unit=MetricUnit.Count, value=1)
+                raise
+
+            metrics.add_metric(name="FirehoseRetryAttempts", unit=MetricUnit.Count, value=1)
+            time.sleep(delay)
+
+
+def pack_entries(entries: list[tuple[list[str], bytes]]) -> list[tuple[list[str], bytes]]:
+    """
+    Merge newline-delimited entries into records of up to FIREHOSE_MAX_RECORD_BYTES.
 
-        response = firehose_client.put_record(
-            DeliveryStreamName=FIREHOSE_DELIVERY_STREAM_NAME,
-            Record={"Data": data.encode("utf-8")},
-        )
+    Args:
+        entries: (message_ids, data) entries in SQS record order
 
-        logger.debug(
-            "Sent record to Firehose",
-            extra={
-                "record_id": response.get("RecordId"),
-                "encrypted": response.get("Encrypted", False),
-            },
-        )
+    Returns:
+        Packed (message_ids, data) entries; message_ids lists every message
+        whose data was packed into the record
+    """
+    packed: list[tuple[list[str], bytes]] = []
+    message_ids: list[str] = []
+    parts: list[bytes] = []
+    size = 0
+    for entry_ids, data in entries:
+        if parts and size + len(data) > FIREHOSE_MAX_RECORD_BYTES:
+            packed.append((message_ids, b"".join(parts)))
+            message_ids = []
+            parts = []
+            size = 0
+        message_ids.extend(entry_ids)
+        parts.append(data)
+        size += len(data)
+    if parts:
+        packed.append((message_ids, b"".join(parts)))
+
+    metrics.add_metric(name="FirehoseRecordsPacked", unit=MetricUnit.Count, value=len(packed))
+    logger.debug("Packed records", extra={"messages": len(entries), "records": len(packed)})
+    return packed
+
+
+def chunk_entries(entries: list[tuple[list[str], bytes]]):
+    """
+    Split (message_ids, data) entries into chunks that fit in one PutRecordBatch call.
+
+    Args:
+        entries: Entries in SQS record order
+
+    Yields:
+        Lists of entries within the PutRecordBatch record count and size limits
+    """
+    chunk: list[tuple[list[str], bytes]] = []
+    chunk_bytes = 0
+    for entry in entries:
+        size = len(entry[1])
+        if chunk and (
+            len(chunk) >= FIREHOSE_MAX_BATCH_RECORDS
+            or chunk_bytes + size > FIREHOSE_MAX_BATCH_BYTES
+        ):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(entry)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+@tracer.capture_method
+def send_batch_to_firehose(
+    entries: list[tuple[list[str], bytes]], lambda_context: LambdaContext | None = None
+) -> list[str]:
+    """
+    Send staged entries to Kinesis Firehose with PutRecordBatch.
+
+    Only the entries that failed with a retryable error are re-sent, with
+    backoff, while the retry attempts and the time budget allow. Metrics are
+    recorded here, on the calling thread.
+
+    Args:
+        entries: (message_ids, data) entries to send
+        lambda_context: Lambda context used to bound retries
+
+    Returns:
+        Message IDs whose Firehose entry could not be delivered
+    """
+    failures = dispatch_chunks(entries)
+    failed_entries: list[tuple[list[str], bytes]] = []
+    attempt = 0
+    while failures:
+        retryable = []
+        for entry, error_code in failures:
+            if error_code in FIREHOSE_RETRYABLE_ERROR_CODES:
+                retryable.append(entry)
+            else:
+                failed_entries.append(entry)
+        if not retryable:
+            break
+
+        attempt += 1
+        delay = retry_delay(attempt, lambda_context)
+        if delay is None:
+            logger.warning(
+                "Giving up on retryable Firehose records",
+                extra={"record_count": len(retryable), "retries": attempt - 1},
+            )
+            failed_entries.extend(retryable)
+            break
+
+        time.sleep(delay)
+        metrics.add_metric(name="FirehoseRetryAttempts", unit=MetricUnit.Count, value=1)
+        failures = dispatch_chunks(retryable)
+        rescued = len(retryable) - len(failures)
+        if rescued:
+            metrics.add_metric(name="FirehoseEntriesRescued", unit=MetricUnit.Count, value=rescued)
+
+    if failed_entries:
+        metrics.add_metric(name="FirehoseErrors", unit=MetricUnit.Count, value=len(failed_entries))
+    return [message_id for message_ids, _ in failed_entries for message_id in message_ids]
+
+
+def dispatch_chunks(entries: list[tuple[list[str], bytes]]) -> list[tuple[tuple[list[str], bytes], str]]:
+    """
+    Send entries as PutRecordBatch chunks on up to FIREHOSE_MAX_CONCURRENCY threads.
+
+    Args:
+        entries: (message_ids, data) entries to send
+
+    Delivered message IDs are stored in the dedup store on the calling
+    thread as each chunk completes.
 
-        return response
+    Returns:
+        (entry, error_code) for every entry whose Firehose record failed
+    """
+    chunks = list(chunk_entries(entries))
+    failures: list[tuple[tuple[list[str], bytes], str]] = []
+    if FIREHOSE_MAX_CONCURRENCY > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(FIREHOSE_MAX_CONCURRENCY, len(chunks))) as executor:
+            send_chunk = with_trace_entity(send_chunk_to_firehose)
+            futures = {executor.submit(send_chunk, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk_failures = future.result()
+                remember_chunk(futures[future], chunk_failures)
+                failures.extend(chunk_failures)
+    else:
+        for chunk in chunks:
+            chunk_failures = send_chunk_to_firehose(chunk)
+            remember_chunk(chunk, chunk_failures)
+            failures.extend(chunk_failures)
+    return failures
+
+
+def remember_chunk(
+    chunk: list[tuple[list[str], bytes]],
+    chunk_failures: list[tuple[tuple[list[str], bytes], str]],
+) -> None:
+    """
+    Store the message IDs of the entries of a chunk that Firehose accepted.
+
+    Args:
+        chunk: (message_ids, data) entries sent in one PutRecordBatch call
+        chunk_failures: (entry, error_code) for the entries that failed
+    """
+    if dedup_store is None:
+        return
+    failed = {id(entry) for entry, _ in chunk_failures}
+    remember_delivered(
+        [message_id for entry in chunk if id(entry) not in failed for message_id in entry[0]]
+    )
+
+
+def with_trace_entity(func):
+    """
+    Wrap a function so that it runs under the calling thread's X-Ray trace entity.
+
+    The X-Ray context is thread-local: without this, the PutRecordBatch calls
+    made on worker threads would not be recorded under the current trace.
+
+    Args:
+        func: Function to run on a worker thread
+
+    Returns:
+        Wrapped function, or func itself when tracing is disabled
+    """
+    if tracer.disabled:
+        return func
+    entity = tracer.provider.get_trace_entity()
+    if entity is None:
+        return func
+
+    def run(*args):
+        tracer.provider.set_trace_entity(entity)
+        try:
+            return func(*args)
+        finally:
+            tracer.provider.clear_trace_entities()
 
+    return run
+
+
+def send_chunk_to_firehose(
+    chunk: list[tuple[list[str], bytes]],
+) -> list[tuple[tuple[list[str], bytes], str]]:
+    """
+    Send one chunk of entries with a single PutRecordBatch call.
+
+    A call that fails without a Firehose response (connection error,
+    timeout) fails every entry of the chunk with FIREHOSE_CALL_ERROR_CODE,
+    which is retried like a ServiceUnavailableException.
+
+    Args:
+        chunk: (message_ids, data) entries within the PutRecordBatch limits
+
+    Returns:
+        (entry, error_code) for every entry whose Firehose record failed
+    """
+    try:
+        response = firehose_client.put_record_batch(
+            DeliveryStreamName=FIREHOSE_DELIVERY_STREAM_NAME,
+            Records=[{"Data": data} for _, data in chunk],
+        )
     except ClientError as e:
         error_code = e.response.get("Error", {}).get("Code", "Unknown")
         logger.error(
-            "Failed to send record to Firehose",
+            "Failed to send record batch to Firehose",
             extra={
                 "error_code": error_code,
                 "error_message": str(e),
+                "record_count": len(chunk),
+            },
+        )
+        return [(entry, error_code) for entry in chunk]
+    except BotoCoreError as e:
+        # Fail only this chunk: the other chunks of the batch may already be
+        # delivered and must not be redelivered by SQS
+        logger.error(
+            "Failed to send record batch to Firehose",
+            extra={
+                "error_code": FIREHOSE_CALL_ERROR_CODE,
+                "error_message": str(e),
+                "record_count": len(chunk),
             },
         )
-        metrics.add_metric(name="FirehoseErrors", unit=MetricUnit.Count, value=1)
-        raise
+        return [(entry, FIREHOSE_CALL_ERROR_CODE) for entry in chunk]
+
+    if not response.get("FailedPutCount", 0):
+        return []
+
+    # RequestResponses is in the same order as the Records of the request
+    failed_entries = []
+    for entry, result in zip(chunk, response["RequestResponses"]):
+        if "ErrorCode" in result:
+            logger.error(
+                "Firehose rejected record",
+                extra={
+                    "message_ids": entry[0],
+                    "error_code": result["ErrorCode"],
+                    "error_message": result.get("ErrorMessage"),
+                },
+            )
+            failed_entries.append((entry, result["ErrorCode"]))
+    return failed_entries
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -172,6 +717,7 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
         "Processing batch",
         extra={"batch_size": len(records)},
     )
+    tracer.put_annotation(key="batch_size", value=len(records))
 
     # Process records with partial failure support
     # Failed records will be automatically added to batchItemFailures
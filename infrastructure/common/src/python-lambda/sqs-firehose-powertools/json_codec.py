@@ -0,0 +1,135 @@
+"""
+JSON codec for the SQS -> Firehose enrichment path.
+
+Parsing the SQS message body and serializing the enriched record are the
+largest CPU costs of the handler. This module uses orjson when it is bundled
+in the deployment package and falls back to the standard library otherwise.
+
+Both codecs produce byte-identical newline-delimited output (compact
+separators, UTF-8 without ASCII escaping). orjson formats some floats
+differently from Python's repr (exponent notation such as 1e-05 / 1e+16) and
+cannot represent NaN/Infinity or integers beyond 64 bits, so records that
+contain such numbers are serialized with the standard library.
+
+Environment variables:
+  JSON_CODEC - "auto" (default: orjson if available), "orjson" or "stdlib".
+"""
+
+import json
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library is used instead
+    orjson = None
+
+JSON_CODEC = os.environ.get("JSON_CODEC", "auto")
+
+# Python's repr switches to exponent notation outside this range; orjson does not
+# switch at the same magnitudes, so such floats are left to the standard library
+_REPR_DECIMAL_MIN = 1e-4
+_REPR_DECIMAL_MAX = 1e16
+
+
+def _has_inexact_float(obj: Any) -> bool:
+    """Return True if obj contains a float that orjson would format differently from repr()."""
+    obj_type = type(obj)
+    if obj_type is float:
+        # NaN fails both comparisons and is reported as well
+        return obj != 0 and not (_REPR_DECIMAL_MIN <= abs(obj) < _REPR_DECIMAL_MAX)
+    if obj_type is dict:
+        for value in obj.values():
+            if _has_inexact_float(value):
+                return True
+    elif obj_type is list:
+        for value in obj:
+            if _has_inexact_float(value):
+                return True
+    return False
+
+
+class StdlibJsonCodec:
+    """JSON codec based on the standard library json module."""
+
+    name = "stdlib"
+
+    def loads(self, body: str) -> Any:
+        """
+        Parse a JSON document.
+
+        Raises:
+            json.JSONDecodeError: If the body is not valid JSON
+        """
+        return json.loads(body)
+
+    def dumps_line(self, obj: Any) -> bytes:
+        """
+        Serialize an object as one UTF-8 encoded JSON line.
+
+        Args:
+            obj: Object to serialize; unsupported types are converted with str()
+
+        Returns:
+            Compact JSON followed by a newline
+        """
+        return (json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+
+class OrjsonCodec(StdlibJsonCodec):
+    """JSON codec based on orjson, with the standard library as fallback."""
+
+    name = "orjson"
+
+    _OPTIONS = (
+        orjson.OPT_APPEND_NEWLINE | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if orjson is not None
+        else 0
+    )
+
+    def loads(self, body: str) -> Any:
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity and oversized integers are accepted by the standard library
+            return super().loads(body)
+
+    def dumps_line(self, obj: Any) -> bytes:
+        """
+        Serialize an object as one UTF-8 encoded JSON line.
+
+        Objects containing floats that orjson would format differently are
+        serialized with the standard library, so the output stays byte-identical.
+
+        Args:
+            obj: Object to serialize; unsupported types are converted with str()
+
+        Returns:
+            Compact JSON followed by a newline
+        """
+        if _has_inexact_float(obj):
+            return super().dumps_line(obj)
+        try:
+            return orjson.dumps(obj, default=str, option=self._OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits or non-string dict keys
+            return super().dumps_line(obj)
+
+
+def get_codec(name: str = JSON_CODEC) -> StdlibJsonCodec:
+    """
+    Return the JSON codec to use.
+
+    Args:
+        name: "auto", "orjson" or "stdlib"
+
+    Raises:
+        ImportError: If "orjson" is requested but not installed
+    """
+    if name == "stdlib":
+        return StdlibJsonCodec()
+    if orjson is None:
+        if name == "orjson":
+            raise ImportError("JSON_CODEC=orjson but orjson is not installed")
+        return StdlibJsonCodec()
+    return OrjsonCodec()
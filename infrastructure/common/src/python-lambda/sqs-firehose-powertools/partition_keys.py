@@ -0,0 +1,99 @@
+"""
+Partition keys for Firehose dynamic partitioning.
+
+PARTITION_KEY_PATHS maps partition key names to dotted paths in the JSON
+message body, e.g. "region=data.region,category=data.category". The keys are
+read from the payload the handler has already parsed and embedded in the
+record as a flat object under PARTITION_KEY_FIELD, so the Firehose metadata
+extraction query stays a plain lookup ({region: .partition_keys.region}).
+
+Missing, null or non-scalar values are replaced with PARTITION_KEY_DEFAULT, so
+the record is still delivered instead of going to the error output prefix.
+
+Environment variables:
+  PARTITION_KEY_PATHS   - "name=path,..." (default: no partition keys).
+  PARTITION_KEY_FIELD   - Record field holding the keys (default "partition_keys").
+  PARTITION_KEY_DEFAULT - Value of keys missing from the payload (default "unknown").
+"""
+
+import json
+import os
+from typing import Any
+
+PARTITION_KEY_PATHS = os.environ.get("PARTITION_KEY_PATHS", "")
+PARTITION_KEY_FIELD = os.environ.get("PARTITION_KEY_FIELD", "partition_keys")
+PARTITION_KEY_DEFAULT = os.environ.get("PARTITION_KEY_DEFAULT", "unknown")
+
+
+def parse_key_paths(spec: str) -> list[tuple[str, tuple[str, ...]]]:
+    """
+    Parse a "name=path,..." specification.
+
+    Args:
+        spec: Comma-separated key name and dotted path pairs
+
+    Returns:
+        (key name, path segments) pairs
+
+    Raises:
+        ValueError: If a pair has no name or no path
+    """
+    key_paths = []
+    for pair in spec.split(","):
+        if not pair.strip():
+            continue
+        name, _, path = pair.partition("=")
+        name, path = name.strip(), path.strip()
+        if not name or not path:
+            raise ValueError(f"Invalid partition key '{pair}', expected name=path")
+        key_paths.append((name, tuple(path.split("."))))
+    return key_paths
+
+
+class PartitionKeyExtractor:
+    """Extracts partition key values from a parsed message body."""
+
+    def __init__(self, key_paths: list[tuple[str, tuple[str, ...]]], default: str = PARTITION_KEY_DEFAULT):
+        self.key_paths = key_paths
+        self.default = default
+
+    def extract(self, payload: Any) -> tuple[dict[str, str], int]:
+        """
+        Extract the partition keys of a payload.
+
+        Args:
+            payload: Parsed message body
+
+        Returns:
+            Partition key values by name, and the number of keys that fell back
+            to the default value
+        """
+        keys = {}
+        missing = 0
+        for name, path in self.key_paths:
+            value = payload
+            for segment in path:
+                if type(value) is not dict:
+                    value = None
+                    break
+                value = value.get(segment)
+            if type(value) is str:
+                # "/" would add a level to the S3 prefix
+                value = value.replace("/", "_")
+            elif type(value) in (int, float, bool):
+                value = json.dumps(value)
+            else:
+                value = None
+            if not value:
+                value = self.default
+                missing += 1
+            keys[name] = value
+        return keys, missing
+
+
+def get_partition_key_extractor() -> PartitionKeyExtractor | None:
+    """
+    Return the extractor configured by PARTITION_KEY_PATHS, or None if unset.
+    """
+    key_paths = parse_key_paths(PARTITION_KEY_PATHS)
+    return PartitionKeyExtractor(key_paths) if key_paths else None
@@ -3,12 +3,17 @@ import os
 import boto3
 import base64
 import gzip
+import random
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
 from botocore.client import ClientError
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
 # from aws_lambda_powertools.logging.formatters.datadog import DatadogLogFormatter
-from aws_xray_sdk.core import patch_all
 
 POWERTOOLS_METRICS_NAMESPACE = os.environ.get(
     "POWERTOOLS_METRICS_NAMESPACE", "sqs-firehose-namespace"
@@ -16,21 +21,74 @@ POWERTOOLS_METRICS_NAMESPACE = os.environ.get(
 POWERTOOLS_SERVICE_NAME = os.environ.get(
     "POWERTOOLS_SERVICE_NAME", "sqs-firehose-service"
 )
+# Libraries instrumented by X-Ray (comma-separated). Only the AWS SDK is used here,
+# so patching every supported library only adds import time and subsegments.
+TRACING_PATCH_MODULES = [
+    module.strip() for module in os.environ.get("TRACING_PATCH_MODULES", "botocore").split(",") if module.strip()
+]
+
 logger = Logger(service=POWERTOOLS_SERVICE_NAME)
-tracer = Tracer(service=POWERTOOLS_SERVICE_NAME)
+tracer = Tracer(service=POWERTOOLS_SERVICE_NAME, patch_modules=TRACING_PATCH_MODULES)
 metrics = Metrics(
     namespace=POWERTOOLS_METRICS_NAMESPACE, service=POWERTOOLS_SERVICE_NAME
 )
 
-# Initialize X-Ray SDK
-patch_all()
+# PutRecordBatch limits
+# https://docs.aws.amazon.com/firehose/latest/APIReference/API_PutRecordBatch.html
+FIREHOSE_MAX_BATCH_RECORDS = 500
+FIREHOSE_MAX_BATCH_BYTES = 4 * 1024 * 1024
+FIREHOSE_MAX_RECORD_BYTES = 1000 * 1024
+
+# Pack newline-delimited messages into records of up to FIREHOSE_MAX_RECORD_BYTES
+# (Firehose bills ingestion per record in 5 KB increments)
+FIREHOSE_RECORD_PACKING = os.environ.get("FIREHOSE_RECORD_PACKING", "false").lower() == "true"
+
+# Number of PutRecordBatch calls sent in parallel for large batches
+FIREHOSE_MAX_CONCURRENCY = int(os.environ.get("FIREHOSE_MAX_CONCURRENCY", "4"))
+
+# In-invocation retry of failed Firehose entries (exponential backoff with full jitter).
+# Retrying stops early enough to leave FIREHOSE_RETRY_TIME_RESERVE_MS for returning partial failures.
+# Entries of a call that failed in botocore (connection error, timeout) get FIREHOSE_CALL_ERROR_CODE.
+FIREHOSE_CALL_ERROR_CODE = "BotoCoreError"
+FIREHOSE_RETRYABLE_ERROR_CODES = {
+    "ServiceUnavailableException",
+    "InternalFailure",
+    "ThrottlingException",
+    FIREHOSE_CALL_ERROR_CODE,
+}
+FIREHOSE_MAX_RETRY_ATTEMPTS = int(os.environ.get("FIREHOSE_MAX_RETRY_ATTEMPTS", "3"))
+FIREHOSE_RETRY_BASE_DELAY_MS = int(os.environ.get("FIREHOSE_RETRY_BASE_DELAY_MS", "100"))
+FIREHOSE_RETRY_MAX_DELAY_MS = int(os.environ.get("FIREHOSE_RETRY_MAX_DELAY_MS", "2000"))
+FIREHOSE_RETRY_TIME_RESERVE_MS = int(os.environ.get("FIREHOSE_RETRY_TIME_RESERVE_MS", "1000"))
+
+# Lean mode keeps only message IDs and counters: message bodies are not collected
+# into the response, the event is not logged, and payloads are logged sampled and truncated.
+LEAN_MODE = os.environ.get("LEAN_MODE", "false").lower() == "true"
+LOG_EVENT = os.environ.get("LOG_EVENT", "false" if LEAN_MODE else "true").lower() == "true"
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", "0.01" if LEAN_MODE else "1"))
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", "256" if LEAN_MODE else "0"))
 
-firehose_client = boto3.client("firehose")
+# Partition keys for Firehose dynamic partitioning: "name=path,..." with dotted paths in the
+# JSON message body (e.g. "region=data.region,category=data.category"). The keys are added to
+# the record as a flat object under PARTITION_KEY_FIELD for the metadata extraction query.
+PARTITION_KEY_PATHS = [
+    (name.strip(), tuple(path.strip().split(".")))
+    for name, _, path in (
+        pair.partition("=") for pair in os.environ.get("PARTITION_KEY_PATHS", "").split(",") if pair.strip()
+    )
+]
+PARTITION_KEY_FIELD = os.environ.get("PARTITION_KEY_FIELD", "partition_keys")
+PARTITION_KEY_DEFAULT = os.environ.get("PARTITION_KEY_DEFAULT", "unknown")
+
+# Size the connection pool so that concurrent calls do not wait for a connection
+firehose_client = boto3.client(
+    "firehose", config=Config(max_pool_connections=max(10, FIREHOSE_MAX_CONCURRENCY))
+)
 sqs_client = boto3.client("sqs")
 
 
 # Lambda function to process messages from SQS and send them to Firehose
-@logger.inject_lambda_context(log_event=True)
+@logger.inject_lambda_context(log_event=LOG_EVENT)
 @tracer.capture_lambda_handler
 @metrics.log_metrics
 def lambda_handler(event, context):
@@ -43,6 +101,8 @@ def lambda_handler(event, context):
         }
 
     processed_messages = []
+    processed_count = 0
+    bytes_processed = 0
     batchItemFailures = []
     sqs_batch_response = {}
     delivery_stream_name = os.environ.get("FIREHOSE_DELIVERY_STREAM_NAME", "")
@@ -52,51 +112,260 @@ def lambda_handler(event, context):
             "FIREHOSE_DELIVERY_STREAM_NAME environment variable is not set."
         )
 
+    entries = []
+    partition_keys_missing = 0
     for record in records:
         message_body = record.get("body", "")
         message_id = record.get("messageId", "unknown")
-        logger.debug(f"Processing message: {message_body}")
-        # Process the message (for demonstration, we just append it to the list)
-        process_message(message_body, message_id, delivery_stream_name, batchItemFailures)
-        processed_messages.append(message_body)
-        # delete from SQS is handled automatically by Lambda on successful execution
+        log_payload(message_id, message_body)
+        processed_count += 1
+        if not LEAN_MODE:
+            processed_messages.append(message_body)
+        if PARTITION_KEY_PATHS:
+            message_body, missing = add_partition_keys(message_id, message_body)
+            partition_keys_missing += missing
+        data = message_body.encode("utf-8")
+        bytes_processed += len(data)
+        if FIREHOSE_RECORD_PACKING and not data.endswith(b"\n"):
+            data += b"\n"
+        if len(data) > FIREHOSE_MAX_RECORD_BYTES:
+            # A single oversized record makes Firehose reject the whole PutRecordBatch call
+            logger.error(f"Message {message_id} exceeds the Firehose record size limit ({len(data)} bytes).")
+            batchItemFailures.append({"itemIdentifier": message_id})
+            continue
+        entries.append(([message_id], data))
+
+    if FIREHOSE_RECORD_PACKING:
+        entries = pack_entries(entries)
+
+    # Send the batch in as few PutRecordBatch calls as the Firehose limits allow.
+    # delete from SQS is handled automatically by Lambda on successful execution
+    failed_entries = send_with_retry(firehose_client, delivery_stream_name, entries, context)
+    del entries
+    batchItemFailures.extend(
+        {"itemIdentifier": message_id}
+        for message_ids, _ in failed_entries
+        for message_id in message_ids
+    )
+
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    metrics.add_metric(name="BytesProcessed", unit=MetricUnit.Bytes, value=bytes_processed)
+    metrics.add_metric(name="PeakRssMegabytes", unit=MetricUnit.Megabytes, value=peak_rss_mb)
+    if partition_keys_missing:
+        metrics.add_metric(name="PartitionKeysMissing", unit=MetricUnit.Count, value=partition_keys_missing)
 
     sqs_batch_response["batchItemFailures"] = batchItemFailures
     sqs_batch_response["statusCode"] = 200
-    sqs_batch_response["body"] = json.dumps(
-        {
-            "processed_messages": processed_messages,
-            "total_processed": len(processed_messages),
-        }
-    )
-    logger.debug(f"SQS Batch Response: {sqs_batch_response}")
+    body = {"total_processed": processed_count}
+    if not LEAN_MODE:
+        body["processed_messages"] = processed_messages
+    sqs_batch_response["body"] = json.dumps(body)
+    if LEAN_MODE:
+        logger.debug(
+            f"SQS Batch Response: {processed_count} processed, {len(batchItemFailures)} failed, "
+            f"{bytes_processed} bytes, peak RSS {peak_rss_mb:.1f} MB"
+        )
+    else:
+        logger.debug(f"SQS Batch Response: {sqs_batch_response}")
 
     return sqs_batch_response
 
 
-# Process individual message
-def process_message(message_body, message_id, delivery_stream_name, batchItemFailures=[]):
+# Log a message payload at debug level, sampled by LOG_PAYLOAD_SAMPLE_RATE and
+# truncated to LOG_PAYLOAD_MAX_CHARS (0 = no truncation)
+def log_payload(message_id, message_body):
+    if LOG_PAYLOAD_SAMPLE_RATE < 1 and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    if LOG_PAYLOAD_MAX_CHARS and len(message_body) > LOG_PAYLOAD_MAX_CHARS:
+        message_body = f"{message_body[:LOG_PAYLOAD_MAX_CHARS]}... ({len(message_body)} chars)"
+    logger.debug(f"Processing message {message_id}: {message_body}")
+
+
+# Add the partition keys to a JSON message body, parsing and serializing it once.
+# Missing, null or non-scalar values fall back to PARTITION_KEY_DEFAULT; bodies that are
+# not JSON objects are returned unchanged and end up under the error output prefix.
+# Returns the body and the number of missing keys.
+def add_partition_keys(message_id, message_body):
     try:
-        # send to Firehose
-        send_to_firehose_response = send_to_firehose(
-            firehose_client, delivery_stream_name, [message_body]
-        )
-        logger.debug(f"Firehose response: {send_to_firehose_response}")
-    except Exception as e:
-        logger.error(f"Error processing message: {e}")
-        batchItemFailures.append(
-            {"itemIdentifier": message_id}
-        )
+        payload = json.loads(message_body)
+    except json.JSONDecodeError:
+        payload = None
+    if not isinstance(payload, dict):
+        logger.warning(f"Message {message_id} is not a JSON object, partition keys not added.")
+        return message_body, len(PARTITION_KEY_PATHS)
+
+    keys = {}
+    missing = 0
+    for name, path in PARTITION_KEY_PATHS:
+        value = payload
+        for segment in path:
+            value = value.get(segment) if isinstance(value, dict) else None
+        if isinstance(value, str):
+            # "/" would add a level to the S3 prefix
+            value = value.replace("/", "_")
+        elif isinstance(value, (int, float, bool)):
+            value = json.dumps(value)
+        else:
+            value = None
+        if not value:
+            value = PARTITION_KEY_DEFAULT
+            missing += 1
+        keys[name] = value
+    payload[PARTITION_KEY_FIELD] = keys
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")), missing
 
 
-# Send records to Firehose
-def send_to_firehose(firehose_client, delivery_stream_name, records):
+# Merge (message_ids, data) entries into records of up to FIREHOSE_MAX_RECORD_BYTES,
+# keeping the message IDs of every message packed into each record
+def pack_entries(entries):
+    packed = []
+    message_ids = []
+    parts = []
+    size = 0
+    for entry_ids, data in entries:
+        if parts and size + len(data) > FIREHOSE_MAX_RECORD_BYTES:
+            packed.append((message_ids, b"".join(parts)))
+            message_ids = []
+            parts = []
+            size = 0
+        message_ids.extend(entry_ids)
+        parts.append(data)
+        size += len(data)
+    if parts:
+        packed.append((message_ids, b"".join(parts)))
+    logger.debug(f"Packed {len(entries)} messages into {len(packed)} Firehose records")
+    return packed
+
+
+# Split (message_ids, data) entries into chunks that fit in a single PutRecordBatch call
+def chunk_entries(entries):
+    chunk = []
+    chunk_bytes = 0
+    for entry in entries:
+        size = len(entry[1])
+        if chunk and (
+            len(chunk) >= FIREHOSE_MAX_BATCH_RECORDS
+            or chunk_bytes + size > FIREHOSE_MAX_BATCH_BYTES
+        ):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(entry)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+# Backoff delay (seconds) before the given retry attempt, or None when out of attempts
+# or when sleeping would eat into the time reserved for returning partial failures
+def retry_delay(attempt, context):
+    if attempt > FIREHOSE_MAX_RETRY_ATTEMPTS:
+        return None
+    delay_ms = random.uniform(
+        0, min(FIREHOSE_RETRY_MAX_DELAY_MS, FIREHOSE_RETRY_BASE_DELAY_MS * 2 ** (attempt - 1))
+    )
+    if context.get_remaining_time_in_millis() - delay_ms < FIREHOSE_RETRY_TIME_RESERVE_MS:
+        return None
+    return delay_ms / 1000
+
+
+# Send entries to Firehose, re-sending only the entries that failed with a retryable
+# error, and return the entries that could not be delivered
+def send_with_retry(firehose_client, delivery_stream_name, entries, context):
+    failures = send_batch_to_firehose(firehose_client, delivery_stream_name, entries)
+    failed_entries = []
+    attempt = 0
+    while failures:
+        retryable = []
+        for entry, error_code in failures:
+            if error_code in FIREHOSE_RETRYABLE_ERROR_CODES:
+                retryable.append(entry)
+            else:
+                failed_entries.append(entry)
+        if not retryable:
+            break
+
+        attempt += 1
+        delay = retry_delay(attempt, context)
+        if delay is None:
+            logger.warning(f"Giving up on {len(retryable)} Firehose record(s) after {attempt - 1} retries.")
+            failed_entries.extend(retryable)
+            break
+
+        time.sleep(delay)
+        metrics.add_metric(name="FirehoseRetryAttempts", unit=MetricUnit.Count, value=1)
+        failures = send_batch_to_firehose(firehose_client, delivery_stream_name, retryable)
+        rescued = len(retryable) - len(failures)
+        if rescued:
+            metrics.add_metric(name="FirehoseEntriesRescued", unit=MetricUnit.Count, value=rescued)
+    return failed_entries
+
+
+# Send entries to Firehose, dispatching up to FIREHOSE_MAX_CONCURRENCY chunks in parallel,
+# and return (entry, error_code) for the entries that failed
+def send_batch_to_firehose(firehose_client, delivery_stream_name, entries):
+    chunks = list(chunk_entries(entries))
+    if FIREHOSE_MAX_CONCURRENCY > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(FIREHOSE_MAX_CONCURRENCY, len(chunks))) as executor:
+            results = list(
+                executor.map(
+                    with_trace_entity(lambda chunk: send_to_firehose(firehose_client, delivery_stream_name, chunk)),
+                    chunks,
+                )
+            )
+    else:
+        results = [send_to_firehose(firehose_client, delivery_stream_name, chunk) for chunk in chunks]
+    return [entry for failed_entries in results for entry in failed_entries]
+
+
+# Wrap func so that it runs under the calling thread's X-Ray trace entity. The X-Ray
+# context is thread-local, so worker threads would otherwise not record their
+# PutRecordBatch calls under the current trace.
+def with_trace_entity(func):
+    if tracer.disabled:
+        return func
+    entity = tracer.provider.get_trace_entity()
+    if entity is None:
+        return func
+
+    def run(*args):
+        tracer.provider.set_trace_entity(entity)
+        try:
+            return func(*args)
+        finally:
+            tracer.provider.clear_trace_entities()
+
+    return run
+
+
+# Send one chunk to Firehose and return (entry, error_code) for the records that failed
+def send_to_firehose(firehose_client, delivery_stream_name, entries):
     try:
         response = firehose_client.put_record_batch(
             DeliveryStreamName=delivery_stream_name,
-            Records=[{"Data": record.encode("utf-8")} for record in records],
+            Records=[{"Data": data} for _, data in entries],
         )
-        return response
     except ClientError as e:
         logger.error(f"Failed to send records to Firehose: {e}")
-        raise
+        error_code = e.response.get("Error", {}).get("Code", "Unknown")
+        return [(entry, error_code) for entry in entries]
+    except BotoCoreError as e:
+        # Only this chunk fails: the other chunks of the batch may already be delivered
+        logger.error(f"Failed to send records to Firehose: {e}")
+        return [(entry, FIREHOSE_CALL_ERROR_CODE) for entry in entries]
+
+    logger.debug(f"Firehose FailedPutCount: {response.get('FailedPutCount', 0)}")
+    if not response.get("FailedPutCount", 0):
+        return []
+
+    # RequestResponses is in the same order as the Records of the request
+    failed_entries = []
+    for entry, result in zip(entries, response["RequestResponses"]):
+        if "ErrorCode" in result:
+            logger.error(
+                f"Firehose rejected the record for message(s) {entry[0]}: "
+                f"{result['ErrorCode']} {result.get('ErrorMessage', '')}"
+            )
+            failed_entries.append((entry, result["ErrorCode"]))
+    return failed_entries
@@ -4,6 +4,7 @@ import { Construct } from 'constructs';
 import { Environment } from '@common/parameters/environments';
 import {
     ExportTaskParams,
+    defaultExportIndexerConfig,
     defaultExportTaskConfig,
 } from 'lib/types';
 import { EnvParams } from 'parameters/environments';
@@ -27,8 +28,9 @@ export interface CloudwatchLogsS3ArchiveExportStackProps extends cdk.StackProps
  * Stack 4 – Pattern B: Scheduled Export Task (CloudWatch Logs → S3)
  *
  * Uses the CloudWatch Logs `CreateExportTask` API to batch-export logs to S3
- * on a configurable schedule (default: daily).  An EventBridge rule triggers
- * a Lambda function that calls `CreateExportTask` for the previous day's logs.
+ * on a configurable schedule (default: every 5 minutes).  An EventBridge schedule triggers
+ * a Lambda function that drives `CreateExportTask` window by window from a
+ * work queue persisted in the archive bucket (resumable backfill, retries).
  *
  * Architecture:
  *   EventBridge Rule (schedule)
@@ -47,6 +49,7 @@ export class CloudwatchLogsS3ArchiveExportStack extends cdk.Stack {
     public readonly logGroup: logs.LogGroup;
     public readonly archiveBucket: s3.Bucket;
     public readonly exportFunction: lambda.Function;
+    public readonly indexerFunction?: lambda.Function;
 
     constructor(scope: Construct, id: string, props: CloudwatchLogsS3ArchiveExportStackProps) {
         super(scope, id, props);
@@ -137,7 +140,46 @@ export class CloudwatchLogsS3ArchiveExportStack extends cdk.Stack {
         );
 
         // -----------------------------------------------------------------------
-        // Lambda – calls CreateExportTask for the previous day
+        // Lambda – export indexer (optional), invoked by the driver for every
+        // completed task; writes a time-range index of its objects under _index/
+        // -----------------------------------------------------------------------
+        const indexerParams = exportParams.indexer;
+        if (indexerParams) {
+            this.indexerFunction = new lambda.Function(this, 'ExportIndexerFunction', {
+                functionName: `${props.project}-${props.environment}-cwl-export-indexer`,
+                description: 'Indexes the objects of completed CloudWatch Logs export tasks by time range',
+                runtime: lambda.Runtime.PYTHON_3_14,
+                handler: 'index.lambda_handler',
+                code: lambda.Code.fromAsset(
+                    path.join(__dirname, '../../src/lambda/export-indexer'),
+                ),
+                memorySize: indexerParams.memorySize ?? defaultExportIndexerConfig.memorySize,
+                timeout: indexerParams.timeout ?? defaultExportIndexerConfig.timeout,
+                environment: {
+                    S3_BUCKET_NAME: this.archiveBucket.bucketName,
+                    S3_PREFIX: s3Prefix,
+                    MAX_WORKERS: String(indexerParams.maxWorkers ?? defaultExportIndexerConfig.maxWorkers),
+                },
+                logGroup: new logs.LogGroup(this, 'ExportIndexerFunctionLogGroup', {
+                    retention: logs.RetentionDays.ONE_WEEK,
+                    removalPolicy: cdk.RemovalPolicy.DESTROY,
+                }),
+                logFormat: lambda.LogFormat.JSON,
+                applicationLogLevelV2: lambda.ApplicationLogLevel.INFO,
+            });
+
+            // Read the exported objects, write the indexes
+            this.archiveBucket.grantRead(this.indexerFunction, `${s3Prefix}/*`);
+            this.archiveBucket.grantPut(this.indexerFunction, `${s3Prefix}/_index/*`);
+
+            new cdk.CfnOutput(this, 'ExportIndexerFunctionName', {
+                value: this.indexerFunction.functionName,
+                description: 'Name of the export indexer Lambda function',
+            });
+        }
+
+        // -----------------------------------------------------------------------
+        // Lambda – export driver, calls CreateExportTask window by window
         // -----------------------------------------------------------------------
         this.exportFunction = new lambda.Function(this, 'ExportTaskFunction', {
             functionName: `${props.project}-${props.environment}-cwl-export-task`,
@@ -153,6 +195,27 @@ export class CloudwatchLogsS3ArchiveExportStack extends cdk.Stack {
                 LOG_GROUP_NAME: this.logGroup.logGroupName,
                 S3_BUCKET_NAME: this.archiveBucket.bucketName,
                 S3_PREFIX: s3Prefix,
+                ...(exportParams.logGroupNames
+                    ? {
+                        LOG_GROUP_NAMES: [
+                            this.logGroup.logGroupName,
+                            ...exportParams.logGroupNames,
+                        ].join(','),
+                    }
+                    : {}),
+                ...(exportParams.backfillStart ? { BACKFILL_START: exportParams.backfillStart } : {}),
+                ...(exportParams.targetTaskMinutes
+                    ? { TARGET_TASK_MINUTES: String(exportParams.targetTaskMinutes) }
+                    : {}),
+                ...(exportParams.minWindowHours
+                    ? { MIN_WINDOW_HOURS: String(exportParams.minWindowHours) }
+                    : {}),
+                ...(exportParams.maxWindowHours
+                    ? { MAX_WINDOW_HOURS: String(exportParams.maxWindowHours) }
+                    : {}),
+                ...(this.indexerFunction
+                    ? { INDEXER_FUNCTION_NAME: this.indexerFunction.functionName }
+                    : {}),
             },
             logGroup: new logs.LogGroup(this, 'ExportTaskFunctionLogGroup', {
                 retention: logs.RetentionDays.ONE_WEEK,
@@ -173,6 +236,12 @@ export class CloudwatchLogsS3ArchiveExportStack extends cdk.Stack {
             }),
         );
 
+        // Grant Lambda access to the driver state (cursors, task in flight, retry queue).
+        // The bucket-level s3:List* of this grant also lets it sum the bytes of each export.
+        this.archiveBucket.grantReadWrite(this.exportFunction, `${s3Prefix}/_state/*`);
+
+        this.indexerFunction?.grantInvoke(this.exportFunction);
+
         // -----------------------------------------------------------------------
         // EventBridge Rule – triggers Lambda on the configured schedule
         // -----------------------------------------------------------------------
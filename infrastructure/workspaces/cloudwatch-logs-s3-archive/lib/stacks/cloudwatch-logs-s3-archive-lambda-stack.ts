@@ -4,6 +4,7 @@ import { Construct } from 'constructs';
 import { Environment } from '@common/parameters/environments';
 import {
     LambdaArchiveParams,
+    defaultCompactionConfig,
     defaultLambdaArchiveConfig,
 } from 'lib/types';
 import { EnvParams } from 'parameters/environments';
@@ -11,6 +12,8 @@ import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as logs from 'aws-cdk-lib/aws-logs';
 import * as logDestinations from 'aws-cdk-lib/aws-logs-destinations';
 import * as s3 from 'aws-cdk-lib/aws-s3';
+import * as scheduler from 'aws-cdk-lib/aws-scheduler';
+import * as scheduler_targets from 'aws-cdk-lib/aws-scheduler-targets';
 
 export interface CloudwatchLogsS3ArchiveLambdaStackProps extends cdk.StackProps {
     readonly project: string;
@@ -43,6 +46,7 @@ export class CloudwatchLogsS3ArchiveLambdaStack extends cdk.Stack {
     public readonly logGroup: logs.LogGroup;
     public readonly archiveBucket: s3.Bucket;
     public readonly archiveFunction: lambda.Function;
+    public readonly compactorFunction?: lambda.Function;
 
     constructor(scope: Construct, id: string, props: CloudwatchLogsS3ArchiveLambdaStackProps) {
         super(scope, id, props);
@@ -110,7 +114,32 @@ export class CloudwatchLogsS3ArchiveLambdaStack extends cdk.Stack {
             environment: {
                 S3_BUCKET_NAME: this.archiveBucket.bucketName,
                 S3_PREFIX: s3Prefix,
+                ...(lambdaParams.outputFormat ? { OUTPUT_FORMAT: lambdaParams.outputFormat } : {}),
+                ...(lambdaParams.keyLayout ? { KEY_LAYOUT: lambdaParams.keyLayout } : {}),
+                ...(lambdaParams.manifestEnabled ? { MANIFEST_ENABLED: 'true' } : {}),
+                ...(lambdaParams.compaction
+                    ? {
+                        COMPACTION_ENABLED: 'true',
+                        COMPACTION_LOOKBACK_HOURS: String(
+                            lambdaParams.compaction.lookbackHours ?? defaultCompactionConfig.lookbackHours,
+                        ),
+                    }
+                    : {}),
+                ...(lambdaParams.parquetJsonFields
+                    ? { PARQUET_JSON_FIELDS: lambdaParams.parquetJsonFields.join(',') }
+                    : {}),
             },
+            ...(lambdaParams.parquetLayerArn
+                ? {
+                    layers: [
+                        lambda.LayerVersion.fromLayerVersionArn(
+                            this,
+                            'ParquetLayer',
+                            lambdaParams.parquetLayerArn,
+                        ),
+                    ],
+                }
+                : {}),
             logGroup: new logs.LogGroup(this, 'ArchiveFunctionLogGroup', {
                 retention: logs.RetentionDays.ONE_WEEK,
                 removalPolicy: cdk.RemovalPolicy.DESTROY,
@@ -121,6 +150,12 @@ export class CloudwatchLogsS3ArchiveLambdaStack extends cdk.Stack {
 
         // Grant Lambda write access to the archive bucket
         this.archiveBucket.grantWrite(this.archiveFunction);
+        if (lambdaParams.compaction) {
+            // Retries of deliveries to closed hours are looked up in the compaction manifests
+            this.archiveBucket.grantRead(this.archiveFunction, `${s3Prefix}/*_compaction-*.json`);
+            // A retry written while its hour was being compacted is removed again
+            this.archiveBucket.grantDelete(this.archiveFunction, `${s3Prefix}/*`);
+        }
 
         // -----------------------------------------------------------------------
         // Subscription Filter – CloudWatch Logs → Lambda
@@ -137,6 +172,65 @@ export class CloudwatchLogsS3ArchiveLambdaStack extends cdk.Stack {
             filterPattern: cwlFilterPattern,
         });
 
+        // -----------------------------------------------------------------------
+        // Compactor (optional) – merges the small per-delivery objects of each
+        // closed hour into gzip NDJSON objects of up to targetObjectSizeMb
+        // -----------------------------------------------------------------------
+        const compactionParams = lambdaParams.compaction;
+        if (compactionParams) {
+            const compactorFunction = new lambda.Function(this, 'CompactorFunction', {
+                functionName: `${props.project}-${props.environment}-cwl-s3-compactor`,
+                description: 'Compacts small cwl-to-s3 objects into larger gzip NDJSON objects',
+                runtime: lambda.Runtime.PYTHON_3_14,
+                handler: 'index.lambda_handler',
+                code: lambda.Code.fromAsset(
+                    path.join(__dirname, '../../src/lambda/compactor'),
+                ),
+                memorySize: compactionParams.memorySize ?? defaultCompactionConfig.memorySize,
+                timeout: compactionParams.timeout ?? defaultCompactionConfig.timeout,
+                // Runs must not overlap: the manifest protocol assumes a single writer per hour
+                reservedConcurrentExecutions: 1,
+                environment: {
+                    S3_BUCKET_NAME: this.archiveBucket.bucketName,
+                    S3_PREFIX: s3Prefix,
+                    TARGET_OBJECT_SIZE_MB: String(
+                        compactionParams.targetObjectSizeMb ?? defaultCompactionConfig.targetObjectSizeMb,
+                    ),
+                    GRACE_MINUTES: String(compactionParams.graceMinutes ?? defaultCompactionConfig.graceMinutes),
+                    LOOKBACK_HOURS: String(compactionParams.lookbackHours ?? defaultCompactionConfig.lookbackHours),
+                    ...(lambdaParams.keyLayout ? { KEY_LAYOUT: lambdaParams.keyLayout } : {}),
+                },
+                logGroup: new logs.LogGroup(this, 'CompactorFunctionLogGroup', {
+                    retention: logs.RetentionDays.ONE_WEEK,
+                    removalPolicy: cdk.RemovalPolicy.DESTROY,
+                }),
+                logFormat: lambda.LogFormat.JSON,
+                applicationLogLevelV2: lambda.ApplicationLogLevel.INFO,
+            });
+
+            // Read inputs, write outputs and manifests, delete compacted inputs
+            this.archiveBucket.grantReadWrite(compactorFunction);
+            this.archiveBucket.grantDelete(compactorFunction);
+
+            const compactionScheduleExpression =
+                compactionParams.scheduleExpression ?? defaultCompactionConfig.scheduleExpression;
+            new scheduler.Schedule(this, 'CompactionSchedule', {
+                scheduleName: `${props.project}-${props.environment}-cwl-s3-compaction-schedule`,
+                schedule: scheduler.ScheduleExpression.expression(compactionScheduleExpression),
+                description: 'Triggers compaction of the cwl-to-s3 archive objects',
+                target: new scheduler_targets.LambdaInvoke(compactorFunction, {
+                    // A failed run is retried by the next scheduled run
+                    retryAttempts: 0,
+                }),
+            });
+
+            new cdk.CfnOutput(this, 'CompactorFunctionName', {
+                value: compactorFunction.functionName,
+                description: 'Name of the compactor Lambda function',
+            });
+            this.compactorFunction = compactorFunction;
+        }
+
         // -----------------------------------------------------------------------
         // Stack Outputs
         // -----------------------------------------------------------------------
@@ -2,7 +2,7 @@ import * as cdk from 'aws-cdk-lib';
 import * as logs from 'aws-cdk-lib/aws-logs';
 
 export const defaultExportTaskConfig = {
-    scheduleExpression: 'rate(1 day)',
+    scheduleExpression: 'rate(5 minutes)',
     s3Prefix: 'exports',
     retention: logs.RetentionDays.ONE_MONTH,
     memorySize: 256,
@@ -10,15 +10,45 @@ export const defaultExportTaskConfig = {
     logGroupNameSuffix: 'app-export',
 };
 
+export const defaultExportIndexerConfig = {
+    memorySize: 1024,
+    timeout: cdk.Duration.minutes(15),
+    maxWorkers: 8,
+};
+
+/**
+ * Parameters for the time-range index of exported objects (export-indexer)
+ */
+export interface ExportIndexerParams {
+    /**
+     * Objects of a task indexed in parallel
+     * @default 8
+     */
+    readonly maxWorkers?: number;
+    /**
+     * Lambda function memory size (MB)
+     * @default 1024
+     */
+    readonly memorySize?: number;
+    /**
+     * Lambda function timeout
+     * @default Duration.minutes(15)
+     */
+    readonly timeout?: cdk.Duration;
+}
+
 /**
  * Parameters for Pattern B – Scheduled export task (CloudWatch Logs → S3 via CreateExportTask)
  */
 export interface ExportTaskParams {
     /**
      * EventBridge schedule expression (rate or cron)
-     * @example "rate(1 day)"
-     * @example "cron(0 1 * * ? *)"  (daily at 01:00 UTC)
-     * @default "rate(1 day)"
+     * Each invocation makes progress until its timeout only, and hot log groups
+     * are exported in windows down to one hour, so the schedule should be about
+     * as frequent as the timeout: a daily schedule exports at most one window
+     * per day and falls behind
+     * @example "rate(5 minutes)"
+     * @default "rate(5 minutes)"
      */
     readonly scheduleExpression?: string;
     /**
@@ -40,6 +70,43 @@ export interface ExportTaskParams {
      * @default RetentionDays.ONE_MONTH
      */
     readonly retention?: logs.RetentionDays;
+    /**
+     * Additional existing log groups exported by the driver (LOG_GROUP_NAMES),
+     * besides the log group created by the stack
+     * @default undefined (only the stack's log group)
+     */
+    readonly logGroupNames?: string[];
+    /**
+     * Start of the backfill as an ISO date or time in UTC (BACKFILL_START).
+     * Windows from this point up to the last complete window are exported.
+     * @example "2025-01-01"
+     * @default undefined (the previous day)
+     */
+    readonly backfillStart?: string;
+    /**
+     * Target duration of one export task (TARGET_TASK_MINUTES). The window of
+     * each log group is sized from the durations of its completed tasks so
+     * that a task takes about this long.
+     * @default 30
+     */
+    readonly targetTaskMinutes?: number;
+    /**
+     * Smallest window size in hours (MIN_WINDOW_HOURS): 1, 2, 3, 4, 6, 8, 12 or a multiple of 24 up to 168
+     * @default 1
+     */
+    readonly minWindowHours?: number;
+    /**
+     * Largest window size in hours (MAX_WINDOW_HOURS). Windows are exported only
+     * once complete, so this is also the longest export delay of a quiet log group.
+     * @default 72
+     */
+    readonly maxWindowHours?: number;
+    /**
+     * Index every completed export task by time range, for
+     * test-scripts/search-exports.py
+     * @default undefined (no index)
+     */
+    readonly indexer?: ExportIndexerParams;
     /**
      * Lambda function memory size (MB)
      * @default 256
@@ -10,6 +10,54 @@ export const defaultLambdaArchiveConfig = {
     logGroupNameSuffix: 'app-lambda',
 };
 
+export const defaultCompactionConfig = {
+    scheduleExpression: 'cron(20 * * * ? *)',
+    targetObjectSizeMb: 128,
+    graceMinutes: 15,
+    lookbackHours: 48,
+    memorySize: 512,
+    timeout: cdk.Duration.minutes(15),
+};
+
+/**
+ * Parameters for the scheduled compaction of small cwl-to-s3 objects
+ */
+export interface CompactionParams {
+    /**
+     * EventBridge schedule expression (rate or cron)
+     * @default "cron(20 * * * ? *)" (hourly at minute 20)
+     */
+    readonly scheduleExpression?: string;
+    /**
+     * Maximum size of a compacted object (MB)
+     * @default 128
+     */
+    readonly targetObjectSizeMb?: number;
+    /**
+     * Minutes after the end of an hour before it is compacted
+     * (must cover the CloudWatch Logs delivery delay)
+     * @default 15
+     */
+    readonly graceMinutes?: number;
+    /**
+     * Closed hours checked on every run. Older hours are compacted when
+     * cwl-to-s3 marks them with a delivery of backdated events (under
+     * `{s3Prefix}/_late/`, for hours older than half of this window)
+     * @default 48
+     */
+    readonly lookbackHours?: number;
+    /**
+     * Lambda function memory size (MB)
+     * @default 512
+     */
+    readonly memorySize?: number;
+    /**
+     * Lambda function timeout
+     * @default Duration.minutes(15)
+     */
+    readonly timeout?: cdk.Duration;
+}
+
 /**
  * Parameters for Pattern C – Direct write (CloudWatch Logs → Lambda → S3)
  */
@@ -44,4 +92,47 @@ export interface LambdaArchiveParams {
      * @default Duration.minutes(1)
      */
     readonly timeout?: cdk.Duration;
+    /**
+     * Output format of the archived objects (OUTPUT_FORMAT)
+     * - "json": one JSON document per delivery wrapping the events array
+     * - "ndjson-gz": gzip-compressed NDJSON, one event per line with logGroup/logStream
+     * - "raw": the CloudWatch Logs gzip payload as delivered, without decompressing it
+     * - "parquet": one row per event in columns (requires parquetLayerArn; use memorySize >= 512)
+     * @default undefined (the function default, "json")
+     */
+    readonly outputFormat?: 'json' | 'ndjson-gz' | 'raw' | 'parquet';
+    /**
+     * ARN of a Lambda layer providing pyarrow for the "parquet" output format
+     * (e.g. the AWS SDK for pandas layer of the function's Python version)
+     * @default undefined (no layer)
+     */
+    readonly parquetLayerArn?: string;
+    /**
+     * Top-level fields of JSON log messages stored as their own Parquet
+     * columns (PARQUET_JSON_FIELDS)
+     * @example ['level', 'requestId']
+     * @default undefined (no extra columns)
+     */
+    readonly parquetJsonFields?: string[];
+    /**
+     * S3 key layout of the archived objects (KEY_LAYOUT)
+     * - "date": {s3Prefix}/YYYY/MM/DD/HH/...
+     * - "hive": {s3Prefix}/log_group={group}/year=YYYY/month=MM/day=DD/hour=HH/...
+     *   for partition pruning and partition projection by log group and time
+     * @default undefined (the function default, "date")
+     */
+    readonly keyLayout?: 'date' | 'hive';
+    /**
+     * Maintain a per-hour manifest listing each object with its event count and
+     * min/max event timestamp (MANIFEST_ENABLED): one "_manifest/<hash>.json"
+     * entry per delivery, merged into "_manifest.json" by the compactor
+     * @default false
+     */
+    readonly manifestEnabled?: boolean;
+    /**
+     * Scheduled compaction of the archived objects into gzip NDJSON objects
+     * of up to targetObjectSizeMb per hour prefix
+     * @default undefined (no compaction)
+     */
+    readonly compaction?: CompactionParams;
 }
@@ -48,8 +48,8 @@ const devParams: EnvParams = {
 
     // Pattern B – Scheduled export task (Stack 4)
     exportTask: {
-        //scheduleExpression: 'rate(1 day)',
-        scheduleExpression: 'cron(0 0 * * ? *)', // daily at 00:00
+        // As frequent as the timeout, so that windows are exported back to back
+        scheduleExpression: 'rate(5 minutes)',
         timeZone: cdk.TimeZone.ASIA_TOKYO,
         s3Prefix: 'exports',
         logGroupNameSuffix: 'app-export',
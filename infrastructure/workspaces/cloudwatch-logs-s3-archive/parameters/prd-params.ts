@@ -46,9 +46,9 @@ const prdParams: EnvParams = {
         filterPattern: '',
     },
 
-    // Pattern B – Scheduled export task (Stack 4): runs daily at 01:00 UTC
+    // Pattern B – Scheduled export task (Stack 4): runs every 5 minutes (the timeout)
     exportTask: {
-        scheduleExpression: 'cron(0 1 * * ? *)',
+        scheduleExpression: 'rate(5 minutes)',
         s3Prefix: 'exports',
         logGroupNameSuffix: 'app-export',
         retention: logs.RetentionDays.THREE_MONTHS,
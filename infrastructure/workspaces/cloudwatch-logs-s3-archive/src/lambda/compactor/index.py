@@ -0,0 +1,467 @@
+"""
+Pattern C – Small-object compaction for the cwl-to-s3 archive
+
+Triggered by EventBridge Scheduler (default: hourly). cwl-to-s3 writes one
+object per subscription delivery under an hour prefix, S3_PREFIX/YYYY/MM/DD/HH/
+or, with KEY_LAYOUT=hive, S3_PREFIX/log_group=*/year=YYYY/month=MM/day=DD/hour=HH/
+(one prefix per log group). For every hour prefix of the closed hours in the
+lookback window, this function merges those objects into
+a few gzip-compressed NDJSON objects of up to TARGET_OBJECT_SIZE_MB, one
+event per line (the cwl-to-s3 "ndjson-gz" line format). Objects in any of
+the cwl-to-s3 output formats (json, ndjson-gz, raw) can be merged.
+
+Safety:
+- Inputs are streamed and outputs are written with multipart uploads, so
+  memory use is bounded by the part size and an output only becomes visible
+  once it is complete.
+- Every output is verified (size and multipart ETag) before a manifest
+  "_compaction-<run>.json" listing the inputs and outputs is written to the
+  hour prefix. The manifest is the commit point; inputs are deleted after it.
+  Athena ignores keys starting with "_", so manifests are not queried.
+- Re-running is safe: inputs listed in a manifest are only deleted, and
+  compacted outputs without a manifest (left by an interrupted run) are
+  removed before the hour is compacted again.
+- Manifests are kept: with COMPACTION_ENABLED, cwl-to-s3 looks up the inputs
+  they list, so a CloudWatch Logs retry of a compacted delivery is not
+  written again. Late deliveries to an hour that was already compacted are
+  merged by the next run (within LOOKBACK_HOURS), whatever their number. The function must not run
+  concurrently (the stack sets reserved concurrency to 1).
+- Hours outside the lookback window are swept when they receive a delivery:
+  cwl-to-s3 marks deliveries to hours older than half the window with an
+  empty object "S3_PREFIX/_late/<object key below S3_PREFIX>". Every run
+  (without "hour" in the event) also compacts the marked hours and deletes
+  the markers it listed, once their hour is compacted. Markers are listed
+  before the hours, and cwl-to-s3 writes them after the objects, so a
+  deleted marker never hides an object this run did not see.
+- If the hour prefix has a cwl-to-s3 manifest (per-delivery entries under
+  "_manifest/"), the outputs (with their event count and min/max timestamp)
+  are merged into "_manifest.json" together with the committed inputs as
+  "replacedKeys", before the entries and the inputs are deleted, so the
+  manifest never lists a deleted object. Only the compactor writes
+  "_manifest.json", so a plain write is enough.
+
+Event (optional):
+    {"hour": "YYYY/MM/DD/HH"}  compacts that hour only
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+import uuid
+
+import boto3
+from botocore.exceptions import ClientError
+
+S3_BUCKET_NAME = os.environ["S3_BUCKET_NAME"]
+S3_PREFIX = os.environ.get("S3_PREFIX", "subscriptions")
+KEY_LAYOUT = os.environ.get("KEY_LAYOUT", "date")
+TARGET_OBJECT_SIZE_MB = int(os.environ.get("TARGET_OBJECT_SIZE_MB", "128"))
+# An hour is compacted once it ended at least GRACE_MINUTES ago
+GRACE_MINUTES = int(os.environ.get("GRACE_MINUTES", "15"))
+LOOKBACK_HOURS = int(os.environ.get("LOOKBACK_HOURS", "48"))
+MIN_INPUT_OBJECTS = int(os.environ.get("MIN_INPUT_OBJECTS", "2"))
+GZIP_COMPRESS_LEVEL = int(os.environ.get("GZIP_COMPRESS_LEVEL", "6"))
+# Stop starting new hours when less than this is left of the Lambda timeout
+TIME_RESERVE_MS = int(os.environ.get("TIME_RESERVE_MS", "60000"))
+# Endpoint override for a local S3 stand-in (e.g. MinIO)
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", "")
+
+# S3 multipart parts must be at least 5 MiB, except the last one
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+# DeleteObjects limit
+DELETE_BATCH_SIZE = 1000
+
+OUTPUT_NAME_PREFIX = "compacted-"
+MANIFEST_NAME_PREFIX = "_compaction-"
+# Per-hour object manifest of cwl-to-s3 (MANIFEST_ENABLED): one entry per
+# delivery, merged here into HOUR_MANIFEST_NAME
+HOUR_MANIFEST_NAME = "_manifest.json"
+HOUR_MANIFEST_ENTRY_PREFIX = "_manifest/"
+# Markers of cwl-to-s3 deliveries to hours about to leave the lookback window
+LATE_MARKER_PREFIX = "_late/"
+
+TIMESTAMP_PATTERN = re.compile(rb'"timestamp":(-?\d+)')
+
+s3_client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL or None)
+
+
+def lambda_handler(event, context):
+    if event.get("hour"):
+        hours = [datetime.datetime.strptime(event["hour"], "%Y/%m/%d/%H")]
+        late_markers = {}
+    else:
+        hours = closed_hours(datetime.datetime.utcnow())
+        late_markers = list_late_markers()
+
+    group_prefixes = list_log_group_prefixes() if KEY_LAYOUT == "hive" else []
+    prefixes = [prefix for hour in hours for prefix in hour_prefixes(hour, group_prefixes)]
+    prefixes = sorted(set(late_markers) - set(prefixes)) + prefixes
+
+    results = []
+    failed = []
+    for prefix in prefixes:
+        if context is not None and context.get_remaining_time_in_millis() < TIME_RESERVE_MS:
+            print("Time budget exhausted, remaining hours are left for the next run.")
+            break
+        try:
+            result = compact_hour(prefix)
+        except Exception as e:
+            print(f"Compaction of {prefix} failed: {e}")
+            failed.append(prefix)
+            continue
+        delete_keys(late_markers.get(prefix, []))
+        if result["inputs"] or result["cleanedUp"]:
+            results.append(result)
+
+    summary = {
+        "status": "failed" if failed else "ok",
+        "hours": results,
+        "failedHours": failed,
+    }
+    print(json.dumps(summary))
+    if failed:
+        raise RuntimeError(f"Compaction failed for {len(failed)} hour(s): {', '.join(failed)}")
+    return summary
+
+
+def closed_hours(now):
+    """Return the hours of the lookback window that ended at least GRACE_MINUTES ago."""
+    current = now.replace(minute=0, second=0, microsecond=0)
+    hours = []
+    for offset in range(LOOKBACK_HOURS, 0, -1):
+        hour = current - datetime.timedelta(hours=offset)
+        if hour + datetime.timedelta(hours=1, minutes=GRACE_MINUTES) <= now:
+            hours.append(hour)
+    return hours
+
+
+def hour_prefixes(hour, group_prefixes):
+    """Return the prefixes (ending in "/") of the objects of an hour in KEY_LAYOUT."""
+    if KEY_LAYOUT == "hive":
+        return [f"{group_prefix}{hour:year=%Y/month=%m/day=%d/hour=%H}/" for group_prefix in group_prefixes]
+    return [f"{S3_PREFIX}/{hour:%Y/%m/%d/%H}/"]
+
+
+def list_late_markers():
+    """Return {hour prefix: marker keys} of the late-delivery markers written by cwl-to-s3."""
+    marker_prefix = f"{S3_PREFIX}/{LATE_MARKER_PREFIX}"
+    markers = {}
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=marker_prefix):
+        for obj in page.get("Contents", []):
+            hour_path = obj["Key"][len(marker_prefix):].rsplit("/", 1)[0]
+            markers.setdefault(f"{S3_PREFIX}/{hour_path}/", []).append(obj["Key"])
+    return markers
+
+
+def list_log_group_prefixes():
+    """Return the log_group=... prefixes of the hive layout."""
+    group_prefixes = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=f"{S3_PREFIX}/log_group=", Delimiter="/"):
+        group_prefixes.extend(common["Prefix"] for common in page.get("CommonPrefixes", []))
+    return group_prefixes
+
+
+def compact_hour(prefix):
+    """Merge the small objects of one hour prefix and return a summary."""
+    inputs, outputs, manifests, has_hour_manifest = list_hour(prefix)
+
+    # Finish what earlier runs committed, and drop what they did not
+    committed_inputs = set()
+    committed_outputs = {}
+    for manifest_key in manifests:
+        manifest = json.loads(s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=manifest_key)["Body"].read())
+        committed_inputs.update(manifest["inputs"])
+        committed_outputs.update((output["key"], output) for output in manifest["outputs"])
+    leftovers = [key for key in inputs if key in committed_inputs]
+    orphans = [key for key in outputs if key not in committed_outputs]
+    delete_keys(orphans)
+    cleaned_up = len(leftovers) + len(orphans)
+
+    pending = [key for key in inputs if key not in committed_inputs]
+    # Late deliveries to an hour that was already compacted are merged even
+    # when fewer than MIN_INPUT_OBJECTS of them are pending
+    if not pending or (len(pending) < MIN_INPUT_OBJECTS and not manifests):
+        if has_hour_manifest and leftovers:
+            update_hour_manifest(prefix, committed_inputs, committed_outputs.values())
+            delete_keys([hour_manifest_entry_key(prefix, key) for key in leftovers])
+        delete_keys(leftovers)
+        return {"hour": prefix, "inputs": 0, "outputs": [], "cleanedUp": cleaned_up}
+
+    run_id = f"{datetime.datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    written = write_outputs(prefix, run_id, pending)
+    for output in written:
+        verify_output(output)
+
+    # Commit point: from here on the inputs are covered by the outputs
+    manifest_key = f"{prefix}{MANIFEST_NAME_PREFIX}{run_id}.json"
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=manifest_key,
+        Body=json.dumps(
+            {
+                "run": run_id,
+                "createdAt": datetime.datetime.utcnow().isoformat() + "Z",
+                "inputs": pending,
+                "outputs": written,
+            }
+        ).encode("utf-8"),
+        ContentType="application/json",
+    )
+    if has_hour_manifest:
+        committed_inputs.update(pending)
+        committed_outputs.update((output["key"], output) for output in written)
+        update_hour_manifest(prefix, committed_inputs, committed_outputs.values())
+        delete_keys([hour_manifest_entry_key(prefix, key) for key in leftovers + pending])
+    delete_keys(leftovers + pending)
+
+    print(f"Compacted {len(pending)} objects into {len(written)} under s3://{S3_BUCKET_NAME}/{prefix}")
+    return {"hour": prefix, "inputs": len(pending), "outputs": written, "cleanedUp": cleaned_up}
+
+
+def list_hour(prefix):
+    """
+    Split the keys of an hour prefix into inputs, compacted outputs and
+    manifests, and report whether the prefix has a cwl-to-s3 manifest.
+    """
+    inputs, outputs, manifests = [], [], []
+    has_hour_manifest = False
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            name = key[len(prefix):]
+            if name.startswith(HOUR_MANIFEST_ENTRY_PREFIX) or name == HOUR_MANIFEST_NAME:
+                has_hour_manifest = True
+            elif "/" in name:
+                continue
+            elif name.startswith(MANIFEST_NAME_PREFIX):
+                manifests.append(key)
+            elif name.startswith(OUTPUT_NAME_PREFIX):
+                outputs.append(key)
+            elif name.endswith((".json", ".json.gz")):
+                inputs.append(key)
+    return inputs, outputs, manifests, has_hour_manifest
+
+
+def hour_manifest_entry_key(prefix, key):
+    """Return the key of the cwl-to-s3 manifest entry of an object (see cwl-to-s3 manifest_entry_key)."""
+    return f"{prefix}{HOUR_MANIFEST_ENTRY_PREFIX}{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.json"
+
+
+def update_hour_manifest(prefix, removed_keys, outputs):
+    """
+    Merge the compacted outputs into "_manifest.json" of an hour prefix.
+
+    The removed inputs are kept as "replacedKeys", so readers skip their
+    per-delivery entries until those are deleted. Entries of a manifest
+    written by an earlier cwl-to-s3 version (a single "_manifest.json") are
+    kept unless they were compacted.
+    """
+    manifest_key = prefix + HOUR_MANIFEST_NAME
+    try:
+        manifest = json.loads(s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=manifest_key)["Body"].read())
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+        manifest = {"objects": []}
+    replaced = set(manifest.get("replacedKeys", [])) | set(removed_keys)
+    objects = [entry for entry in manifest["objects"] if entry["key"] not in replaced]
+    listed = {entry["key"] for entry in objects}
+    objects.extend(
+        {
+            "key": output["key"],
+            "events": output["lines"],
+            "minTimestamp": output["minTimestamp"],
+            "maxTimestamp": output["maxTimestamp"],
+            "bytes": output["size"],
+        }
+        for output in outputs
+        if output["key"] not in listed
+    )
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=manifest_key,
+        Body=json.dumps(
+            {"objects": objects, "replacedKeys": sorted(replaced)}, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+def write_outputs(prefix, run_id, keys):
+    """Stream the events of the input objects into outputs of up to TARGET_OBJECT_SIZE_MB."""
+    target_size = TARGET_OBJECT_SIZE_MB * 1024 * 1024
+    written = []
+    writer = None
+    try:
+        for key in keys:
+            for line in read_event_lines(key):
+                if writer is None:
+                    writer = CompactedObjectWriter(f"{prefix}{OUTPUT_NAME_PREFIX}{run_id}-{len(written):04d}.json.gz")
+                writer.write_line(line)
+                if writer.size >= target_size:
+                    written.append(writer.close())
+                    writer = None
+        if writer is not None:
+            written.append(writer.close())
+            writer = None
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        # Completed outputs of this run are not committed; remove them now
+        delete_keys([output["key"] for output in written])
+        raise
+    return written
+
+
+def read_event_lines(key):
+    """Yield the events of an archived object as NDJSON lines (bytes ending in a newline)."""
+    body = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)["Body"]
+    if not key.endswith(".gz"):
+        # "json" format: one document wrapping the events array
+        document = json.load(body)
+        yield from event_lines(document, document.get("events", []))
+        return
+
+    stream = gzip.GzipFile(fileobj=body)
+    first = stream.readline()
+    if not first.strip():
+        return
+    document = json.loads(first)
+    if "logEvents" in document:
+        # "raw" format: the CloudWatch Logs payload (a single JSON document)
+        rest = stream.read()
+        if rest.strip():
+            document = json.loads(first + rest)
+        if document.get("messageType") == "DATA_MESSAGE":
+            yield from event_lines(document, document["logEvents"])
+        return
+
+    # "ndjson-gz" format: already one event per line
+    yield first if first.endswith(b"\n") else first + b"\n"
+    for line in stream:
+        if line.strip():
+            yield line if line.endswith(b"\n") else line + b"\n"
+
+
+def event_lines(document, log_events):
+    log_group = document.get("logGroup")
+    log_stream = document.get("logStream")
+    owner = document.get("owner")
+    for log_event in log_events:
+        line = {
+            "logGroup": log_group,
+            "logStream": log_stream,
+            "owner": owner,
+            "id": log_event["id"],
+            "timestamp": log_event["timestamp"],
+            "message": log_event["message"],
+        }
+        if "extractedFields" in log_event:
+            line["extractedFields"] = log_event["extractedFields"]
+        yield (json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class CompactedObjectWriter:
+    """Gzip-compresses NDJSON lines into one S3 multipart upload."""
+
+    def __init__(self, key):
+        self.key = key
+        self.upload_id = s3_client.create_multipart_upload(
+            Bucket=S3_BUCKET_NAME,
+            Key=key,
+            ContentType="application/x-ndjson",
+            ContentEncoding="gzip",
+        )["UploadId"]
+        self.parts = []
+        self.part_digests = []
+        self.buffer = bytearray()
+        self.size = 0
+        self.lines = 0
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.gzip = gzip.GzipFile(fileobj=self, mode="wb", compresslevel=GZIP_COMPRESS_LEVEL)
+
+    def write_line(self, line):
+        self.gzip.write(line)
+        self.lines += 1
+        match = TIMESTAMP_PATTERN.search(line)
+        if match:
+            timestamp = int(match.group(1))
+            if self.min_timestamp is None or timestamp < self.min_timestamp:
+                self.min_timestamp = timestamp
+            if self.max_timestamp is None or timestamp > self.max_timestamp:
+                self.max_timestamp = timestamp
+
+    # File interface used by GzipFile for the compressed stream
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        if len(self.buffer) >= MULTIPART_PART_SIZE:
+            self._upload_part()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _upload_part(self):
+        part_number = len(self.parts) + 1
+        data = bytes(self.buffer)
+        response = s3_client.upload_part(
+            Bucket=S3_BUCKET_NAME,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self.parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        self.part_digests.append(hashlib.md5(data).digest())
+        self.buffer.clear()
+
+    def close(self):
+        """Complete the upload and return the output description."""
+        self.gzip.close()
+        if self.buffer or not self.parts:
+            self._upload_part()
+        s3_client.complete_multipart_upload(
+            Bucket=S3_BUCKET_NAME,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+        etag = f'"{hashlib.md5(b"".join(self.part_digests)).hexdigest()}-{len(self.parts)}"'
+        return {
+            "key": self.key,
+            "size": self.size,
+            "etag": etag,
+            "lines": self.lines,
+            "minTimestamp": self.min_timestamp,
+            "maxTimestamp": self.max_timestamp,
+        }
+
+    def abort(self):
+        s3_client.abort_multipart_upload(Bucket=S3_BUCKET_NAME, Key=self.key, UploadId=self.upload_id)
+
+
+def verify_output(output):
+    """Check that the stored object matches what was uploaded (SSE-S3 keeps MD5-based ETags)."""
+    head = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=output["key"])
+    if head["ContentLength"] != output["size"] or head["ETag"] != output["etag"]:
+        raise RuntimeError(
+            f"Verification failed for {output['key']}: "
+            f"size {head['ContentLength']}/{output['size']}, ETag {head['ETag']}/{output['etag']}"
+        )
+
+
+def delete_keys(keys):
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        response = s3_client.delete_objects(
+            Bucket=S3_BUCKET_NAME,
+            Delete={"Objects": [{"Key": key} for key in keys[start:start + DELETE_BATCH_SIZE]], "Quiet": True},
+        )
+        if response.get("Errors"):
+            raise RuntimeError(f"Failed to delete {len(response['Errors'])} objects: {response['Errors'][0]}")
@@ -3,7 +3,64 @@ Pattern C – CloudWatch Logs → Lambda → S3 Direct Write
 
 Triggered by a CloudWatch Logs subscription filter.
 Decodes the gzip+base64 payload, then writes each batch of log events
-as a JSON object to S3.
+as one S3 object in the format selected by OUTPUT_FORMAT:
+
+- "json" (default): one uncompressed JSON document wrapping the events array
+  (.json, application/json).
+- "ndjson-gz": gzip-compressed newline-delimited JSON, one event per line with
+  logGroup/logStream/owner denormalized (.json.gz, ContentEncoding gzip).
+  Splittable line by line and readable by Athena's JSON SerDe as is.
+- "raw": the decoded gzip payload is stored as is (.json.gz, ContentEncoding
+  gzip). Control messages are detected and logGroup/logStream read from the
+  beginning of the gzip stream; the event IDs and timestamps for the key are
+  found by scanning the inflated payload, so there is no JSON parse or
+  re-encode.
+- "parquet": one row per event with timestamp, id, message, logGroup and
+  logStream columns (.parquet), plus a string column per PARQUET_JSON_FIELDS
+  entry read from JSON-formatted messages. Athena reads only the column
+  chunks a query needs. Requires pyarrow, which is not part of the Lambda
+  runtime and is provided by a layer.
+
+KEY_LAYOUT selects the key of an object:
+
+- "date" (default): {S3_PREFIX}/YYYY/MM/DD/HH/{stream}_{digest}.{ext}
+- "hive": {S3_PREFIX}/log_group={group}/year=YYYY/month=MM/day=DD/hour=HH/{stream}_{digest}.{ext}
+  The log group is the first partition, so Athena/Glue can prune by log
+  group and use partition projection. "/" in the log group name is replaced
+  with "_" and the leading "/" is dropped (/aws/lambda/app -> aws_lambda_app).
+
+Keys are derived from the payload only: the hour is that of the first event
+and {digest} is a hash of the log group, log stream and first/last event ID.
+Objects are written with If-None-Match, so when CloudWatch Logs retries a
+delivery (e.g. after a timeout) the retry finds the key taken and writes
+nothing; it is counted in the DuplicateDeliveries metric (EMF, namespace
+METRICS_NAMESPACE).
+
+With COMPACTION_ENABLED=true, the compactor may already have merged and
+deleted the first copy of a delivery to a closed hour. The key of such a
+delivery is looked up in the inputs listed by the "_compaction-*.json"
+manifests of its hour prefix, before the write and again after it (in case
+the hour was compacted in between, in which case the new copy is deleted),
+so the retry is not written a second time. Deliveries to the current hour
+skip the lookup, since open hours are never compacted.
+
+Objects are keyed by event time, and CloudWatch Logs accepts events up to 14
+days old, so a backdated batch can land in an hour the compactor no longer
+looks at (COMPACTION_LOOKBACK_HOURS). A delivery to an hour older than half
+that window also leaves an empty marker under "{S3_PREFIX}/_late/" (the
+object key below S3_PREFIX), and the compactor sweeps the marked hours.
+
+With MANIFEST_ENABLED=true, every object is also listed in the manifest of
+its hour prefix, with its event count and min/max event timestamp, so
+readers can select the objects covering a time range without listing the
+prefix. Each delivery writes its own small entry "_manifest/<hash>.json"
+(<hash> of the object key), so concurrent invocations never contend for a
+shared object. The compactor merges the entries of the objects it compacts
+into "_manifest.json" (see read_manifest for how to combine both). The entry
+is written after the object; if that fails, the invocation fails and
+CloudWatch Logs retries the delivery, so every listed object exists. In
+"raw" mode the manifest requires decompressing the whole payload to read
+the event timestamps.
 
 Log event payload format received from CloudWatch Logs:
 {
@@ -27,20 +84,71 @@ Decoded JSON structure:
 import base64
 import datetime
 import gzip
+import hashlib
 import json
 import os
-import uuid
+import re
+import time
+import zlib
 
 import boto3
+from botocore.exceptions import ClientError
 
 S3_BUCKET_NAME = os.environ["S3_BUCKET_NAME"]
 S3_PREFIX = os.environ.get("S3_PREFIX", "subscriptions")
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "json")
+# Level 6 is close to level 9 in size for log text at a fraction of the CPU time
+GZIP_COMPRESS_LEVEL = int(os.environ.get("GZIP_COMPRESS_LEVEL", "6"))
+KEY_LAYOUT = os.environ.get("KEY_LAYOUT", "date")
+MANIFEST_ENABLED = os.environ.get("MANIFEST_ENABLED", "false").lower() == "true"
+COMPACTION_ENABLED = os.environ.get("COMPACTION_ENABLED", "false").lower() == "true"
+# Deliveries to hours older than half the compactor's lookback window are marked for it
+COMPACTION_LOOKBACK_HOURS = int(os.environ.get("COMPACTION_LOOKBACK_HOURS", "48"))
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "CloudWatchLogsS3Archive")
+# Top-level fields of JSON messages stored as their own columns, e.g. "level,requestId"
+PARQUET_JSON_FIELDS = [field.strip() for field in os.environ.get("PARQUET_JSON_FIELDS", "").split(",") if field.strip()]
+PARQUET_COMPRESSION = os.environ.get("PARQUET_COMPRESSION", "zstd")
+# A delivery is far below Athena's preferred row group size (128 MB+), so by
+# default every object is a single row group
+PARQUET_ROW_GROUP_ROWS = int(os.environ.get("PARQUET_ROW_GROUP_ROWS", "1000000"))
+
+# Merged manifest written by the compactor, and per-delivery entries
+MANIFEST_NAME = "_manifest.json"
+MANIFEST_ENTRY_PREFIX = "_manifest/"
+# Commit manifests of the compactor, listing the compacted inputs
+COMPACTION_MANIFEST_PREFIX = "_compaction-"
+# Markers of deliveries to hours about to leave the compactor's lookback window
+LATE_MARKER_PREFIX = "_late/"
+
+# Inflated bytes inspected in "raw" mode; CloudWatch Logs writes the header
+# fields before logEvents, so they fit well within this
+RAW_PEEK_BYTES = 4096
+RAW_HEADER_PATTERN = re.compile(rb'"(messageType|logGroup|logStream)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+# Start of a log event object; quotes inside messages are escaped, so this
+# only matches the events themselves
+RAW_EVENT_PATTERN = re.compile(rb'\{\s*"id"\s*:\s*"(\d+)"\s*,\s*"timestamp"\s*:\s*(\d+)')
+
+OUTPUT_FORMATS = ("json", "ndjson-gz", "raw", "parquet")
+if OUTPUT_FORMAT not in OUTPUT_FORMATS:
+    raise ValueError(f"OUTPUT_FORMAT must be one of {OUTPUT_FORMATS}, got {OUTPUT_FORMAT!r}")
+KEY_LAYOUTS = ("date", "hive")
+if KEY_LAYOUT not in KEY_LAYOUTS:
+    raise ValueError(f"KEY_LAYOUT must be one of {KEY_LAYOUTS}, got {KEY_LAYOUT!r}")
+PARQUET_COLUMNS = ("timestamp", "id", "message", "logGroup", "logStream")
+if set(PARQUET_JSON_FIELDS) & set(PARQUET_COLUMNS):
+    raise ValueError(f"PARQUET_JSON_FIELDS must not contain {PARQUET_COLUMNS}, got {PARQUET_JSON_FIELDS}")
+
+if OUTPUT_FORMAT == "parquet":
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
 s3_client = boto3.client("s3")
 
 
 def lambda_handler(event, context):
     compressed = base64.b64decode(event["awslogs"]["data"])
+    if OUTPUT_FORMAT == "raw":
+        return write_raw(compressed)
     payload = json.loads(gzip.decompress(compressed).decode("utf-8"))
 
     if payload.get("messageType") == "CONTROL_MESSAGE":
@@ -52,29 +160,351 @@ def lambda_handler(event, context):
     log_events = payload["logEvents"]
 
     now = datetime.datetime.utcnow()
+    prefix = hour_prefix(log_group, log_events[0]["timestamp"])
+    s3_key = build_key_base(prefix, log_group, log_stream, log_events[0]["id"], log_events[-1]["id"])
+
+    if OUTPUT_FORMAT == "ndjson-gz":
+        s3_key += ".json.gz"
+        body = to_ndjson_gz(payload)
+        object_params = {"ContentType": "application/x-ndjson", "ContentEncoding": "gzip"}
+    elif OUTPUT_FORMAT == "parquet":
+        s3_key += ".parquet"
+        body = to_parquet(payload)
+        object_params = {"ContentType": "application/vnd.apache.parquet"}
+    else:
+        s3_key += ".json"
+        record = {
+            "logGroup": log_group,
+            "logStream": log_stream,
+            "owner": payload.get("owner"),
+            "exportedAt": now.isoformat() + "Z",
+            "events": log_events,
+        }
+        body = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        object_params = {"ContentType": "application/json"}
+
+    status = put_delivery(prefix, s3_key, log_events[0]["timestamp"], body, **object_params)
+    if MANIFEST_ENABLED and status != "compacted":
+        # Also on a duplicate: the first attempt may have failed before the manifest update
+        write_manifest_entry(prefix, manifest_entry(s3_key, log_events, len(body)))
+    if status != "compacted":
+        mark_late_delivery(s3_key, log_events[0]["timestamp"])
+    if status != "written":
+        return {"status": "duplicate", "s3Key": s3_key}
+
+    print(f"Wrote {len(log_events)} events → s3://{S3_BUCKET_NAME}/{s3_key}")
+    return {"status": "ok", "processed": len(log_events), "s3Key": s3_key}
+
+
+def hour_prefix(log_group, timestamp):
+    """Return the prefix (ending in "/") in KEY_LAYOUT of the hour of an event timestamp (ms)."""
+    now = datetime.datetime.fromtimestamp(timestamp / 1000, datetime.timezone.utc)
+    if KEY_LAYOUT == "hive":
+        safe_group = log_group.strip("/").replace("/", "_")
+        return f"{S3_PREFIX}/log_group={safe_group}/{now.strftime('year=%Y/month=%m/day=%d/hour=%H')}/"
+    return f"{S3_PREFIX}/{now.strftime('%Y/%m/%d/%H')}/"
+
+
+def build_key_base(prefix, log_group, log_stream, first_event_id, last_event_id):
+    """Return the S3 key of a delivery without the file extension; the same for every retry."""
     # Replace characters that are invalid in S3 keys
     safe_stream = log_stream.replace("/", "_").replace("$", "").replace("[", "").replace("]", "")
-    s3_key = (
-        f"{S3_PREFIX}"
-        f"/{now.strftime('%Y/%m/%d/%H')}"
-        f"/{safe_stream}"
-        f"_{uuid.uuid4().hex[:8]}.json"
+    digest = hashlib.sha256(
+        "\n".join((log_group, log_stream, first_event_id, last_event_id)).encode("utf-8")
+    ).hexdigest()[:16]
+    return f"{prefix}{safe_stream}_{digest}"
+
+
+def put_delivery(prefix, s3_key, timestamp, body, **object_params):
+    """
+    Write a delivery unless its key already exists or was already compacted.
+
+    Args:
+        prefix: Hour prefix of the key
+        s3_key: Key derived from the payload
+        timestamp: Timestamp (ms) of the first event, which selects the hour
+
+    Returns:
+        "written", "duplicate" if the key exists, or "compacted" if the
+        compactor already merged an earlier copy of the delivery
+    """
+    # Only closed hours are compacted
+    check_compacted = COMPACTION_ENABLED and (timestamp // 3600000 + 1) * 3600000 <= time.time() * 1000
+    if check_compacted and was_compacted(prefix, s3_key):
+        print(f"Duplicate delivery, s3://{S3_BUCKET_NAME}/{s3_key} was already compacted.")
+        put_metric("DuplicateDeliveries", 1)
+        return "compacted"
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=s3_key,
+            Body=body,
+            IfNoneMatch="*",
+            **object_params,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "PreconditionFailed":
+            raise
+        print(f"Duplicate delivery, s3://{S3_BUCKET_NAME}/{s3_key} already exists.")
+        put_metric("DuplicateDeliveries", 1)
+        return "duplicate"
+    # The write only succeeds once the first copy is deleted, and the compactor
+    # commits its manifest before deleting, so this lookup cannot miss it
+    if check_compacted and was_compacted(prefix, s3_key):
+        s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+        print(f"Duplicate delivery, s3://{S3_BUCKET_NAME}/{s3_key} was compacted meanwhile; removed.")
+        put_metric("DuplicateDeliveries", 1)
+        return "compacted"
+    return "written"
+
+
+def was_compacted(prefix, s3_key):
+    """Return whether a key is an input of a committed compaction of its hour prefix."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=prefix + COMPACTION_MANIFEST_PREFIX):
+        for obj in page.get("Contents", []):
+            manifest = json.loads(s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=obj["Key"])["Body"].read())
+            if s3_key in manifest["inputs"]:
+                return True
+    return False
+
+
+def mark_late_delivery(s3_key, timestamp):
+    """
+    Leave a marker for the compactor if a delivery landed in an hour older
+    than half of COMPACTION_LOOKBACK_HOURS.
+
+    The marker is written after the object (also for a duplicate, whose first
+    attempt may have failed before the marker), so a marker the compactor
+    lists always refers to an object it will list too.
+    """
+    if not COMPACTION_ENABLED or timestamp > (time.time() - COMPACTION_LOOKBACK_HOURS * 3600 / 2) * 1000:
+        return
+    s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=late_marker_key(s3_key), Body=b"")
+
+
+def late_marker_key(s3_key):
+    """Return the key of the late-delivery marker of an object: its key below S3_PREFIX under "_late/"."""
+    return f"{S3_PREFIX}/{LATE_MARKER_PREFIX}{s3_key[len(S3_PREFIX) + 1:]}"
+
+
+def put_metric(name, value):
+    """Emit a Count metric in CloudWatch Embedded Metric Format."""
+    function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "cwl-to-s3")
+    print(
+        json.dumps(
+            {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": METRICS_NAMESPACE,
+                            "Dimensions": [["FunctionName"]],
+                            "Metrics": [{"Name": name, "Unit": "Count"}],
+                        }
+                    ],
+                },
+                "FunctionName": function_name,
+                name: value,
+            }
+        )
     )
 
-    record = {
-        "logGroup": log_group,
-        "logStream": log_stream,
-        "owner": payload.get("owner"),
-        "exportedAt": now.isoformat() + "Z",
-        "events": log_events,
+
+def manifest_entry(s3_key, log_events, size):
+    timestamps = [log_event["timestamp"] for log_event in log_events]
+    return {
+        "key": s3_key,
+        "events": len(log_events),
+        "minTimestamp": min(timestamps, default=None),
+        "maxTimestamp": max(timestamps, default=None),
+        "bytes": size,
     }
 
-    s3_client.put_object(
-        Bucket=S3_BUCKET_NAME,
-        Key=s3_key,
-        Body=json.dumps(record, ensure_ascii=False).encode("utf-8"),
-        ContentType="application/json",
+
+def manifest_entry_key(prefix, s3_key):
+    """Return the key of the manifest entry of an object; the compactor derives it the same way."""
+    return f"{prefix}{MANIFEST_ENTRY_PREFIX}{hashlib.sha256(s3_key.encode('utf-8')).hexdigest()[:16]}.json"
+
+
+def write_manifest_entry(prefix, entry):
+    """
+    Write the manifest entry of a delivery, unless an earlier attempt did.
+
+    One object per delivery: no read-modify-write of a shared manifest, so
+    concurrent invocations do not conflict.
+    """
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=manifest_entry_key(prefix, entry["key"]),
+            Body=json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+            ContentType="application/json",
+            IfNoneMatch="*",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "PreconditionFailed":
+            raise
+
+
+def read_manifest(prefix):
+    """
+    Return the manifest entries of an hour prefix.
+
+    Combines "_manifest.json" (compacted objects, written by the compactor)
+    with the per-delivery entries, skipping the entries of the objects listed
+    in its "replacedKeys" (compacted, or about to be deleted).
+    """
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=prefix + MANIFEST_NAME)
+        merged = json.loads(response["Body"].read())
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+        merged = {"objects": [], "replacedKeys": []}
+    replaced = set(merged.get("replacedKeys", []))
+    objects = list(merged["objects"])
+    listed = {entry["key"] for entry in objects}
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=prefix + MANIFEST_ENTRY_PREFIX):
+        for obj in page.get("Contents", []):
+            entry = json.loads(s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=obj["Key"])["Body"].read())
+            if entry["key"] not in replaced and entry["key"] not in listed:
+                objects.append(entry)
+    return objects
+
+
+def write_raw(compressed):
+    """Store the gzip payload as delivered, without parsing it."""
+    header = peek_header(compressed)
+    if header.get("messageType") == "CONTROL_MESSAGE":
+        print("Control message received, skipping.")
+        return {"status": "skipped", "reason": "control_message"}
+
+    data = zlib.decompress(compressed, 16 + zlib.MAX_WBITS)
+    log_events = raw_events(data)
+    if not log_events:
+        log_events = json.loads(data.decode("utf-8"))["logEvents"]
+    del data
+
+    prefix = hour_prefix(header["logGroup"], log_events[0]["timestamp"])
+    s3_key = build_key_base(
+        prefix, header["logGroup"], header["logStream"], log_events[0]["id"], log_events[-1]["id"]
+    ) + ".json.gz"
+    status = put_delivery(
+        prefix, s3_key, log_events[0]["timestamp"], compressed, ContentType="application/json", ContentEncoding="gzip"
     )
+    if MANIFEST_ENABLED and status != "compacted":
+        write_manifest_entry(prefix, manifest_entry(s3_key, log_events, len(compressed)))
+    if status != "compacted":
+        mark_late_delivery(s3_key, log_events[0]["timestamp"])
+    if status != "written":
+        return {"status": "duplicate", "s3Key": s3_key}
 
-    print(f"Wrote {len(log_events)} events → s3://{S3_BUCKET_NAME}/{s3_key}")
-    return {"status": "ok", "processed": len(log_events), "s3Key": s3_key}
+    print(f"Wrote {len(compressed)} bytes from {header['logGroup']} → s3://{S3_BUCKET_NAME}/{s3_key}")
+    return {"status": "ok", "bytes": len(compressed), "s3Key": s3_key}
+
+
+def raw_events(data):
+    """
+    Return the id and timestamp of the events of an inflated payload.
+
+    Only the first and last events are returned unless MANIFEST_ENABLED
+    (which needs every timestamp); an empty list if the events are not found.
+    """
+    if MANIFEST_ENABLED:
+        matches = list(RAW_EVENT_PATTERN.finditer(data))
+    else:
+        first = RAW_EVENT_PATTERN.search(data)
+        matches = []
+        end = len(data)
+        while first is not None:
+            # The last "{" that starts an event; braces in messages are skipped
+            start = data.rfind(b"{", first.start(), end)
+            last = RAW_EVENT_PATTERN.match(data, start)
+            if last is not None:
+                matches = [first, last]
+                break
+            end = start
+    return [{"id": match.group(1).decode(), "timestamp": int(match.group(2))} for match in matches]
+
+
+def peek_header(compressed):
+    """
+    Read messageType, logGroup and logStream from the start of the gzip payload.
+
+    Falls back to a full decompress if the fields are not all found in the
+    first RAW_PEEK_BYTES inflated bytes.
+    """
+    head = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(compressed, RAW_PEEK_BYTES)
+    header = {
+        name.decode(): json.loads(b'"' + value + b'"')
+        for name, value in RAW_HEADER_PATTERN.findall(head.split(b'"logEvents"', 1)[0])
+    }
+    if len(header) < 3:
+        payload = json.loads(gzip.decompress(compressed).decode("utf-8"))
+        header = {name: payload.get(name) for name in ("messageType", "logGroup", "logStream")}
+    return header
+
+
+def to_ndjson_gz(payload):
+    """Serialize the log events as gzip-compressed NDJSON, one event per line."""
+    log_group = payload["logGroup"]
+    log_stream = payload["logStream"]
+    owner = payload.get("owner")
+    lines = []
+    for log_event in payload["logEvents"]:
+        line = {
+            "logGroup": log_group,
+            "logStream": log_stream,
+            "owner": owner,
+            "id": log_event["id"],
+            "timestamp": log_event["timestamp"],
+            "message": log_event["message"],
+        }
+        # Present when the subscription filter pattern extracts fields
+        if "extractedFields" in log_event:
+            line["extractedFields"] = log_event["extractedFields"]
+        lines.append(json.dumps(line, ensure_ascii=False, separators=(",", ":")))
+    return gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), compresslevel=GZIP_COMPRESS_LEVEL)
+
+
+def to_parquet(payload):
+    """Serialize the log events as a Parquet file, one row per event."""
+    log_events = payload["logEvents"]
+    count = len(log_events)
+    messages = [log_event["message"] for log_event in log_events]
+    columns = {
+        "timestamp": pa.array([log_event["timestamp"] for log_event in log_events], pa.timestamp("ms")),
+        "id": pa.array([log_event["id"] for log_event in log_events], pa.string()),
+        "message": pa.array(messages, pa.string()),
+        # Constant per delivery; dictionary encoding stores them once
+        "logGroup": pa.array([payload["logGroup"]] * count, pa.string()),
+        "logStream": pa.array([payload["logStream"]] * count, pa.string()),
+    }
+    if PARQUET_JSON_FIELDS:
+        values = {field: [None] * count for field in PARQUET_JSON_FIELDS}
+        for row, message in enumerate(messages):
+            if not message.startswith("{"):
+                continue
+            try:
+                document = json.loads(message)
+            except ValueError:
+                continue
+            if type(document) is not dict:
+                continue
+            for field in PARQUET_JSON_FIELDS:
+                value = document.get(field)
+                if value is not None:
+                    values[field][row] = value if type(value) is str else json.dumps(value, ensure_ascii=False)
+        for field in PARQUET_JSON_FIELDS:
+            columns[field] = pa.array(values.pop(field), pa.string())
+
+    sink = pa.BufferOutputStream()
+    pq.write_table(
+        pa.table(columns),
+        sink,
+        compression=PARQUET_COMPRESSION,
+        row_group_size=PARQUET_ROW_GROUP_ROWS,
+    )
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,156 @@
+"""
+Pattern B – Time-range index of exported log objects
+
+Invoked asynchronously by the export-task driver for every completed export
+task. CloudWatch Logs writes a task's objects to
+{destinationPrefix}/{taskId}/{stream}/000000.gz, one gzip-compressed file per
+chunk of a log stream, each line starting with the event time
+("2026-01-01T00:00:00.000Z message"). This function reads every object and
+writes one compact index per task:
+
+    S3_PREFIX/_index/{log group}/{from}-{to}-{taskId}.json
+    {"logGroup": ..., "taskId": ..., "from": ms, "to": ms,
+     "prefix": "{destinationPrefix}/{taskId}/",
+     "objects": [{"key": "{stream}/000000.gz", "stream": ..., "size": bytes,
+                  "lines": n, "minTimestamp": ms, "maxTimestamp": ms}, ...]}
+
+The index key carries the window of the task, so a reader (e.g.
+test-scripts/search-exports.py) lists the indexes of a log group, loads only
+those overlapping its time range, and fetches only the objects whose
+min/max timestamp overlaps it. Athena ignores keys starting with "_".
+
+Notes:
+- Objects are streamed in CHUNK_SIZE pieces and scanned with a regular
+  expression, so a worker only holds the decompressed data of one piece.
+- Objects are indexed by a bounded thread pool of MAX_WORKERS (zlib releases
+  the GIL while decompressing).
+- The index is overwritten as a whole, so re-invoking with the same event is
+  safe. Exports made before the indexer was enabled can be indexed by
+  invoking it manually with their task.
+
+Event:
+    {"logGroup": "/app/orders", "taskId": "...", "destinationPrefix": "exports/2026/01/01",
+     "from": 1767225600000, "to": 1767312000000}
+"""
+import datetime
+import json
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+S3_BUCKET_NAME = os.environ["S3_BUCKET_NAME"]
+S3_PREFIX = os.environ.get("S3_PREFIX", "AWSLogs/exports")
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "8"))
+# Endpoint override for a local S3 stand-in (e.g. MinIO)
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", "")
+
+CHUNK_SIZE = 1024 * 1024
+INDEX_VERSION = 1
+
+# Event time at the start of an exported line
+LINE_TIMESTAMP_PATTERN = re.compile(rb"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3})Z ", re.MULTILINE)
+
+s3_client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL or None)
+
+
+def lambda_handler(event, context):
+    prefix = f"{event['destinationPrefix']}/{event['taskId']}/"
+    keys = list_objects(prefix)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        objects = list(executor.map(lambda item: index_object(prefix, *item), keys))
+
+    index = {
+        "version": INDEX_VERSION,
+        "logGroup": event["logGroup"],
+        "taskId": event["taskId"],
+        "from": event["from"],
+        "to": event["to"],
+        "prefix": prefix,
+        "objects": objects,
+    }
+    key = index_key(event["logGroup"], event["from"], event["to"], event["taskId"])
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=key,
+        Body=json.dumps(index, separators=(",", ":")).encode(),
+        ContentType="application/json",
+    )
+
+    summary = {
+        "status": "ok",
+        "index": key,
+        "objects": len(objects),
+        "bytes": sum(obj["size"] for obj in objects),
+        "lines": sum(obj["lines"] for obj in objects),
+    }
+    print(json.dumps(summary))
+    return summary
+
+
+def index_key(log_group, from_ms, to_ms, task_id):
+    safe_group = log_group.strip("/").replace("/", "_")
+    return f"{S3_PREFIX}/_index/{safe_group}/{format_ms(from_ms)}-{format_ms(to_ms)}-{task_id}.json"
+
+
+def list_objects(prefix):
+    """Return (key, size) of the objects of an export task."""
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=prefix):
+        keys.extend((obj["Key"], obj["Size"]) for obj in page.get("Contents", []))
+    return keys
+
+
+def index_object(prefix, key, size):
+    """Stream one exported object and return its index entry."""
+    relative = key[len(prefix):]
+    lines = 0
+    first = last = None
+    for data in decompressed_lines(key):
+        lines += data.count(b"\n")
+        timestamps = LINE_TIMESTAMP_PATTERN.findall(data)
+        if timestamps:
+            low, high = min(timestamps), max(timestamps)
+            first = low if first is None or low < first else first
+            last = high if last is None or high > last else last
+    return {
+        "key": relative,
+        "stream": relative.rsplit("/", 1)[0] if "/" in relative else "",
+        "size": size,
+        "lines": lines,
+        "minTimestamp": parse_timestamp(first),
+        "maxTimestamp": parse_timestamp(last),
+    }
+
+
+def decompressed_lines(key):
+    """Yield the decompressed object in pieces of whole lines (multi-member gzip aware)."""
+    body = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)["Body"]
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    pending = b""
+    for chunk in iter(lambda: body.read(CHUNK_SIZE), b""):
+        while chunk:
+            data = pending + decompressor.decompress(chunk)
+            chunk = decompressor.unused_data
+            if chunk:
+                decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+            end = data.rfind(b"\n") + 1
+            pending = data[end:]
+            if end:
+                yield data[:end]
+    if pending:
+        yield pending + b"\n"
+
+
+def parse_timestamp(value):
+    if value is None:
+        return None
+    parsed = datetime.datetime.strptime(value.decode(), "%Y-%m-%dT%H:%M:%S.%f")
+    return int(parsed.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+def format_ms(value):
+    return datetime.datetime.fromtimestamp(value / 1000, datetime.timezone.utc).strftime("%Y%m%dT%H%M")
@@ -1,58 +1,433 @@
 """
 Pattern B – CloudWatch Logs Export Task Lambda
 
-Triggered by EventBridge on a schedule (default: daily).
-Calls CreateExportTask to export the previous day's logs to S3.
+Triggered by EventBridge Scheduler (default: every 5 minutes, the timeout).
+Exports the log groups in LOG_GROUP_NAMES (or LOG_GROUP_NAME) to S3 window by
+window, from BACKFILL_START (default: the previous day) up to the last
+complete window.
 
 Notes:
-- Only one export task can run at a time per AWS account.
-  This function checks for in-progress tasks before creating a new one.
+- Only one export task can run at a time per AWS account, so this function
+  works as a driver over a persisted work queue instead of exporting a fixed
+  day, and never skips a window because another task was running.
+- The state is kept in s3://S3_BUCKET_NAME/STATE_KEY:
+  a cursor per log group (start of its next window), the task in flight,
+  a retry queue of windows whose task failed, and the windows that failed
+  MAX_ATTEMPTS times (kept until re-queued with {"retryFailed": true}).
+- A window leaves the cursor range only together with the task exporting it,
+  and leaves the state only when that task COMPLETED, so no window is lost
+  when a task fails or the function is interrupted.
+- Every invocation checks the task in flight and, once it completed, starts
+  the next window right away (retries first, then the log group furthest
+  behind). It keeps polling until TIME_RESERVE_MS of its timeout is left, so
+  with a schedule as frequent as the timeout exports run back to back.
+- The state is written with S3 conditional writes; an overlapping invocation
+  stops instead of starting a second task. The task name is saved before
+  CreateExportTask is called, so an invocation interrupted in between adopts
+  the task by name instead of exporting the window twice.
 - The export is asynchronous; completion may take minutes to hours.
+
+Adaptive window size:
+- For every completed task, the duration (from DescribeExportTasks) and the
+  exported bytes (listed under its destination prefix) are published as EMF
+  metrics (namespace METRICS_NAMESPACE, dimension LogGroup).
+- The seconds the export of one hour of a log group takes (a moving average
+  over its tasks) sizes its next window so that a task takes about
+  TARGET_TASK_MINUTES: hot log groups go down to hourly windows, so a task
+  does not block the account for hours, and quiet ones up to
+  MAX_WINDOW_HOURS, so the fixed per-task overhead is paid less often.
+- Window sizes divide a day or are whole days, and windows end on a multiple
+  of their size, so they stay aligned when the size changes.
+
+With INDEXER_FUNCTION_NAME, every completed task is also handed to the
+export-indexer function (asynchronous invocation), which writes a time-range
+index of the task's objects under S3_PREFIX/_index/.
+
+Event (optional):
+    {"retryFailed": true}  moves the windows that exhausted MAX_ATTEMPTS back to the retry queue
 """
 
 import boto3
 import datetime
+import json
 import os
+import time
+
+from botocore.exceptions import ClientError
 
-LOG_GROUP_NAME = os.environ["LOG_GROUP_NAME"]
+LOG_GROUP_NAMES = [
+    name.strip()
+    for name in os.environ.get("LOG_GROUP_NAMES", os.environ.get("LOG_GROUP_NAME", "")).split(",")
+    if name.strip()
+]
 S3_BUCKET_NAME = os.environ["S3_BUCKET_NAME"]
 S3_PREFIX = os.environ.get("S3_PREFIX", "AWSLogs/exports")
+# Athena ignores keys starting with "_"
+STATE_KEY = os.environ.get("STATE_KEY", f"{S3_PREFIX}/_state/export-task.json")
+# ISO date or time (UTC) of the first window; default: the previous day
+BACKFILL_START = os.environ.get("BACKFILL_START", "")
+# Initial window size; adapted per log group between MIN and MAX_WINDOW_HOURS
+WINDOW_HOURS = int(os.environ.get("WINDOW_HOURS", "24"))
+MIN_WINDOW_HOURS = int(os.environ.get("MIN_WINDOW_HOURS", "1"))
+MAX_WINDOW_HOURS = int(os.environ.get("MAX_WINDOW_HOURS", "72"))
+TARGET_TASK_MINUTES = int(os.environ.get("TARGET_TASK_MINUTES", "30"))
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "CloudWatchLogsS3Archive")
+INDEXER_FUNCTION_NAME = os.environ.get("INDEXER_FUNCTION_NAME", "")
+# A window is exported once it ended at least this long ago (late-arriving events)
+EXPORT_DELAY_MINUTES = int(os.environ.get("EXPORT_DELAY_MINUTES", "15"))
+MAX_ATTEMPTS = int(os.environ.get("MAX_ATTEMPTS", "5"))
+POLL_INTERVAL_SECONDS = float(os.environ.get("POLL_INTERVAL_SECONDS", "15"))
+# Stop polling when less than this is left of the Lambda timeout
+TIME_RESERVE_MS = int(os.environ.get("TIME_RESERVE_MS", "30000"))
+# DescribeExportTasks pages searched for a task created by an interrupted invocation
+TASK_LOOKUP_PAGES = 5
+# Weight of the latest task in the seconds-per-hour moving average
+HISTORY_WEIGHT = 0.5
+WINDOW_SIZES_HOURS = (1, 2, 3, 4, 6, 8, 12, 24, 48, 72, 96, 120, 144, 168)
+
+if not LOG_GROUP_NAMES:
+    raise ValueError("LOG_GROUP_NAMES or LOG_GROUP_NAME must be set")
+for hours in (WINDOW_HOURS, MIN_WINDOW_HOURS, MAX_WINDOW_HOURS):
+    if hours not in WINDOW_SIZES_HOURS:
+        raise ValueError(f"Window sizes must be one of {WINDOW_SIZES_HOURS} hours, got {hours}")
+
+logs_client = boto3.client("logs")
+s3_client = boto3.client("s3")
+lambda_client = boto3.client("lambda") if INDEXER_FUNCTION_NAME else None
+
+
+class StateConflictError(Exception):
+    """The state was changed by another invocation since it was read."""
+
+
+class StateStore:
+    """Driver state in S3, written only if unchanged since it was read."""
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        self.etag = None
+
+    def load(self):
+        try:
+            response = s3_client.get_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "NoSuchKey":
+                raise
+            return {"logGroups": {}, "inFlight": None, "retryQueue": [], "failed": []}
+        self.etag = response["ETag"]
+        return json.loads(response["Body"].read())
+
+    def save(self, state):
+        state["updatedAt"] = utc_now().isoformat()
+        condition = {"IfMatch": self.etag} if self.etag else {"IfNoneMatch": "*"}
+        try:
+            response = s3_client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=json.dumps(state, indent=2).encode("utf-8"),
+                ContentType="application/json",
+                **condition,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise StateConflictError(f"s3://{self.bucket}/{self.key} was updated by another invocation") from e
+            raise
+        self.etag = response["ETag"]
 
 
 def lambda_handler(event, context):
-    logs_client = boto3.client("logs")
-
-    # Check if another export task is already running
-    running = logs_client.describe_export_tasks(statusCode="RUNNING")
-    pending = logs_client.describe_export_tasks(statusCode="PENDING")
-    if running["exportTasks"] or pending["exportTasks"]:
-        print("An export task is already running or pending. Skipping.")
-        return {"status": "skipped", "reason": "task_in_progress"}
-
-    # Export the previous day (UTC)
-    yesterday = datetime.datetime.utcnow() - datetime.timedelta(days=1)
-    from_time = int(
-        yesterday.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000
-    )
-    to_time = int(
-        yesterday.replace(hour=23, minute=59, second=59, microsecond=999999).timestamp()
-        * 1000
-    )
+    store = StateStore(S3_BUCKET_NAME, STATE_KEY)
+    state = store.load()
+
+    start = backfill_start()
+    for log_group in LOG_GROUP_NAMES:
+        state["logGroups"].setdefault(log_group, {"cursor": start})
+    if event.get("retryFailed"):
+        for window in state["failed"]:
+            window["attempts"] = 0
+        state["retryQueue"].extend(state["failed"])
+        state["failed"] = []
 
-    task_name = f"export-{yesterday.strftime('%Y-%m-%d')}"
-    destination_prefix = f"{S3_PREFIX}/{yesterday.strftime('%Y/%m/%d')}"
+    summary = {"started": 0, "completed": 0, "failed": 0}
+    status = "progress"
+    try:
+        store.save(state)
+        while True:
+            status = step(state, store, summary)
+            if status == "idle":
+                break
+            if context is not None and context.get_remaining_time_in_millis() < TIME_RESERVE_MS:
+                break
+            if status == "waiting":
+                time.sleep(POLL_INTERVAL_SECONDS)
+    except StateConflictError as e:
+        print(f"{e}. Stopping.")
+        return {"status": "skipped", "reason": "concurrent_invocation", **summary}
 
-    response = logs_client.create_export_task(
-        taskName=task_name,
-        logGroupName=LOG_GROUP_NAME,
-        fromTime=from_time,
-        to=to_time,
-        destination=S3_BUCKET_NAME,
-        destinationPrefix=destination_prefix,
+    summary.update(
+        {
+            # "idle": nothing left to export, "waiting": a task is running,
+            # "progress": stopped at the time reserve with windows ready
+            "status": status,
+            "inFlight": state["inFlight"],
+            "retryQueue": len(state["retryQueue"]),
+            "failedWindows": len(state["failed"]),
+            "cursors": {name: format_ms(group["cursor"]) for name, group in state["logGroups"].items()},
+            "windowHours": {
+                name: group.get("windowHours", WINDOW_HOURS) for name, group in state["logGroups"].items()
+            },
+        }
     )
+    print(json.dumps(summary, default=str))
+    return summary
+
+
+def step(state, store, summary):
+    """
+    Advance the driver by one transition and save the state.
+
+    Returns:
+        "waiting" while a task is running, "progress" after a transition that
+        allows another one right away, "idle" when there is nothing to export
+    """
+    in_flight = state["inFlight"]
+    if in_flight is None:
+        window = next_window(state)
+        if window is None:
+            return "idle"
+        window["taskName"] = task_name(window)
+        window["taskId"] = None
+        # Save the intent first: the window is never only in memory
+        state["inFlight"] = window
+        store.save(state)
+        return start_task(state, store, summary)
+
+    if in_flight["taskId"] is None:
+        in_flight["taskId"] = find_task_id(in_flight["taskName"])
+        if in_flight["taskId"] is None:
+            return start_task(state, store, summary)
+        store.save(state)
+
+    try:
+        tasks = logs_client.describe_export_tasks(taskId=in_flight["taskId"])["exportTasks"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ResourceNotFoundException":
+            raise
+        tasks = []
+    status = tasks[0]["status"] if tasks else {"code": "FAILED", "message": "task not found"}
+    if status["code"] in ("PENDING", "RUNNING", "PENDING_CANCEL"):
+        return "waiting"
+    if status["code"] == "COMPLETED":
+        print(f"Exported {describe_window(in_flight)} (task {in_flight['taskId']})")
+        record_completion(state, in_flight, tasks[0])
+        if INDEXER_FUNCTION_NAME:
+            request_index(in_flight)
+        summary["completed"] += 1
+    else:
+        fail_window(state, in_flight, f"{status['code']}: {status.get('message', '')}")
+        summary["failed"] += 1
+    state["inFlight"] = None
+    store.save(state)
+    return "progress"
+
+
+def start_task(state, store, summary):
+    """Create the export task of the window in flight."""
+    window = state["inFlight"]
+    try:
+        response = logs_client.create_export_task(
+            taskName=window["taskName"],
+            logGroupName=window["logGroup"],
+            fromTime=window["from"],
+            # "to" is inclusive
+            to=window["to"] - 1,
+            destination=S3_BUCKET_NAME,
+            destinationPrefix=destination_prefix(window),
+        )
+    except ClientError as e:
+        code = e.response["Error"]["Code"]
+        if code == "LimitExceededException":
+            # Another export task of the account is running; try again later
+            print(f"Export task limit reached, {describe_window(window)} waits.")
+            return "waiting"
+        fail_window(state, window, f"{code}: {e.response['Error'].get('Message', '')}")
+        summary["failed"] += 1
+        state["inFlight"] = None
+        store.save(state)
+        return "progress"
+
+    window["taskId"] = response["taskId"]
+    store.save(state)
+    summary["started"] += 1
+    print(f"Export task created: {window['taskId']} for {describe_window(window)} → s3://{S3_BUCKET_NAME}/{destination_prefix(window)}")
+    return "waiting"
+
+
+def next_window(state):
+    """Pop the next window to export: retries first, then the log group furthest behind."""
+    if state["retryQueue"]:
+        return state["retryQueue"].pop(0)
+
+    limit = int(utc_now().timestamp() * 1000) - EXPORT_DELAY_MINUTES * 60 * 1000
+    candidates = []
+    for name, group in state["logGroups"].items():
+        window_ms = group.get("windowHours", WINDOW_HOURS) * 3600 * 1000
+        # End on a multiple of the window size; the first window after a resize may be shorter
+        end = (group["cursor"] // window_ms + 1) * window_ms
+        if name in LOG_GROUP_NAMES and end <= limit:
+            candidates.append((group["cursor"], name, end))
+    if not candidates:
+        return None
+    cursor, log_group, end = min(candidates)
+    state["logGroups"][log_group]["cursor"] = end
+    return {"logGroup": log_group, "from": cursor, "to": end, "attempts": 0}
 
-    task_id = response["taskId"]
+
+def record_completion(state, window, task):
+    """Publish the duration and size of a completed task and resize the log group's window."""
+    info = task.get("executionInfo", {})
+    hours = (window["to"] - window["from"]) / 3600000
+    exported_bytes = exported_size(window, task["taskId"])
+    metrics = {"ExportedBytes": (exported_bytes, "Bytes"), "ExportWindowHours": (hours, "None")}
+    if "creationTime" in info and "completionTime" in info:
+        duration = max((info["completionTime"] - info["creationTime"]) / 1000, 1)
+        metrics["ExportTaskDuration"] = (duration, "Seconds")
+        metrics["ExportThroughput"] = (exported_bytes / duration, "Bytes/Second")
+
+        group = state["logGroups"].get(window["logGroup"])
+        if group is not None:
+            previous = group.get("secondsPerHour")
+            seconds_per_hour = duration / hours
+            if previous is not None:
+                seconds_per_hour = HISTORY_WEIGHT * seconds_per_hour + (1 - HISTORY_WEIGHT) * previous
+            group["secondsPerHour"] = seconds_per_hour
+            group["windowHours"] = window_size(seconds_per_hour)
+    put_metrics(window["logGroup"], metrics)
+
+
+def request_index(window):
+    """Invoke the export-indexer asynchronously; a lost index can be rebuilt by invoking it manually."""
+    payload = {
+        "logGroup": window["logGroup"],
+        "taskId": window["taskId"],
+        "destinationPrefix": destination_prefix(window),
+        "from": window["from"],
+        "to": window["to"],
+    }
+    try:
+        lambda_client.invoke(
+            FunctionName=INDEXER_FUNCTION_NAME,
+            InvocationType="Event",
+            Payload=json.dumps(payload).encode(),
+        )
+    except ClientError as e:
+        print(f"Index request for {describe_window(window)} failed: {e} (payload: {json.dumps(payload)})")
+
+
+def window_size(seconds_per_hour):
+    """Return the largest window size (hours) expected to export within TARGET_TASK_MINUTES."""
+    target_hours = TARGET_TASK_MINUTES * 60 / seconds_per_hour
+    sizes = [hours for hours in WINDOW_SIZES_HOURS if MIN_WINDOW_HOURS <= hours <= MAX_WINDOW_HOURS]
+    fitting = [hours for hours in sizes if hours <= target_hours]
+    return fitting[-1] if fitting else sizes[0]
+
+
+def exported_size(window, task_id):
+    """Return the bytes written by an export task (CloudWatch Logs writes under {prefix}/{taskId}/)."""
+    size = 0
+    kwargs = {"Bucket": S3_BUCKET_NAME, "Prefix": f"{destination_prefix(window)}/{task_id}/"}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        size += sum(obj["Size"] for obj in response.get("Contents", []))
+        if not response.get("IsTruncated"):
+            return size
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def put_metrics(log_group, metrics):
+    """Emit metrics in CloudWatch Embedded Metric Format; metrics maps name to (value, unit)."""
     print(
-        f"Export task created: {task_id} → s3://{S3_BUCKET_NAME}/{destination_prefix}"
+        json.dumps(
+            {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": METRICS_NAMESPACE,
+                            "Dimensions": [["LogGroup"]],
+                            "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()],
+                        }
+                    ],
+                },
+                "LogGroup": log_group,
+                **{name: value for name, (value, _) in metrics.items()},
+            }
+        )
     )
-    return {"status": "created", "taskId": task_id}
+
+
+def fail_window(state, window, reason):
+    """Queue a window for retry, or park it after MAX_ATTEMPTS."""
+    window["attempts"] += 1
+    window.update({"taskId": None, "lastError": reason})
+    if window["attempts"] >= MAX_ATTEMPTS:
+        print(f"Export of {describe_window(window)} failed {window['attempts']} times ({reason}); parked in 'failed'.")
+        state["failed"].append(window)
+    else:
+        print(f"Export of {describe_window(window)} failed ({reason}); queued for retry.")
+        state["retryQueue"].append(window)
+
+
+def find_task_id(name):
+    """Return the ID of a recent export task with this name, or None."""
+    kwargs = {}
+    for _ in range(TASK_LOOKUP_PAGES):
+        response = logs_client.describe_export_tasks(**kwargs)
+        for task in response["exportTasks"]:
+            if task.get("taskName") == name:
+                return task["taskId"]
+        if not response.get("nextToken"):
+            return None
+        kwargs["nextToken"] = response["nextToken"]
+    return None
+
+
+def backfill_start():
+    """Return the start of the first window (epoch ms), aligned to the window size."""
+    if BACKFILL_START:
+        start = datetime.datetime.fromisoformat(BACKFILL_START)
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=datetime.timezone.utc)
+    else:
+        start = utc_now() - datetime.timedelta(days=1)
+    window_ms = WINDOW_HOURS * 3600 * 1000
+    start_ms = int(start.timestamp() * 1000)
+    return start_ms - start_ms % window_ms
+
+
+def destination_prefix(window):
+    start = datetime.datetime.fromtimestamp(window["from"] / 1000, datetime.timezone.utc)
+    if len(LOG_GROUP_NAMES) == 1:
+        return f"{S3_PREFIX}/{start.strftime('%Y/%m/%d')}"
+    safe_group = window["logGroup"].strip("/").replace("/", "_")
+    return f"{S3_PREFIX}/{safe_group}/{start.strftime('%Y/%m/%d')}"
+
+
+def task_name(window):
+    start = datetime.datetime.fromtimestamp(window["from"] / 1000, datetime.timezone.utc)
+    safe_group = window["logGroup"].strip("/").replace("/", "_")
+    # Unique per attempt, so that only the task of this attempt is adopted by name
+    return f"export-{utc_now().strftime('%Y%m%dT%H%M%S%f')}-{start.strftime('%Y%m%dT%H%M')}-{safe_group}"[:512]
+
+
+def describe_window(window):
+    return f"{window['logGroup']} [{format_ms(window['from'])}, {format_ms(window['to'])})"
+
+
+def format_ms(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp / 1000, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%MZ")
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
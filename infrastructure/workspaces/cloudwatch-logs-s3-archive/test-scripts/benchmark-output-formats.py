@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Output Format Benchmark
+
+Runs the cwl-to-s3 Lambda handler locally on the same subscription payload
+with each OUTPUT_FORMAT and compares:
+
+- encode time per delivery (decode + serialize, S3 excluded)
+- object size
+- bytes an Athena query on "timestamp" and one JSON message field has to
+  scan: the whole object for the JSON formats, only the two column chunks
+  for Parquet
+- peak RSS of the Lambda process (includes importing pyarrow for Parquet)
+
+S3 PutObject calls are answered by a botocore event handler instead of AWS,
+so no credentials are needed. Each format runs in its own Python process
+because the handler reads its configuration at import time and peak RSS is
+per process.
+
+Usage:
+    python benchmark-output-formats.py [--events N] [--iterations N] [--json-fields FIELDS]
+
+Examples:
+    # Default: 10,000 events (a large delivery), 20 invocations per format
+    python benchmark-output-formats.py
+
+    # Extract more message fields into Parquet columns
+    python benchmark-output-formats.py --json-fields level,requestId,duration
+"""
+
+import argparse
+import base64
+import gzip
+import importlib.util
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src/lambda/cwl-to-s3")
+
+FORMATS = ["json", "ndjson-gz", "raw", "parquet"]
+# Column filtered on besides "timestamp" by the simulated query
+QUERY_FIELD = "level"
+
+
+def generate_event(events: int) -> dict:
+    """Generate a subscription event with Powertools-style JSON messages and some plain text lines"""
+    rng = random.Random(42)
+    log_events = []
+    for i in range(events):
+        timestamp = 1767225600000 + i * 37
+        if i % 5 == 4:
+            message = f"START RequestId: {rng.getrandbits(128):032x} Version: $LATEST"
+        else:
+            message = json.dumps(
+                {
+                    "level": rng.choice(["INFO", "INFO", "INFO", "WARNING", "ERROR"]),
+                    "location": "handler:42",
+                    "message": f"processed order {rng.randint(1, 10**6)} for customer {rng.randint(1, 10**4)}",
+                    "timestamp": timestamp,
+                    "service": "orders",
+                    "requestId": f"{rng.getrandbits(128):032x}",
+                    "duration": round(rng.uniform(1, 500), 2),
+                }
+            )
+        log_events.append({"id": str(36000000000000000000000000000000000000000000000000000000 + i), "timestamp": timestamp, "message": message})
+    payload = {
+        "messageType": "DATA_MESSAGE",
+        "owner": "123456789012",
+        "logGroup": "/aws/lambda/orders",
+        "logStream": "2026/01/01/[$LATEST]0123456789abcdef",
+        "subscriptionFilters": ["benchmark"],
+        "logEvents": log_events,
+    }
+    data = json.dumps(payload).encode()
+    return {"awslogs": {"data": base64.b64encode(gzip.compress(data)).decode()}}, len(data)
+
+
+def scanned_bytes(output_format: str, body: bytes, json_fields: list) -> int:
+    if output_format != "parquet":
+        return len(body)
+    import pyarrow.parquet as pq
+
+    metadata = pq.ParquetFile(io.BytesIO(body)).metadata
+    columns = {"timestamp", QUERY_FIELD if QUERY_FIELD in json_fields else "message"}
+    size = metadata.serialized_size
+    for group in range(metadata.num_row_groups):
+        row_group = metadata.row_group(group)
+        for column in range(row_group.num_columns):
+            chunk = row_group.column(column)
+            if chunk.path_in_schema in columns:
+                size += chunk.total_compressed_size
+    return size
+
+
+def run_child(args) -> None:
+    """Run one format and print the measurements as JSON"""
+    os.environ.update(
+        {
+            "S3_BUCKET_NAME": "benchmark-bucket",
+            "OUTPUT_FORMAT": args.child,
+            "PARQUET_JSON_FIELDS": args.json_fields,
+            "AWS_DEFAULT_REGION": "ap-northeast-1",
+            "AWS_ACCESS_KEY_ID": "benchmark",
+            "AWS_SECRET_ACCESS_KEY": "benchmark",
+        }
+    )
+    from botocore.awsrequest import AWSResponse
+
+    spec = importlib.util.spec_from_file_location("cwl_to_s3", os.path.join(LAMBDA_DIR, "index.py"))
+    index = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(index)
+
+    bodies = []
+
+    def capture(params, **kwargs):
+        bodies.append(params["Body"])
+
+    def respond(model, **kwargs):
+        return AWSResponse(None, 200, {}, None), {"ETag": '"benchmark"'}
+
+    index.s3_client.meta.events.register("provide-client-params.s3.PutObject", capture)
+    index.s3_client.meta.events.register("before-call.s3.PutObject", respond)
+
+    event, payload_size = generate_event(args.events)
+    durations = []
+    devnull = open(os.devnull, "w")
+    stdout = sys.stdout
+    for _ in range(args.iterations):
+        sys.stdout = devnull
+        start = time.perf_counter()
+        index.lambda_handler(event, None)
+        durations.append((time.perf_counter() - start) * 1000)
+        sys.stdout = stdout
+
+    body = bodies[-1]
+    json_fields = [field for field in args.json_fields.split(",") if field]
+    print(
+        json.dumps(
+            {
+                "format": args.child,
+                "payloadBytes": payload_size,
+                "medianMs": statistics.median(durations),
+                "objectBytes": len(body),
+                "scannedBytes": scanned_bytes(args.child, body, json_fields),
+                "peakRssMb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cwl-to-s3 output formats")
+    parser.add_argument("--events", type=int, default=10000, help="Log events per delivery (default: 10000)")
+    parser.add_argument("--iterations", type=int, default=20, help="Invocations per format (default: 20)")
+    parser.add_argument("--json-fields", default="level,requestId", help="PARQUET_JSON_FIELDS (default: level,requestId)")
+    parser.add_argument("--child", choices=FORMATS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = []
+    for output_format in FORMATS:
+        completed = subprocess.run(
+            [
+                sys.executable, __file__, "--child", output_format,
+                "--events", str(args.events),
+                "--iterations", str(args.iterations),
+                "--json-fields", args.json_fields,
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            print(f"✗ {output_format} failed:\n{completed.stderr}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    if not results:
+        sys.exit(1)
+    print(f"\nDelivery: {args.events:,} events, {results[0]['payloadBytes'] / 1024:,.0f} KB decompressed")
+    print(f"Query: timestamp + {QUERY_FIELD} (PARQUET_JSON_FIELDS={args.json_fields})\n")
+    baseline = next((result["scannedBytes"] for result in results if result["format"] == "json"), None)
+    print(f"{'Format':<10} {'Encode ms':>10} {'Object KB':>10} {'Scanned KB':>11} {'vs json':>8} {'Peak RSS MB':>12}")
+    for result in results:
+        ratio = f"{result['scannedBytes'] / baseline:.1%}" if baseline else "-"
+        print(
+            f"{result['format']:<10} {result['medianMs']:>10.1f} {result['objectBytes'] / 1024:>10.0f} "
+            f"{result['scannedBytes'] / 1024:>11.1f} {ratio:>8} {result['peakRssMb']:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
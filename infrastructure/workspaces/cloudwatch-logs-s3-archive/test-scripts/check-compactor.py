@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Compactor Checker
+
+Checks the compactor Lambda offline, against a local S3 stand-in (e.g. MinIO)
+instead of AWS:
+
+1. Deliveries written by cwl-to-s3 in every output format (json, ndjson-gz,
+   raw) are merged into compacted objects of up to the target size
+2. Every event is kept exactly once and the inputs are deleted
+3. Re-running changes nothing
+4. An interrupted run (inputs left after the manifest, or an output without
+   a manifest) is finished without duplicating events
+5. With COMPACTION_ENABLED, a retry of a compacted delivery is not written
+   again, and a single late delivery to a compacted hour is merged
+6. A backdated delivery to an hour outside LOOKBACK_HOURS is marked under
+   "_late/", and the next scheduled run compacts its hour and removes the
+   marker
+7. With KEY_LAYOUT=hive and MANIFEST_ENABLED, concurrent deliveries are all
+   listed in the per-hour manifest entries, and compaction merges the
+   compacted objects into "_manifest.json" and removes the entries
+
+Usage:
+    python check-compactor.py [--endpoint-url URL] [--bucket NAME]
+
+Examples:
+    # Start MinIO first
+    docker run --rm -p 9000:9000 -e MINIO_ROOT_USER=minioadmin -e MINIO_ROOT_PASSWORD=minioadmin \\
+        minio/minio server /data
+
+    python check-compactor.py --endpoint-url http://localhost:9000
+"""
+
+import argparse
+import base64
+import contextlib
+import datetime
+import gzip
+import importlib.util
+import io
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError, EndpointConnectionError
+except ImportError:
+    print("Error: boto3 is not installed. Please install it with: pip install boto3")
+    sys.exit(1)
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src/lambda")
+
+
+def load_function(name):
+    """Import src/lambda/<name>/index.py under its own module name"""
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), os.path.join(LAMBDA_DIR, name, "index.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class CompactorChecker:
+    """Runs the compactor checks and counts failures"""
+
+    def __init__(self, s3_client, bucket: str):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.failures = 0
+        self.event_ids = set()
+
+    def check(self, description: str, condition: bool) -> None:
+        if condition:
+            print(f"  ✓ {description}")
+        else:
+            print(f"  ✗ {description}")
+            self.failures += 1
+
+    def deliver(
+        self,
+        cwl_to_s3,
+        output_format: str,
+        count: int,
+        events_per_delivery: int,
+        workers: int = 1,
+        timestamp: int | None = None,
+    ) -> list:
+        """Invoke cwl-to-s3 with generated subscription payloads and return the events"""
+        cwl_to_s3.OUTPUT_FORMAT = output_format
+        events = []
+        for _ in range(count):
+            log_events = []
+            for _ in range(events_per_delivery):
+                event_id = str(random.getrandbits(120))
+                self.event_ids.add(event_id)
+                log_events.append(
+                    {
+                        "id": event_id,
+                        "timestamp": timestamp or int(time.time() * 1000),
+                        "message": f"level=INFO request={uuid.uuid4().hex} payload={os.urandom(24).hex()}",
+                    }
+                )
+            payload = {
+                "messageType": "DATA_MESSAGE",
+                "owner": "123456789012",
+                "logGroup": "/check/compactor",
+                "logStream": "2026/01/01/[$LATEST]check",
+                "subscriptionFilters": ["check"],
+                "logEvents": log_events,
+            }
+            events.append({"awslogs": {"data": base64.b64encode(gzip.compress(json.dumps(payload).encode())).decode()}})
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda event: cwl_to_s3.lambda_handler(event, None), events))
+        return events
+
+    def list_names(self, prefix: str):
+        paginator = self.s3.get_paginator("list_objects_v2")
+        return sorted(
+            obj["Key"][len(prefix):]
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix)
+            for obj in page.get("Contents", [])
+        )
+
+    def compacted_event_ids(self, prefix: str):
+        ids = []
+        for name in self.list_names(prefix):
+            if name.startswith("compacted-"):
+                body = self.s3.get_object(Bucket=self.bucket, Key=prefix + name)["Body"].read()
+                ids.extend(json.loads(line)["id"] for line in gzip.decompress(body).splitlines())
+        return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the compactor Lambda against a local S3 stand-in")
+    parser.add_argument("--endpoint-url", default="http://localhost:9000", help="S3 endpoint (default: http://localhost:9000)")
+    parser.add_argument("--bucket", default="cwl-archive-compactor-check", help="Bucket name (default: cwl-archive-compactor-check)")
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+            "AWS_ACCESS_KEY_ID": os.environ.get("AWS_ACCESS_KEY_ID", "minioadmin"),
+            "AWS_SECRET_ACCESS_KEY": os.environ.get("AWS_SECRET_ACCESS_KEY", "minioadmin"),
+            "S3_BUCKET_NAME": args.bucket,
+            "S3_PREFIX": "subscriptions",
+            "S3_ENDPOINT_URL": args.endpoint_url,
+            # Small target so that several compacted objects are written
+            "TARGET_OBJECT_SIZE_MB": "1",
+        }
+    )
+    s3_client = boto3.client("s3", endpoint_url=args.endpoint_url)
+    try:
+        s3_client.create_bucket(Bucket=args.bucket)
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+            raise
+    except EndpointConnectionError:
+        print(f"Error: S3 endpoint is not reachable at {args.endpoint_url}")
+        sys.exit(1)
+
+    cwl_to_s3 = load_function("cwl-to-s3")
+    cwl_to_s3.s3_client = s3_client
+    compactor = load_function("compactor")
+
+    checker = CompactorChecker(s3_client, args.bucket)
+    hour = datetime.datetime.utcnow().strftime("%Y/%m/%d/%H")
+    prefix = f"subscriptions/{hour}/"
+    # Start from an empty hour prefix
+    compactor.delete_keys([prefix + name for name in checker.list_names(prefix)])
+
+    print(f"\nCompaction of s3://{args.bucket}/{prefix}")
+    checker.deliver(cwl_to_s3, "json", 10, 500)
+    checker.deliver(cwl_to_s3, "ndjson-gz", 10, 500)
+    checker.deliver(cwl_to_s3, "raw", 10, 500)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = compactor.lambda_handler({"hour": hour}, None)
+    outputs = result["hours"][0]["outputs"]
+    names = checker.list_names(prefix)
+    ids = checker.compacted_event_ids(prefix)
+    checker.check(f"30 deliveries merged into {len(outputs)} objects", result["hours"][0]["inputs"] == 30)
+    checker.check("outputs are rolled at the target size", len(outputs) > 1)
+    checker.check("every event is kept exactly once", len(ids) == len(checker.event_ids) and set(ids) == checker.event_ids)
+    checker.check(
+        "only compacted objects and the manifest remain",
+        all(name.startswith(("compacted-", "_compaction-")) for name in names),
+    )
+
+    print("\nRe-run")
+    with contextlib.redirect_stdout(io.StringIO()):
+        compactor.lambda_handler({"hour": hour}, None)
+    checker.check("re-running changes nothing", checker.list_names(prefix) == names)
+
+    print("\nInterrupted runs")
+    checker.deliver(cwl_to_s3, "ndjson-gz", 5, 200)
+    original_delete_keys = compactor.delete_keys
+    compactor.delete_keys = lambda keys: None  # crash before the inputs are deleted
+    with contextlib.redirect_stdout(io.StringIO()):
+        compactor.lambda_handler({"hour": hour}, None)
+    compactor.delete_keys = original_delete_keys
+    s3_client.put_object(Bucket=args.bucket, Key=f"{prefix}compacted-orphan-0000.json.gz", Body=gzip.compress(b"{}\n"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = compactor.lambda_handler({"hour": hour}, None)
+    ids = checker.compacted_event_ids(prefix)
+    checker.check(
+        "inputs left after the manifest are deleted, not compacted again",
+        result["hours"][0]["inputs"] == 0 and len(ids) == len(set(ids)) == len(checker.event_ids),
+    )
+    checker.check("outputs without a manifest are removed", "compacted-orphan-0000.json.gz" not in checker.list_names(prefix))
+
+    print("\nRetries and late deliveries to a compacted hour")
+    cwl_to_s3.COMPACTION_ENABLED = True
+    closed_hour = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=2)
+    closed_prefix = f"subscriptions/{closed_hour:%Y/%m/%d/%H}/"
+    compactor.delete_keys([closed_prefix + name for name in checker.list_names(closed_prefix)])
+    closed_timestamp = int(closed_hour.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000) + 60000
+    events = checker.deliver(cwl_to_s3, "ndjson-gz", 3, 100, timestamp=closed_timestamp)
+    with contextlib.redirect_stdout(io.StringIO()):
+        compactor.lambda_handler({"hour": f"{closed_hour:%Y/%m/%d/%H}"}, None)
+        retry = cwl_to_s3.lambda_handler(events[0], None)
+    names = checker.list_names(closed_prefix)
+    checker.check(
+        "a retry of a compacted delivery is not written again",
+        retry["status"] == "duplicate" and not any(name.endswith(".json.gz") and not name.startswith("compacted-") for name in names),
+    )
+    checker.deliver(cwl_to_s3, "ndjson-gz", 1, 100, timestamp=closed_timestamp)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = compactor.lambda_handler({"hour": f"{closed_hour:%Y/%m/%d/%H}"}, None)
+    checker.check("a single late delivery is merged", result["hours"][0]["inputs"] == 1)
+
+    print("\nBackdated deliveries outside the lookback window")
+    old_hour = closed_hour - datetime.timedelta(days=5)
+    old_prefix = f"subscriptions/{old_hour:%Y/%m/%d/%H}/"
+    compactor.delete_keys([old_prefix + name for name in checker.list_names(old_prefix)])
+    old_timestamp = int(old_hour.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000) + 60000
+    checker.deliver(cwl_to_s3, "ndjson-gz", 3, 100, timestamp=old_timestamp)
+    markers = checker.list_names(f"subscriptions/_late/{old_hour:%Y/%m/%d/%H}/")
+    checker.check(f"every delivery is marked ({len(markers)}/3)", len(markers) == 3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = compactor.lambda_handler({}, None)
+    swept = [r for r in result["hours"] if r["hour"] == old_prefix]
+    checker.check("the marked hour is compacted", len(swept) == 1 and swept[0]["inputs"] == 3)
+    checker.check("the markers are removed", not checker.list_names(f"subscriptions/_late/{old_hour:%Y/%m/%d/%H}/"))
+    cwl_to_s3.COMPACTION_ENABLED = False
+
+    print("\nHive layout and hour manifest")
+    cwl_to_s3.KEY_LAYOUT = compactor.KEY_LAYOUT = "hive"
+    cwl_to_s3.MANIFEST_ENABLED = True
+    prefix = f"subscriptions/log_group=check_compactor/{datetime.datetime.utcnow():year=%Y/month=%m/day=%d/hour=%H}/"
+    compactor.delete_keys([prefix + name for name in checker.list_names(prefix)])
+    checker.event_ids = set()
+    checker.deliver(cwl_to_s3, "ndjson-gz", 20, 100, workers=8)
+    checker.deliver(cwl_to_s3, "raw", 5, 100, workers=4)
+    entries = cwl_to_s3.read_manifest(prefix)
+    listed = {entry["key"][len(prefix):] for entry in entries}
+    checker.check(
+        "concurrent deliveries are all listed in the manifest",
+        len(entries) == 25
+        and listed == {name for name in checker.list_names(prefix) if not name.startswith("_manifest/")},
+    )
+    checker.check("event counts are recorded", sum(entry["events"] for entry in entries) == len(checker.event_ids))
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = compactor.lambda_handler({"hour": hour}, None)
+    entries = cwl_to_s3.read_manifest(prefix)
+    checker.check(
+        "the log group prefix is compacted",
+        [r["hour"] for r in result["hours"]] == [prefix] and result["hours"][0]["inputs"] == 25,
+    )
+    checker.check(
+        "the manifest lists the compacted objects instead of the inputs",
+        {entry["key"][len(prefix):] for entry in entries} == {n for n in checker.list_names(prefix) if n.startswith("compacted-")}
+        and sum(entry["events"] for entry in entries) == len(checker.event_ids)
+        and all(entry["minTimestamp"] <= entry["maxTimestamp"] for entry in entries),
+    )
+    checker.check(
+        "the entries of the compacted objects are removed",
+        not any(name.startswith("_manifest/") for name in checker.list_names(prefix)),
+    )
+
+    print()
+    if checker.failures:
+        print(f"✗ {checker.failures} check(s) failed")
+        sys.exit(1)
+    print("✓ All checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Duplicate Delivery Checker
+
+Checks offline, against a local S3 stand-in (e.g. MinIO) instead of AWS,
+that cwl-to-s3 absorbs CloudWatch Logs retries in every output format:
+
+1. The same delivery always maps to the same key
+2. A retried delivery writes nothing and returns "duplicate"
+3. The DuplicateDeliveries metric is emitted (EMF) for every absorbed retry
+4. With MANIFEST_ENABLED, the object is listed in the hour manifest once
+
+Usage:
+    python check-duplicate-deliveries.py [--endpoint-url URL] [--bucket NAME]
+
+Examples:
+    # Start MinIO first
+    docker run --rm -p 9000:9000 -e MINIO_ROOT_USER=minioadmin -e MINIO_ROOT_PASSWORD=minioadmin \\
+        minio/minio server /data
+
+    python check-duplicate-deliveries.py --endpoint-url http://localhost:9000
+"""
+
+import argparse
+import base64
+import contextlib
+import gzip
+import importlib.util
+import io
+import json
+import os
+import random
+import sys
+import time
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError, EndpointConnectionError
+except ImportError:
+    print("Error: boto3 is not installed. Please install it with: pip install boto3")
+    sys.exit(1)
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src/lambda/cwl-to-s3")
+
+FORMATS = ["json", "ndjson-gz", "raw"]
+
+
+def generate_event(events: int) -> dict:
+    """Generate a subscription event with unique event IDs"""
+    now = int(time.time() * 1000)
+    payload = {
+        "messageType": "DATA_MESSAGE",
+        "owner": "123456789012",
+        "logGroup": "/check/duplicate-deliveries",
+        "logStream": "2026/01/01/[$LATEST]check",
+        "subscriptionFilters": ["check"],
+        "logEvents": [
+            {"id": str(random.getrandbits(180)), "timestamp": now + i, "message": f"event {i}"} for i in range(events)
+        ],
+    }
+    return {"awslogs": {"data": base64.b64encode(gzip.compress(json.dumps(payload).encode())).decode()}}
+
+
+def invoke(index, event):
+    """Invoke the handler and return its result and the EMF metric values it printed"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = index.lambda_handler(event, None)
+    metrics = [
+        json.loads(line).get("DuplicateDeliveries", 0)
+        for line in output.getvalue().splitlines()
+        if line.startswith('{"_aws"')
+    ]
+    return result, sum(metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that cwl-to-s3 absorbs retried deliveries")
+    parser.add_argument("--endpoint-url", default="http://localhost:9000", help="S3 endpoint (default: http://localhost:9000)")
+    parser.add_argument("--bucket", default="cwl-archive-duplicate-check", help="Bucket name (default: cwl-archive-duplicate-check)")
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+            "AWS_ACCESS_KEY_ID": os.environ.get("AWS_ACCESS_KEY_ID", "minioadmin"),
+            "AWS_SECRET_ACCESS_KEY": os.environ.get("AWS_SECRET_ACCESS_KEY", "minioadmin"),
+            "S3_BUCKET_NAME": args.bucket,
+            "MANIFEST_ENABLED": "true",
+        }
+    )
+    s3_client = boto3.client("s3", endpoint_url=args.endpoint_url)
+    try:
+        s3_client.create_bucket(Bucket=args.bucket)
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+            raise
+    except EndpointConnectionError:
+        print(f"Error: S3 endpoint is not reachable at {args.endpoint_url}")
+        sys.exit(1)
+
+    spec = importlib.util.spec_from_file_location("cwl_to_s3", os.path.join(LAMBDA_DIR, "index.py"))
+    index = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(index)
+    index.s3_client = s3_client
+
+    failures = 0
+
+    def check(description: str, condition: bool) -> None:
+        nonlocal failures
+        print(f"  {'✓' if condition else '✗'} {description}")
+        failures += 0 if condition else 1
+
+    for output_format in FORMATS:
+        print(f"\n{output_format}")
+        index.OUTPUT_FORMAT = output_format
+        event = generate_event(50)
+        first, first_duplicates = invoke(index, event)
+        retries = [invoke(index, event) for _ in range(2)]
+        check(
+            "first delivery is written",
+            first["status"] == "ok" and first_duplicates == 0,
+        )
+        check(
+            "retries map to the same key and write nothing",
+            all(result["status"] == "duplicate" and result["s3Key"] == first["s3Key"] for result, _ in retries),
+        )
+        check("DuplicateDeliveries is emitted for every retry", sum(count for _, count in retries) == 2)
+
+        prefix = first["s3Key"].rsplit("/", 1)[0] + "/"
+        listed = [entry for entry in index.read_manifest(prefix) if entry["key"] == first["s3Key"]]
+        check("the object is listed in the manifest once", len(listed) == 1 and listed[0]["events"] == 50)
+
+    print()
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("✓ All checks passed")
+
+
+if __name__ == "__main__":
+    main()
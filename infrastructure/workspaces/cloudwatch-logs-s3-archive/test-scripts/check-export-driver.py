@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Export Driver Checker
+
+Runs the export-task Lambda offline against a stubbed CloudWatch Logs API and
+an in-memory S3 for its state, through many scheduled invocations:
+
+1. Every window of every log group from BACKFILL_START is exported exactly
+   once; CreateExportTask is rejected while another task of the account runs
+2. Failed tasks are retried, and windows that keep failing are parked and
+   re-queued with {"retryFailed": true}
+3. Tasks of other exports in the account only delay the backfill
+4. An invocation interrupted after CreateExportTask adopts the task instead
+   of exporting the window twice
+5. An overlapping invocation stops instead of starting a second task
+6. The duration and exported bytes of every completed task are emitted as
+   EMF metrics, and the window size adapts per log group: hourly-scale for a
+   hot log group, MAX_WINDOW_HOURS for a quiet one
+
+Task durations are simulated as a fixed overhead plus the exported bytes
+divided by a throughput, with the exported bytes proportional to the window.
+
+No AWS credentials or local services are needed.
+
+Usage:
+    python check-export-driver.py [--days N] [--failure-rate R] [--seed N]
+
+Examples:
+    # Default: 30 days of 3 log groups, 20% of the tasks fail
+    python check-export-driver.py
+
+    python check-export-driver.py --days 90 --failure-rate 0.4 --seed 7
+"""
+
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import os
+import random
+import sys
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    print("Error: boto3 is not installed. Please install it with: pip install boto3")
+    sys.exit(1)
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src/lambda/export-task")
+
+LOG_GROUPS = ["/app/orders", "/app/payments", "/app/missing"]
+# CreateExportTask fails with ResourceNotFoundException for this group
+MISSING_LOG_GROUP = "/app/missing"
+# Bytes exported per hour of each log group
+BYTES_PER_HOUR = {"/app/orders": 4 * 1024**3, "/app/payments": 5 * 1024**2}
+HOT_LOG_GROUP = "/app/orders"
+QUIET_LOG_GROUP = "/app/payments"
+TASK_OVERHEAD_SECONDS = 120
+EXPORT_BYTES_PER_SECOND = 10 * 1024**2
+MAX_WINDOW_HOURS = 72
+
+
+def client_error(code: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+class FakeLogsClient:
+    """CloudWatch Logs export task API with one running task per account"""
+
+    def __init__(self, rng: random.Random, failure_rate: float, foreign_rate: float, s3: "FakeS3Client"):
+        self.rng = rng
+        self.s3 = s3
+        self.failure_rate = failure_rate
+        self.foreign_rate = foreign_rate
+        self.tasks = {}
+        self.crash_after_create = False
+
+    def _active(self):
+        return [task for task in self.tasks.values() if task["status"]["code"] in ("PENDING", "RUNNING")]
+
+    def _advance(self):
+        """Progress the active task by one poll; maybe start a foreign export"""
+        for task in self._active():
+            task["pollsLeft"] -= 1
+            if task["pollsLeft"] <= 0:
+                failed = self.rng.random() < self.failure_rate
+                task["status"] = {"code": "FAILED" if failed else "COMPLETED", "message": ""}
+                if not failed and not task["foreign"]:
+                    self._complete(task)
+        if not self._active() and self.rng.random() < self.foreign_rate:
+            self._add("foreign", "/other/team", 0, 0, foreign=True)
+
+    def _complete(self, task):
+        """Write the exported objects and the execution times of a completed task"""
+        exported = int(BYTES_PER_HOUR[task["logGroupName"]] * (task["to"] + 1 - task["from"]) / 3600000)
+        created = task["from"]
+        duration_ms = int((TASK_OVERHEAD_SECONDS + exported / EXPORT_BYTES_PER_SECOND) * 1000)
+        task["executionInfo"] = {"creationTime": created, "completionTime": created + duration_ms}
+        for part in range(3):
+            key = f"{task['destinationPrefix']}/{task['taskId']}/stream/{part:06d}.gz"
+            self.s3.sizes[key] = exported // 3 + (exported % 3 if part == 0 else 0)
+
+    def _add(self, name, log_group, from_time, to, foreign=False, destination_prefix=""):
+        task_id = f"task-{len(self.tasks):05d}"
+        self.tasks[task_id] = {
+            "taskId": task_id,
+            "taskName": name,
+            "logGroupName": log_group,
+            "from": from_time,
+            "to": to,
+            "status": {"code": "RUNNING"},
+            "pollsLeft": self.rng.randint(1, 4),
+            "foreign": foreign,
+            "destinationPrefix": destination_prefix,
+        }
+        return task_id
+
+    def create_export_task(self, taskName, logGroupName, fromTime, to, destination, destinationPrefix):
+        if self._active():
+            raise client_error("LimitExceededException", "CreateExportTask")
+        if logGroupName == MISSING_LOG_GROUP:
+            raise client_error("ResourceNotFoundException", "CreateExportTask")
+        task_id = self._add(taskName, logGroupName, fromTime, to, destination_prefix=destinationPrefix)
+        if self.crash_after_create:
+            self.crash_after_create = False
+            raise RuntimeError("simulated crash after CreateExportTask")
+        return {"taskId": task_id}
+
+    def describe_export_tasks(self, taskId=None, nextToken=None):
+        self._advance()
+        if taskId is not None:
+            return {"exportTasks": [dict(self.tasks[taskId])] if taskId in self.tasks else []}
+        # Newest first, 3 per page
+        tasks = sorted(self.tasks.values(), key=lambda task: task["taskId"], reverse=True)
+        start = int(nextToken or 0)
+        response = {"exportTasks": [dict(task) for task in tasks[start:start + 3]]}
+        if start + 3 < len(tasks):
+            response["nextToken"] = str(start + 3)
+        return response
+
+
+class FakeS3Client:
+    """get_object/put_object with ETag conditions for the driver state, list_objects_v2 for the exports"""
+
+    def __init__(self):
+        self.objects = {}
+        # Sizes of the objects written by export tasks
+        self.sizes = {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise client_error("NoSuchKey", "GetObject")
+        body, etag = self.objects[Key]
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, IfMatch=None, IfNoneMatch=None):
+        current = self.objects.get(Key)
+        if (IfNoneMatch == "*" and current) or (IfMatch and (not current or current[1] != IfMatch)):
+            raise client_error("PreconditionFailed", "PutObject")
+        etag = f'"{random.getrandbits(64):016x}"'
+        self.objects[Key] = (Body, etag)
+        return {"ETag": etag}
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        # 2 keys per page
+        keys = sorted(key for key in self.sizes if key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        response = {"Contents": [{"Key": key, "Size": self.sizes[key]} for key in keys[start:start + 2]]}
+        if start + 2 < len(keys):
+            response.update(IsTruncated=True, NextContinuationToken=str(start + 2))
+        return response
+
+
+class FakeLambdaContext:
+    """Lets every invocation run a few driver steps before the time reserve is reached"""
+
+    def __init__(self, steps: int):
+        self.calls = 0
+        self.steps = steps
+
+    def get_remaining_time_in_millis(self) -> int:
+        self.calls += 1
+        return 300000 if self.calls < self.steps else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the export-task driver against a stubbed Logs API")
+    parser.add_argument("--days", type=int, default=30, help="Days to backfill (default: 30)")
+    parser.add_argument("--failure-rate", type=float, default=0.2, help="Share of tasks that fail (default: 0.2)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    args = parser.parse_args()
+
+    start = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=args.days)).date()
+    os.environ.update(
+        {
+            "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "ap-northeast-1"),
+            "LOG_GROUP_NAMES": ",".join(LOG_GROUPS),
+            "S3_BUCKET_NAME": "export-driver-check",
+            "S3_PREFIX": "exports",
+            "BACKFILL_START": start.isoformat(),
+            "WINDOW_HOURS": "24",
+            "EXPORT_DELAY_MINUTES": "0",
+            "MAX_ATTEMPTS": "3",
+            "POLL_INTERVAL_SECONDS": "0",
+            "MIN_WINDOW_HOURS": "1",
+            "MAX_WINDOW_HOURS": str(MAX_WINDOW_HOURS),
+            "TARGET_TASK_MINUTES": "30",
+        }
+    )
+    spec = importlib.util.spec_from_file_location("export_task", os.path.join(LAMBDA_DIR, "index.py"))
+    index = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(index)
+
+    rng = random.Random(args.seed)
+    s3 = FakeS3Client()
+    logs = FakeLogsClient(rng, args.failure_rate, foreign_rate=0.1, s3=s3)
+    index.logs_client = logs
+    index.s3_client = s3
+
+    failures = 0
+
+    def check(description: str, condition: bool) -> None:
+        nonlocal failures
+        print(f"  {'✓' if condition else '✗'} {description}")
+        failures += 0 if condition else 1
+
+    def state():
+        return json.loads(s3.objects[index.STATE_KEY][0])
+
+    print(f"\nBackfill of {len(LOG_GROUPS)} log groups from {start} (failure rate {args.failure_rate:.0%})")
+    crashes = 0
+    invocations = 0
+    retried_failed = False
+    output = io.StringIO()
+    while invocations < 20000:
+        invocations += 1
+        # Interrupt every 25th invocation right after CreateExportTask
+        logs.crash_after_create = invocations % 25 == 0
+        try:
+            with contextlib.redirect_stdout(output):
+                result = index.lambda_handler({}, FakeLambdaContext(steps=rng.randint(1, 8)))
+        except RuntimeError:
+            crashes += 1
+            continue
+        current = state()
+        if result["status"] == "idle" and not current["retryQueue"]:
+            # Re-queue parked windows until only the missing log group is left
+            # (with a high failure rate, other windows can exhaust MAX_ATTEMPTS too)
+            parked_groups = {window["logGroup"] for window in current["failed"]}
+            if parked_groups - {MISSING_LOG_GROUP} or (parked_groups and not retried_failed):
+                parked = sum(1 for window in current["failed"] if window["logGroup"] == MISSING_LOG_GROUP)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    index.lambda_handler({"retryFailed": True}, FakeLambdaContext(steps=1))
+                retried_failed = True
+                continue
+            break
+
+    final = state()
+    completed = {}
+    for task in logs.tasks.values():
+        if not task["foreign"] and task["status"]["code"] == "COMPLETED":
+            completed.setdefault(task["logGroupName"], []).append((task["from"], task["to"] + 1))
+    start_ms = int(datetime.datetime.combine(start, datetime.time(), datetime.timezone.utc).timestamp() * 1000)
+    now_ms = int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000)
+
+    def tiles(windows, cursor):
+        """True if the windows cover [start_ms, cursor) without gaps or overlaps"""
+        windows = sorted(windows)
+        return bool(windows) and windows[0][0] == start_ms and windows[-1][1] == cursor and all(
+            previous[1] == current[0] for previous, current in zip(windows, windows[1:])
+        )
+
+    def next_window_end(group):
+        window_ms = group.get("windowHours", 24) * 3600 * 1000
+        return (group["cursor"] // window_ms + 1) * window_ms
+
+    print(f"  ({invocations} invocations, {len(logs.tasks)} tasks, {crashes} interrupted)")
+    check(
+        "every log group is exported up to the last complete window",
+        all(next_window_end(final["logGroups"][group]) > now_ms for group in LOG_GROUPS),
+    )
+    check(
+        "every window is exported exactly once",
+        set(completed) == set(BYTES_PER_HOUR)
+        and all(tiles(windows, final["logGroups"][group]["cursor"]) for group, windows in completed.items()),
+    )
+    check(
+        "failed tasks were retried",
+        any(task["status"]["code"] == "FAILED" for task in logs.tasks.values() if not task["foreign"]),
+    )
+    check("no window is left in flight or queued", not final["inFlight"] and not final["retryQueue"])
+    check(
+        "windows of a missing log group are parked, re-queued once, and parked again",
+        retried_failed
+        and len(final["failed"]) == parked
+        and all(window["logGroup"] == MISSING_LOG_GROUP for window in final["failed"]),
+    )
+
+    print("\nTelemetry and window size")
+    metrics = [json.loads(line) for line in output.getvalue().splitlines() if line.startswith('{"_aws"')]
+    exported = {
+        group: sum(metric["ExportedBytes"] for metric in metrics if metric["LogGroup"] == group)
+        for group in BYTES_PER_HOUR
+    }
+    check(
+        "duration and exported bytes are emitted once per completed task",
+        len(metrics) == sum(len(windows) for windows in completed.values())
+        and all(metric["ExportTaskDuration"] > 0 for metric in metrics),
+    )
+    check(
+        "exported bytes add up to the exported data",
+        all(
+            abs(exported[group] - BYTES_PER_HOUR[group] * (final["logGroups"][group]["cursor"] - start_ms) / 3600000)
+            < len(completed[group])
+            for group in BYTES_PER_HOUR
+        ),
+    )
+    hot_windows = [(to - from_time) // 3600000 for from_time, to in sorted(completed[HOT_LOG_GROUP])]
+    hot_durations = [
+        metric["ExportTaskDuration"] for metric in metrics if metric["LogGroup"] == HOT_LOG_GROUP
+    ]
+    windows = {group: final["logGroups"][group].get("windowHours") for group in BYTES_PER_HOUR}
+    print(f"  (window hours: {windows}; hot log group tasks: {hot_windows[:6]}...)")
+    check(
+        "the hot log group is exported in short windows that take about the target duration",
+        windows[HOT_LOG_GROUP] < 24 and max(hot_durations[-5:]) <= 30 * 60,
+    )
+    check("the quiet log group grows to MAX_WINDOW_HOURS", windows[QUIET_LOG_GROUP] == MAX_WINDOW_HOURS)
+
+    print("\nOverlapping invocation")
+    store = index.StateStore(index.S3_BUCKET_NAME, index.STATE_KEY)
+    overlapping = store.load()
+    with contextlib.redirect_stdout(io.StringIO()):
+        index.lambda_handler({"retryFailed": True}, FakeLambdaContext(steps=1))
+    try:
+        store.save(overlapping)
+        conflict = False
+    except index.StateConflictError:
+        conflict = True
+    check("a stale state is not written back", conflict)
+
+    print()
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("✓ All checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Exported Log Search
+
+Searches the objects written by export-task (Pattern B) for the lines of a
+log group in a time range, without downloading whole days:
+
+1. The time-range indexes written by export-indexer
+   ({prefix}/_index/{log group}/{from}-{to}-{taskId}.json) whose window
+   overlaps the range are loaded
+2. Only the objects whose min/max event time overlaps the range are fetched,
+   by a bounded thread pool
+3. Every object is decompressed as a stream and its lines are filtered on the
+   fly (time range and optional regular expression); nothing is written to disk
+
+With --no-index, every object under the day prefixes of the range is fetched
+instead (for exports made before the indexer was enabled, or to compare).
+
+Matching lines are printed in time order, prefixed with their log stream;
+statistics go to stderr.
+
+Usage:
+    python search-exports.py --bucket <BUCKET> --log-group <NAME> --start <TIME> [--end <TIME>] [--pattern <REGEX>]
+
+Examples:
+    # ERROR lines of one hour
+    python search-exports.py --bucket my-archive --log-group /app/orders \\
+        --start 2026-01-15T09:00 --pattern ERROR
+
+    # A request ID over a day, 16 parallel downloads, with a profile
+    python search-exports.py --bucket my-archive --log-group /app/orders \\
+        --start 2026-01-15 --end 2026-01-16 --pattern 3f2a9c --workers 16 --profile dev
+
+    # Same search without the index (fetches every object of the days)
+    python search-exports.py --bucket my-archive --log-group /app/orders \\
+        --start 2026-01-15T09:00 --pattern ERROR --no-index
+"""
+
+import argparse
+import datetime
+import json
+import re
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError, NoCredentialsError
+except ImportError:
+    print("Error: boto3 is not installed. Please install it with: pip install boto3")
+    sys.exit(1)
+
+CHUNK_SIZE = 1024 * 1024
+# Windows longer than a day are exported under the date of their first day
+# (export-task MAX_WINDOW_HOURS, default 72)
+NO_INDEX_LOOKBACK_DAYS = 3
+
+
+def parse_time(value: str) -> datetime.datetime:
+    parsed = datetime.datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def iso(value: datetime.datetime) -> bytes:
+    """Event time as it starts an exported line"""
+    return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:23].encode() + b"Z"
+
+
+class ExportSearcher:
+    """Selects exported objects through the index and filters them in parallel"""
+
+    def __init__(self, args):
+        session_kwargs = {}
+        if args.profile:
+            session_kwargs["profile_name"] = args.profile
+        if args.region:
+            session_kwargs["region_name"] = args.region
+        session = boto3.Session(**session_kwargs)
+        # One connection per worker
+        self.s3 = session.client(
+            "s3", endpoint_url=args.endpoint_url, config=Config(max_pool_connections=max(args.workers, 10))
+        )
+        self.bucket = args.bucket
+        self.prefix = args.prefix.rstrip("/")
+        self.log_group = args.log_group
+        self.safe_group = args.log_group.strip("/").replace("/", "_")
+        self.flat = args.flat
+        self.start = parse_time(args.start)
+        self.end = parse_time(args.end) if args.end else self.start + datetime.timedelta(hours=1)
+        self.start_line = iso(self.start)
+        self.end_line = iso(self.end)
+        self.pattern = (
+            re.compile(args.pattern.encode(), re.IGNORECASE if args.ignore_case else 0) if args.pattern else None
+        )
+        self.workers = args.workers
+        self.stats = {"indexes": 0, "objects": 0, "fetchedObjects": 0, "fetchedBytes": 0, "lines": 0, "matches": 0}
+
+    def list_keys(self, prefix: str):
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"], obj["Size"]
+
+    def indexed_objects(self):
+        """Return (key, stream) of the objects whose time range overlaps the search"""
+        candidates = []
+        for key, _ in self.list_keys(f"{self.prefix}/_index/{self.safe_group}/"):
+            name = key.rsplit("/", 1)[1]
+            window_from, window_to, _ = name.split("-", 2)
+            from_time = datetime.datetime.strptime(window_from, "%Y%m%dT%H%M").replace(tzinfo=datetime.timezone.utc)
+            to_time = datetime.datetime.strptime(window_to, "%Y%m%dT%H%M").replace(tzinfo=datetime.timezone.utc)
+            if from_time < self.end and to_time > self.start:
+                candidates.append(key)
+
+        def load(key):
+            return json.loads(self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read())
+
+        start_ms = int(self.start.timestamp() * 1000)
+        end_ms = int(self.end.timestamp() * 1000)
+        selected = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for index in executor.map(load, candidates):
+                self.stats["indexes"] += 1
+                for obj in index["objects"]:
+                    self.stats["objects"] += 1
+                    if obj["minTimestamp"] is None:
+                        continue
+                    if obj["minTimestamp"] < end_ms and obj["maxTimestamp"] >= start_ms:
+                        selected.append((index["prefix"] + obj["key"], obj["stream"]))
+        return selected
+
+    def listed_objects(self):
+        """Return (key, stream) of every object under the day prefixes of the search"""
+        group_prefix = self.prefix if self.flat else f"{self.prefix}/{self.safe_group}"
+        day = (self.start - datetime.timedelta(days=NO_INDEX_LOOKBACK_DAYS)).date()
+        selected = []
+        while day <= self.end.date():
+            day_prefix = f"{group_prefix}/{day:%Y/%m/%d}/"
+            for key, _ in self.list_keys(day_prefix):
+                parts = key[len(day_prefix):].split("/")
+                # {taskId}/{stream}/000000.gz; skips aws-logs-write-test
+                if len(parts) >= 3:
+                    selected.append((key, "/".join(parts[1:-1])))
+            day += datetime.timedelta(days=1)
+        self.stats["objects"] = len(selected)
+        return selected
+
+    def search_object(self, item):
+        """Stream one object and return its matching lines as (line, stream)"""
+        key, stream = item
+        matches = []
+        fetched = lines = 0
+        body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"]
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        pending = b""
+        for chunk in iter(lambda: body.read(CHUNK_SIZE), b""):
+            fetched += len(chunk)
+            while chunk:
+                data = pending + decompressor.decompress(chunk)
+                chunk = decompressor.unused_data
+                if chunk:
+                    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+                end = data.rfind(b"\n") + 1
+                pending = data[end:]
+                lines += data.count(b"\n", 0, end)
+                matches.extend((line, stream) for line in self.filter_lines(data[:end]))
+        if pending:
+            lines += 1
+            matches.extend((line, stream) for line in self.filter_lines(pending + b"\n"))
+        return matches, fetched, lines
+
+    def filter_lines(self, data: bytes):
+        """Yield the lines of a block of whole lines that match the time range and pattern"""
+        if self.pattern is None:
+            candidates = data.splitlines()
+        else:
+            # Search the whole block at C speed and only cut out the lines that match
+            candidates = []
+            position = 0
+            for match in self.pattern.finditer(data):
+                if match.start() < position:
+                    continue
+                line_start = data.rfind(b"\n", 0, match.start()) + 1
+                line_end = data.find(b"\n", match.end())
+                candidates.append(data[line_start:line_end])
+                position = line_end + 1
+        for line in candidates:
+            if self.start_line <= line[:24] < self.end_line:
+                yield line
+
+    def run(self, no_index: bool, limit: int):
+        started = time.perf_counter()
+        objects = self.listed_objects() if no_index else self.indexed_objects()
+        results = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for matches, fetched, lines in executor.map(self.search_object, objects):
+                self.stats["fetchedObjects"] += 1
+                self.stats["fetchedBytes"] += fetched
+                self.stats["lines"] += lines
+                results.extend(matches)
+        results.sort(key=lambda match: match[0][:24])
+        self.stats["matches"] = len(results)
+        for line, stream in results[:limit] if limit else results:
+            print(f"{stream}\t{line.decode(errors='replace')}")
+        self.stats["seconds"] = round(time.perf_counter() - started, 2)
+        print(json.dumps(self.stats), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search exported CloudWatch Logs in S3 through the time-range index")
+    parser.add_argument("--bucket", required=True, help="Archive bucket name")
+    parser.add_argument("--prefix", default="exports", help="Export S3 prefix (default: exports)")
+    parser.add_argument("--log-group", required=True, help="Log group name")
+    parser.add_argument("--start", required=True, help="Start of the range, ISO date or time (UTC unless an offset is given)")
+    parser.add_argument("--end", help="End of the range, exclusive (default: start + 1 hour)")
+    parser.add_argument("--pattern", help="Regular expression the lines must match")
+    parser.add_argument("--ignore-case", action="store_true", help="Match the pattern case-insensitively")
+    parser.add_argument("--workers", type=int, default=8, help="Parallel downloads (default: 8)")
+    parser.add_argument("--limit", type=int, default=0, help="Print at most N lines (default: all)")
+    parser.add_argument("--no-index", action="store_true", help="Fetch every object of the days instead of using the index")
+    parser.add_argument("--flat", action="store_true", help="With --no-index: exports of a single log group (no log group in the key)")
+    parser.add_argument("--profile", help="AWS profile name")
+    parser.add_argument("--region", help="AWS region")
+    parser.add_argument("--endpoint-url", help="S3 endpoint override (e.g. MinIO)")
+    args = parser.parse_args()
+
+    try:
+        ExportSearcher(args).run(args.no_index, args.limit)
+    except NoCredentialsError:
+        print("Error: No AWS credentials found. Please configure your credentials.")
+        sys.exit(1)
+    except ClientError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
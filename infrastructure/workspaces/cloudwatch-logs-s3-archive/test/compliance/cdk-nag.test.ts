@@ -220,14 +220,15 @@ function applyExportSuppressions(stack: cdk.Stack): void {
 
     // The Lambda execution role's DefaultPolicy grants logs:CreateExportTask and
     // logs:DescribeExportTasks on '*' because the CloudWatch Logs API does not
-    // support resource-level permissions for these two actions.
+    // support resource-level permissions for these two actions. It also grants
+    // read/write on the driver state objects under `{s3Prefix}/_state/*`.
     NagSuppressions.addResourceSuppressionsByPath(
         stack,
         `${pathPrefix}/ExportTaskFunction/ServiceRole/DefaultPolicy/Resource`,
         [
             {
                 id: 'AwsSolutions-IAM5',
-                reason: 'logs:CreateExportTask and logs:DescribeExportTasks do not support resource-level permissions; the wildcard resource is required by the CloudWatch Logs API.',
+                reason: 'logs:CreateExportTask and logs:DescribeExportTasks do not support resource-level permissions; the wildcard resource is required by the CloudWatch Logs API. The S3 wildcards are scoped to the driver state objects under the export prefix.',
             },
         ],
     );
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Event Routing Benchmark
+
+Times the routing of the cwlogs-to-sns Lambda (event_router.py) on a
+synthetic CloudWatch Logs delivery as the routing table grows, and compares
+it with one subscription filter + Lambda per rule (every rule decodes the
+payload again and searches every message for its own terms):
+
+- routed:   decode once, scan every message once with the combined matcher
+- per-rule: decode + search once per rule
+
+The rules route a few severity terms plus generated team terms
+("team<N>-alert") that occur in a share of the messages. Both approaches are
+checked to select the same events for every rule before timing.
+
+Usage:
+    python benchmark-event-router.py [--events N] [--rules N,N,...] [--rounds N]
+
+Examples:
+    # Default: 10,000 events, 1 / 10 / 50 / 200 rules, best of 3 rounds
+    python benchmark-event-router.py
+
+    # A larger delivery
+    python benchmark-event-router.py --events 50000 --rules 10,100
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "../../common/src/python-lambda/cwlogs-to-sns",
+)
+sys.path.insert(0, LAMBDA_DIR)
+
+from event_router import EventRouter, RoutingRule  # noqa: E402
+
+SEVERITY_TERMS = [["FATAL", "CRITICAL"], ["ERROR"], ["WARN"], ["timed out"], ["payment declined"]]
+LEVELS = ["INFO", "INFO", "INFO", "WARN", "ERROR", "FATAL"]
+WORDS = ["cache", "order", "payment", "session", "token", "retry", "queue", "worker", "shard", "lease"]
+TEAMS = 200
+
+
+def build_event(count: int, rng: random.Random) -> dict:
+    log_events = []
+    for index in range(count):
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+        message = f"{rng.choice(LEVELS)} request {rng.getrandbits(64):x} {words}"
+        if rng.random() < 0.2:
+            message += f" team{rng.randrange(TEAMS)}-alert"
+        if rng.random() < 0.05:
+            message += " timed out"
+        log_events.append({"id": str(index), "timestamp": index, "message": message})
+    payload = {"logGroup": "/benchmark/app", "logStream": "benchmark", "logEvents": log_events}
+    return {"awslogs": {"data": base64.b64encode(gzip.compress(json.dumps(payload).encode())).decode()}}
+
+
+def build_rules(count: int) -> list[RoutingRule]:
+    terms = SEVERITY_TERMS + [[f"team{index}-alert"] for index in range(TEAMS)]
+    return [
+        RoutingRule(name=f"rule-{index}", terms=terms[index], topic_arn=f"topic-{index}", ignore_case=index == 4)
+        for index in range(count)
+    ]
+
+
+def decode(event: dict) -> list:
+    return json.loads(gzip.decompress(base64.b64decode(event["awslogs"]["data"])))["logEvents"]
+
+
+def routed(event: dict, router: EventRouter) -> dict[str, int]:
+    routes, _ = router.route(decode(event))
+    return {topic_arn: len(route["events"]) for topic_arn, route in routes.items()}
+
+
+def per_rule(event: dict, rules: list[RoutingRule]) -> dict[str, int]:
+    counts = {}
+    for rule in rules:
+        log_events = decode(event)
+        matched = 0
+        for log_event in log_events:
+            message = log_event["message"].lower() if rule.ignore_case else log_event["message"]
+            if any(term in message for term in rule.terms):
+                matched += 1
+        if matched:
+            counts[rule.topic_arn] = matched
+    return counts
+
+
+def best_of(rounds: int, function, *args) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cwlogs-to-sns event routing")
+    parser.add_argument("--events", type=int, default=10000, help="Events in the delivery (default: 10000)")
+    parser.add_argument("--rules", default="1,10,50,200", help="Comma-separated routing table sizes (default: 1,10,50,200)")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds per size, best is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    args = parser.parse_args()
+
+    event = build_event(args.events, random.Random(args.seed))
+    decode_seconds = best_of(args.rounds, decode, event)
+    print(f"{args.events:,} events, decode {decode_seconds:.3f}s")
+    print(f"{'rules':>6} {'topics':>6} {'routed s':>9} {'per-rule s':>10} {'speedup':>8}")
+
+    for count in (int(value) for value in args.rules.split(",")):
+        rules = build_rules(min(count, len(SEVERITY_TERMS) + TEAMS))
+        router = EventRouter(rules)
+        expected = per_rule(event, rules)
+        if routed(event, router) != expected:
+            print(f"Error: routing with {len(rules)} rules differs from the per-rule search")
+            sys.exit(1)
+        routed_seconds = best_of(args.rounds, routed, event, router)
+        per_rule_seconds = best_of(args.rounds, per_rule, event, rules)
+        print(
+            f"{len(rules):>6} {len(expected):>6} {routed_seconds:>9.3f} {per_rule_seconds:>10.3f} "
+            f"{per_rule_seconds / routed_seconds:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Template Mining Benchmark
+
+Times the template mining of the cwlogs-to-sns Lambda (template_miner.py) on
+synthetic CloudWatch Logs deliveries of 1,000 / 10,000 / 50,000 events:
+
+- The payload is built like a subscription delivery (gzip + base64 JSON) and
+  decoded as the handler does, so the time includes decoding
+- Messages come from a fixed set of templates with variable fields (IDs,
+  numbers, IPs, durations, user names) plus a share of unique noise lines
+- Each size reports the best time of the rounds, the peak memory of decoding
+  and mining, the number of templates found, and whether the generating
+  templates were recovered as the top templates
+
+Lambda CPU scales with the configured memory (one vCPU at 1,769 MB), so the
+time is also projected for --memory-size (default 128 MB, the sns-basic
+functionMemorySize) and compared with --timeout (default 10 s, the
+functionTimeout).
+
+Usage:
+    python benchmark-template-miner.py [--sizes N,N,...] [--rounds N] [--memory-size MB] [--timeout SECONDS]
+
+Examples:
+    # Default: 1,000 / 10,000 / 50,000 events, best of 3 rounds
+    python benchmark-template-miner.py
+
+    # 5% noise lines and a 256 MB function
+    python benchmark-template-miner.py --noise 0.05 --memory-size 256
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "../../common/src/python-lambda/cwlogs-to-sns",
+)
+sys.path.insert(0, LAMBDA_DIR)
+
+from template_miner import TemplateMiner  # noqa: E402
+
+# Memory at which a Lambda function gets one full vCPU
+FULL_VCPU_MEMORY_MB = 1769
+USERS = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi"]
+WORDS = ["cache", "order", "payment", "session", "token", "retry", "queue", "worker", "shard", "lease"]
+
+# (template, field generator); fields go where "{}" is
+TEMPLATES = [
+    ("ERROR Connection to db-{} timed out after {}ms", lambda r: (r.randint(1, 9), r.randint(100, 30000))),
+    ("ERROR Failed to process order {} for user {}", lambda r: (uuid.UUID(int=r.getrandbits(128)), r.choice(USERS))),
+    ("WARN Retrying request {} (attempt {} of 5)", lambda r: (r.getrandbits(64), r.randint(1, 5))),
+    ("ERROR Upstream {} returned status {}", lambda r: (f"10.0.{r.randint(0, 255)}.{r.randint(0, 255)}", r.choice([500, 502, 503, 504]))),
+    ("ERROR Payment declined for customer {} amount {} JPY", lambda r: (r.choice(USERS), r.randint(100, 99999))),
+    ("WARN Slow query on table orders took {}s rows={}", lambda r: (round(r.uniform(1, 30), 2), r.randint(1, 10**6))),
+    ("ERROR Unhandled exception in handler {}: KeyError {}", lambda r: (r.choice(WORDS), r.choice(WORDS))),
+    ("ERROR Lease {} lost by worker {}", lambda r: (f"{r.getrandbits(32):08x}", r.randint(1, 64))),
+]
+
+
+def generate_messages(count: int, noise: float, rng: random.Random) -> list[str]:
+    weights = [2 ** (len(TEMPLATES) - index) for index in range(len(TEMPLATES))]
+    messages = []
+    for _ in range(count):
+        if rng.random() < noise:
+            messages.append(" ".join(rng.choice(WORDS) + rng.choice(USERS) for _ in range(rng.randint(3, 12))))
+            continue
+        template, fields = rng.choices(TEMPLATES, weights)[0]
+        messages.append(template.format(*fields(rng)))
+    return messages
+
+
+def build_event(messages: list[str]) -> dict:
+    timestamp = int(time.time() * 1000)
+    payload = {
+        "messageType": "DATA_MESSAGE",
+        "owner": "123456789012",
+        "logGroup": "/benchmark/app",
+        "logStream": "benchmark",
+        "subscriptionFilters": ["benchmark"],
+        "logEvents": [
+            {"id": str(index), "timestamp": timestamp + index, "message": message}
+            for index, message in enumerate(messages)
+        ],
+    }
+    return {"awslogs": {"data": base64.b64encode(gzip.compress(json.dumps(payload).encode())).decode()}}
+
+
+def mine(event: dict) -> TemplateMiner:
+    payload = json.loads(gzip.decompress(base64.b64decode(event["awslogs"]["data"])))
+    miner = TemplateMiner()
+    miner.add_all(event["message"] for event in payload["logEvents"])
+    return miner
+
+
+def recovered(miner: TemplateMiner) -> int:
+    """Count the generating templates found among the top templates"""
+    top = [entry["template"] for entry in miner.top(len(TEMPLATES))]
+    expected = [template.replace("{}", "<*>") for template, _ in TEMPLATES]
+    found = 0
+    for template in expected:
+        tokens = template.split()
+        for candidate in top:
+            candidate_tokens = candidate.split()
+            if len(candidate_tokens) == len(tokens) and all(
+                a == b or a == "<*>" for a, b in zip(candidate_tokens, tokens)
+            ):
+                found += 1
+                break
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cwlogs-to-sns template mining")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="Comma-separated batch sizes (default: 1000,10000,50000)")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds per size, best is reported (default: 3)")
+    parser.add_argument("--noise", type=float, default=0.02, help="Share of unique noise lines (default: 0.02)")
+    parser.add_argument("--memory-size", type=int, default=128, help="Lambda memory size in MB for the projection (default: 128)")
+    parser.add_argument("--timeout", type=float, default=10, help="Lambda timeout in seconds (default: 10)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    args = parser.parse_args()
+
+    cpu_share = min(args.memory_size / FULL_VCPU_MEMORY_MB, 1.0)
+    print(f"Projection: {args.memory_size} MB = {cpu_share:.2f} vCPU, timeout {args.timeout:g}s")
+    print(f"{'events':>8} {'best s':>8} {'events/s':>10} {'peak MB':>8} {'templates':>9} {'recovered':>9} {'projected s':>11} {'of timeout':>10}")
+
+    for size in (int(value) for value in args.sizes.split(",")):
+        event = build_event(generate_messages(size, args.noise, random.Random(args.seed)))
+        best = float("inf")
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            miner = mine(event)
+            best = min(best, time.perf_counter() - started)
+
+        tracemalloc.start()
+        mine(event)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        projected = best / cpu_share
+        print(
+            f"{size:>8} {best:>8.3f} {size / best:>10,.0f} {peak / 1024 / 1024:>8.1f} {len(miner.clusters):>9} "
+            f"{recovered(miner):>5}/{len(TEMPLATES):<3} {projected:>11.2f} {projected / args.timeout:>10.0%}"
+        )
+
+    print("\nTop templates of the last batch:")
+    for entry in miner.top(len(TEMPLATES)):
+        print(f"  {entry['count']:>6}  {entry['template']}")
+
+
+if __name__ == "__main__":
+    main()
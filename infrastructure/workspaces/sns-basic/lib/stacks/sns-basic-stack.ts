@@ -11,6 +11,8 @@ import * as lambdaEventSources from 'aws-cdk-lib/aws-lambda-event-sources';
 import * as logs from 'aws-cdk-lib/aws-logs';
 import * as logDestinations from 'aws-cdk-lib/aws-logs-destinations';
 import * as s3 from 'aws-cdk-lib/aws-s3';
+import * as scheduler from 'aws-cdk-lib/aws-scheduler';
+import * as schedulerTargets from 'aws-cdk-lib/aws-scheduler-targets';
 import * as sns from 'aws-cdk-lib/aws-sns';
 import * as snsSubscriptions from 'aws-cdk-lib/aws-sns-subscriptions';
 import * as sqs from 'aws-cdk-lib/aws-sqs';
@@ -59,6 +61,9 @@ export class SnsBasicStack extends cdk.Stack {
         const apiHandlerTimeout = snsBasicParams.apiHandlerTimeout ?? defaultSnsBasicConfig.apiHandlerTimeout;
         const cwLogsFilterPattern = snsBasicParams.cwLogsFilterPattern ?? defaultSnsBasicConfig.cwLogsFilterPattern;
         const cwLogsRetention = snsBasicParams.cwLogsRetention ?? defaultSnsBasicConfig.cwLogsRetention;
+        const cwLogsAlertMode = snsBasicParams.cwLogsAlertMode ?? defaultSnsBasicConfig.cwLogsAlertMode;
+        const cwLogsDigestWindow = snsBasicParams.cwLogsDigestWindow ?? defaultSnsBasicConfig.cwLogsDigestWindow;
+        const cwLogsRoutes = snsBasicParams.cwLogsRoutes ?? [];
         const firehoseBufferingInterval = snsBasicParams.firehoseBufferingInterval ?? defaultSnsBasicConfig.firehoseBufferingInterval;
         const firehoseBufferingSize = snsBasicParams.firehoseBufferingSize ?? defaultSnsBasicConfig.firehoseBufferingSize;
 
@@ -313,6 +318,21 @@ export class SnsBasicStack extends cdk.Stack {
             removalPolicy: cdk.RemovalPolicy.DESTROY,
         });
 
+        // Digest mode: delivery summaries per time window, shared by all
+        // cwlogs-to-sns containers; entries expire via TTL.
+        const digestTable = cwLogsAlertMode === 'digest'
+            ? new dynamodb.Table(this, 'LogAlertDigestTable', {
+                tableName: `${props.project}-${props.environment}-sns-basic-log-alert-digest`,
+                partitionKey: { name: 'window_start', type: dynamodb.AttributeType.NUMBER },
+                sortKey: { name: 'entry_id', type: dynamodb.AttributeType.STRING },
+                billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+                encryption: dynamodb.TableEncryption.AWS_MANAGED,
+                pointInTimeRecoverySpecification: { pointInTimeRecoveryEnabled: true },
+                timeToLiveAttribute: 'expires_at',
+                removalPolicy: cdk.RemovalPolicy.DESTROY,
+            })
+            : undefined;
+
         const cwLogsToSnsFunction = new lambda.Function(this, 'CwLogsToSnsFunction', {
             functionName: `${props.project}-${props.environment}-cwlogs-to-sns`,
             description: 'Decodes CloudWatch Logs subscription filter events and publishes a summary to the log-alert SNS topic',
@@ -323,6 +343,15 @@ export class SnsBasicStack extends cdk.Stack {
             timeout: functionTimeout,
             environment: {
                 TOPIC_ARN: logAlertTopic.topicArn,
+                ...(digestTable
+                    ? {
+                        ALERT_MODE: 'digest',
+                        DIGEST_TABLE_NAME: digestTable.tableName,
+                        DIGEST_WINDOW_SECONDS: String(cwLogsDigestWindow.toSeconds()),
+                    }
+                    : {}),
+                ...(cwLogsAlertMode === 'event' ? { ALERT_MODE: 'event' } : {}),
+                ...(cwLogsRoutes.length > 0 ? { ROUTING_RULES: JSON.stringify(cwLogsRoutes) } : {}),
             },
             logGroup: new logs.LogGroup(this, 'CwLogsToSnsFunctionLogGroup', {
                 retention: functionLogRetention,
@@ -334,6 +363,28 @@ export class SnsBasicStack extends cdk.Stack {
 
         logAlertTopic.grantPublish(cwLogsToSnsFunction);
 
+        if (cwLogsRoutes.length > 0) {
+            cwLogsToSnsFunction.addToRolePolicy(new iam.PolicyStatement({
+                actions: ['sns:Publish'],
+                resources: [...new Set(cwLogsRoutes.map((route) => route.topicArn))],
+            }));
+        }
+
+        if (digestTable) {
+            digestTable.grantReadWriteData(cwLogsToSnsFunction);
+            // Flushes the last window of a storm when no further delivery arrives
+            new scheduler.Schedule(this, 'LogAlertDigestFlushSchedule', {
+                scheduleName: `${props.project}-${props.environment}-sns-basic-log-alert-digest-flush`,
+                schedule: scheduler.ScheduleExpression.rate(cdk.Duration.minutes(1)),
+                description: 'Publishes the closed log-alert digest windows',
+                target: new schedulerTargets.LambdaInvoke(cwLogsToSnsFunction, {
+                    input: scheduler.ScheduleTargetInput.fromObject({ flush: true }),
+                    // A missed flush is picked up by the next run
+                    retryAttempts: 0,
+                }),
+            });
+        }
+
         // LambdaDestination automatically adds the Lambda::Permission that
         // allows logs.amazonaws.com to invoke the function.
         new logs.SubscriptionFilter(this, 'AppLogSubscriptionFilter', {
@@ -10,10 +10,40 @@ export const defaultSnsBasicConfig = {
     apiHandlerTimeout: cdk.Duration.seconds(10),
     cwLogsFilterPattern: '',
     cwLogsRetention: logs.RetentionDays.ONE_WEEK,
+    cwLogsAlertMode: 'summary' as 'summary' | 'digest' | 'event',
+    cwLogsDigestWindow: cdk.Duration.minutes(5),
     firehoseBufferingInterval: cdk.Duration.seconds(60),
     firehoseBufferingSize: cdk.Size.mebibytes(1),
 };
 
+/**
+ * One rule of the cwlogs-to-sns routing table.
+ */
+export interface CwLogsRoute {
+    /**
+     * Rule name, listed in the summaries of the events it matched.
+     */
+    readonly name: string;
+
+    /**
+     * Literal terms; an event matches the rule when its message contains one of them.
+     */
+    readonly terms: string[];
+
+    /**
+     * ARN of the SNS topic that receives the summary of the matching events.
+     * A topic encrypted with a customer managed key must allow the function
+     * to use the key.
+     */
+    readonly topicArn: string;
+
+    /**
+     * Match the terms case-insensitively.
+     * @default false
+     */
+    readonly ignoreCase?: boolean;
+}
+
 /**
  * Parameters for the sns-basic reference architecture.
  */
@@ -71,6 +101,34 @@ export interface SnsBasicParams {
      */
     readonly cwLogsRetention?: logs.RetentionDays;
 
+    /**
+     * How cwlogs-to-sns publishes to the log-alert topic:
+     * 'summary' publishes one message per subscription delivery;
+     * 'digest' aggregates deliveries per time window in a DynamoDB table and
+     * publishes one digest per window (counts per log group/stream and the
+     * top distinct messages), so an error storm cannot flood the topic;
+     * 'event' publishes one message per log event with SNS PublishBatch
+     * (10 per call, several calls in parallel).
+     * @default 'summary'
+     */
+    readonly cwLogsAlertMode?: 'summary' | 'digest' | 'event';
+
+    /**
+     * Length of a digest window ('digest' mode only).
+     * @default 5 minutes
+     */
+    readonly cwLogsDigestWindow?: cdk.Duration;
+
+    /**
+     * Routing table of cwlogs-to-sns ('summary' and 'event' modes): the events
+     * of a delivery are matched against all terms in one scan and published to
+     * the topics of the rules they match (one summary per topic, or one message
+     * per event); events that match no rule go to the log-alert topic.
+     * Replaces one subscription filter + Lambda per severity or team topic.
+     * @default - no routing, every event goes to the log-alert topic
+     */
+    readonly cwLogsRoutes?: CwLogsRoute[];
+
     /**
      * Firehose buffering interval before flushing to S3.
      * @default 60 seconds
@@ -1,7 +1,7 @@
 import * as cdk from 'aws-cdk-lib/core';
 import { Construct } from 'constructs';
 import { Environment } from "@common/parameters/environments";
-import { defaultLambdaConfig , defaultFirehoseS3Config, defaultSqsConfig ,defaultLambdaEventSourceConfig } from 'lib/types';
+import { defaultLambdaConfig , defaultFirehoseS3Config, defaultSqsConfig ,defaultLambdaEventSourceConfig, defaultDedupConfig } from 'lib/types';
 import { EnvParams } from 'parameters/environments';
 import * as sqs from 'aws-cdk-lib/aws-sqs';
 import * as pytonLambda from '@aws-cdk/aws-lambda-python-alpha';
@@ -14,6 +14,7 @@ import * as logs from 'aws-cdk-lib/aws-logs'
 import * as sns from 'aws-cdk-lib/aws-sns';
 import * as cloudwatchActions from "aws-cdk-lib/aws-cloudwatch-actions";
 import * as cw from 'aws-cdk-lib/aws-cloudwatch';
+import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 
 export interface SqsLambdaFirehoseStackProps extends cdk.StackProps {
   readonly project: string;
@@ -30,6 +31,7 @@ export class SqsLambdaFirehoseStack extends cdk.Stack {
     const sqsLambdaIntegrationParams = params.sqsLambdaIntegration;
     const lambdaFunctionParams = params.lambdaFunction;
     const firehoseParams = params.firehose;
+    const dedupParams = params.dedup || {};
 
     // Create a dead-letter queue
     const deadLetterQueue = new sqs.Queue(this, 'SqsFirehoseDeadLetterQueue', {
@@ -164,13 +166,36 @@ export class SqsLambdaFirehoseStack extends cdk.Stack {
       },
     });
 
+    // Dynamic partitioning keys (name -> JSON path in the message body)
+    const dynamicPartitionKeys = firehoseParams.dynamicPartitionKeys || {};
+    const dynamicPartitionKeyNames = Object.keys(dynamicPartitionKeys);
+    const dynamicPartitioningEnabled = dynamicPartitionKeyNames.length > 0;
+    // Record field holding the keys; passed to the Lambda function (PARTITION_KEY_FIELD) and used by the JQ query
+    const partitionKeyField = 'partition_keys';
+    // With dynamic partitioning, every key must appear in the prefix: a prefix without any
+    // partitionKeyFromQuery expression gets the key segments prepended, a partial one is rejected
+    let dataOutputPrefix = firehoseParams.dataOutputPrefix || defaultFirehoseS3Config.dataOutputPrefix;
+    if (dynamicPartitioningEnabled) {
+      if (!dataOutputPrefix.includes('!{partitionKeyFromQuery:')) {
+        dataOutputPrefix = `${dynamicPartitionKeyNames.map((name) => `${name}=!{partitionKeyFromQuery:${name}}`).join('/')}/${dataOutputPrefix}`;
+      }
+      const missingKeyNames = dynamicPartitionKeyNames.filter((name) => !dataOutputPrefix.includes(`!{partitionKeyFromQuery:${name}}`));
+      if (missingKeyNames.length > 0) {
+        throw new Error(`firehose.dataOutputPrefix must contain !{partitionKeyFromQuery:<name>} for every dynamic partition key, missing: ${missingKeyNames.join(', ')}`);
+      }
+    }
+    const bufferingSize = firehoseParams.bufferingSize || defaultFirehoseS3Config.bufferingSize;
+
     // Setting up Firehose to deliver to S3
     const s3Destination = new firehose.S3Bucket(s3Bucket, {
-      dataOutputPrefix: firehoseParams.dataOutputPrefix || defaultFirehoseS3Config.dataOutputPrefix,
+      dataOutputPrefix: dataOutputPrefix,
       errorOutputPrefix: firehoseParams.errorOutputPrefix || defaultFirehoseS3Config.errorOutputPrefix,
       timeZone: firehoseParams.timeZone || defaultFirehoseS3Config.timeZone,
       bufferingInterval: firehoseParams.bufferingInterval || defaultFirehoseS3Config.bufferingInterval,
-      bufferingSize: firehoseParams.bufferingSize || defaultFirehoseS3Config.bufferingSize,
+      // Dynamic partitioning requires a buffering size of at least 64 MiB
+      bufferingSize: dynamicPartitioningEnabled
+        ? cdk.Size.mebibytes(Math.max(64, bufferingSize.toMebibytes()))
+        : bufferingSize,
       role: firehoseRole,
     });
     // Create a Firehose delivery stream
@@ -178,6 +203,36 @@ export class SqsLambdaFirehoseStack extends cdk.Stack {
       destination: s3Destination,
       encryption: firehose.StreamEncryption.awsOwnedKey(),
     });
+    if (dynamicPartitioningEnabled) {
+      // The L2 S3 destination does not support dynamic partitioning yet, so use the L1 escape hatch
+      const cfnDeliveryStream = firehoseDeliveryStream.node.defaultChild as firehose.CfnDeliveryStream;
+      cfnDeliveryStream.addPropertyOverride('ExtendedS3DestinationConfiguration.DynamicPartitioningConfiguration', {
+        Enabled: true,
+        RetryOptions: { DurationInSeconds: 300 },
+      });
+      cfnDeliveryStream.addPropertyOverride('ExtendedS3DestinationConfiguration.ProcessingConfiguration', {
+        Enabled: true,
+        Processors: [
+          // Split packed records (FIREHOSE_RECORD_PACKING) back into one JSON record per message
+          {
+            Type: 'RecordDeAggregation',
+            Parameters: [{ ParameterName: 'SubRecordType', ParameterValue: 'JSON' }],
+          },
+          // The keys are precomputed by the Lambda function, so the query is a plain lookup
+          {
+            Type: 'MetadataExtraction',
+            Parameters: [
+              {
+                ParameterName: 'MetadataExtractionQuery',
+                ParameterValue: `{${dynamicPartitionKeyNames.map((name) => `${name}: .${partitionKeyField}.${name}`).join(', ')}}`,
+              },
+              { ParameterName: 'JsonParsingEngine', ParameterValue: 'JQ-1.6' },
+            ],
+          },
+          { Type: 'AppendDelimiterToRecord' },
+        ],
+      });
+    }
 
 
     // Create a Lambda function
@@ -228,6 +283,36 @@ export class SqsLambdaFirehoseStack extends cdk.Stack {
     }));
     // Grant the Lambda function permissions to put records into the Firehose delivery stream
     firehoseDeliveryStream.grantPutRecords(lambdaFunction);
+    if (dynamicPartitioningEnabled) {
+      lambdaFunction.addEnvironment('PARTITION_KEY_PATHS', Object.entries(dynamicPartitionKeys)
+        .map(([name, path]) => `${name}=${path}`).join(','));
+      lambdaFunction.addEnvironment('PARTITION_KEY_FIELD', partitionKeyField);
+    }
+
+    // Skip redelivered messages already delivered to Firehose (if enabled)
+    const dedupSharedStoreEnabled = dedupParams.sharedStoreEnabled ?? defaultDedupConfig.sharedStoreEnabled;
+    if (dedupSharedStoreEnabled || (dedupParams.enabled ?? defaultDedupConfig.enabled)) {
+      lambdaFunction.addEnvironment('DEDUP_ENABLED', 'true');
+    }
+
+    // Create a DynamoDB table of delivered message IDs shared by all containers (if enabled)
+    if (dedupSharedStoreEnabled) {
+      const dedupTable = new dynamodb.Table(this, 'SqsFirehoseDedupTable', {
+        partitionKey: { name: 'message_id', type: dynamodb.AttributeType.STRING },
+        billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+        encryption: dynamodb.TableEncryption.AWS_MANAGED,
+        timeToLiveAttribute: 'expires_at',
+        removalPolicy: cdk.RemovalPolicy.DESTROY,
+      });
+      dedupTable.grant(lambdaFunction, 'dynamodb:GetItem', 'dynamodb:BatchWriteItem');
+      lambdaFunction.addEnvironment('DEDUP_TABLE_NAME', dedupTable.tableName);
+      lambdaFunction.addEnvironment('DEDUP_TTL_SECONDS', (dedupParams.ttl || defaultDedupConfig.ttl).toSeconds().toString());
+
+      new cdk.CfnOutput(this, 'DedupTableName', {
+        value: dedupTable.tableName,
+        description: 'Name of the DynamoDB table of delivered message IDs',
+      });
+    }
 
     // Create a Lambda function for failures
     const lambdaFunctionFailure = new pytonLambda.PythonFunction(this, 'SqsFirehoseFunctionFailure', {
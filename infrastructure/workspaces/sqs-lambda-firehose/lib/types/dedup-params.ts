@@ -0,0 +1,32 @@
+import * as cdk from 'aws-cdk-lib';
+
+export const defaultDedupConfig = {
+    enabled: false,
+    sharedStoreEnabled: false,
+    ttl: cdk.Duration.days(1),
+};
+
+/**
+ * Redelivery dedup parameters
+ * Message IDs delivered to Firehose are kept per Lambda container and,
+ * when the shared store is enabled, in a DynamoDB table shared by all containers.
+ */
+export interface DedupParams {
+    /**
+     * Skip redelivered messages already delivered to Firehose (DEDUP_ENABLED)
+     * Implied by sharedStoreEnabled
+     * @default false
+     */
+    readonly enabled?: boolean;
+    /**
+     * Create a DynamoDB table shared by all containers (DEDUP_TABLE_NAME)
+     * @default false
+     */
+    readonly sharedStoreEnabled?: boolean;
+    /**
+     * How long a delivered message ID is remembered (DEDUP_TTL_SECONDS)
+     * Should cover the SQS retention period of redelivered messages
+     * @default 1 day
+     */
+    readonly ttl?: cdk.Duration;
+}
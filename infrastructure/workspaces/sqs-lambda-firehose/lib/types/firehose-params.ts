@@ -37,4 +37,17 @@ export interface FirehoseS3Params {
      * @default 5 MiBytes
      */
     readonly bufferingSize?: cdk.Size;
+    /**
+     * Dynamic Partitioning Keys
+     * Partition key name (letters, digits and underscores) -> dotted path in the JSON message body,
+     * e.g. { region: 'data.region', category: 'data.category' }.
+     * The Lambda function adds the keys to each record (PARTITION_KEY_PATHS) and Firehose
+     * reads them with a JQ metadata extraction query. A data output prefix without any
+     * !{partitionKeyFromQuery:...} expression gets the key segments prepended, e.g.
+     * "region=!{partitionKeyFromQuery:region}/.../!{timestamp:yyyy/MM/dd}/"; a prefix that
+     * references only some of the keys fails synthesis. The buffering size is raised to the
+     * 64 MiB minimum of dynamic partitioning.
+     * @default undefined (no dynamic partitioning)
+     */
+    readonly dynamicPartitionKeys?: Record<string, string>;
 }
\ No newline at end of file
@@ -1,3 +1,4 @@
 export * from './sqs-params';
 export * from './lambda-params';
 export * from './firehose-params';
+export * from './dedup-params';
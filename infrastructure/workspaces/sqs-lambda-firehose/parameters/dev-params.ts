@@ -72,6 +72,10 @@ const devParams: EnvParams = {
     timeZone: cdk.TimeZone.ASIA_TOKYO,
     bufferingInterval: cdk.Duration.minutes(1),
     bufferingSize: cdk.Size.mebibytes(1),
+    // Partition S3 output by region and category (raises bufferingSize to 64 MiB).
+    // The key segments are prepended to dataOutputPrefix:
+    // "region=!{partitionKeyFromQuery:region}/category=!{partitionKeyFromQuery:category}/!{timestamp:yyyy/MM/dd}/"
+    // dynamicPartitionKeys: { region: 'data.region', category: 'data.category' },
   },
 };
 
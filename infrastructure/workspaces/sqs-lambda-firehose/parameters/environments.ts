@@ -1,7 +1,8 @@
 import { 
     SqsLambdaIntegrationParams, 
     LambdaFunctionParams,
-    FirehoseS3Params
+    FirehoseS3Params,
+    DedupParams
 } from 'lib/types';
 import { Environment, EnvironmentConfig  } from "@common/parameters/environments";
 
@@ -12,6 +13,7 @@ export interface EnvParams extends EnvironmentConfig {
     readonly sqsLambdaIntegration: SqsLambdaIntegrationParams;
     readonly lambdaFunction: LambdaFunctionParams;
     readonly firehose: FirehoseS3Params;
+    readonly dedup?: DedupParams;
 }
 
 // Object to store parameters for each environment
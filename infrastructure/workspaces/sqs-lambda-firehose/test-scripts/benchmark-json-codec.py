@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+JSON Codec Micro-benchmark
+
+Compares the stdlib and orjson codecs of the sqs-firehose-powertools Lambda
+on the enrichment path (parse message body -> wrap with SQS metadata ->
+serialize as a JSON line), using payloads shaped like the ones
+send-sqs-messages.py generates. The outputs of both codecs are checked to be
+byte-identical before timing.
+
+Usage:
+    python benchmark-json-codec.py [--count N] [--rounds N]
+
+Examples:
+    # Default: 10,000 messages, best of 5 rounds
+    python benchmark-json-codec.py
+
+    # Larger sample
+    python benchmark-json-codec.py --count 50000 --rounds 3
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "../../../common/src/python-lambda/sqs-firehose-powertools",
+)
+sys.path.insert(0, LAMBDA_DIR)
+
+from json_codec import OrjsonCodec, StdlibJsonCodec, orjson  # noqa: E402
+
+SAMPLE_PRODUCTS = ["Laptop", "Smartphone", "Tablet", "Monitor", "Keyboard", "ノートパソコン"]
+SAMPLE_CATEGORIES = ["Electronics", "Computers", "Audio", "Video", "Accessories"]
+SAMPLE_STATUSES = ["pending", "processing", "completed", "failed", "cancelled"]
+SAMPLE_REGIONS = ["us-east-1", "us-west-2", "ap-northeast-1", "ap-southeast-1", "eu-west-1"]
+
+
+def generate_body(index: int) -> str:
+    """Generate a message body in the format of send-sqs-messages.py"""
+    quantity = random.randint(1, 100)
+    price = round(random.uniform(10.0, 1000.0), 2)
+    message = {
+        "messageId": str(uuid.uuid4()),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "sequenceNumber": index,
+        "data": {
+            "product": random.choice(SAMPLE_PRODUCTS),
+            "category": random.choice(SAMPLE_CATEGORIES),
+            "quantity": quantity,
+            "price": price,
+            "total": round(quantity * price, 2),
+            "status": random.choice(SAMPLE_STATUSES),
+            "region": random.choice(SAMPLE_REGIONS),
+        },
+        "metadata": {"source": "test-script", "version": "1.0", "environment": "test"},
+    }
+    return json.dumps(message)
+
+
+def enrich(codec: StdlibJsonCodec, records: List[Dict[str, Any]]) -> List[bytes]:
+    """Run the record_handler enrichment path for every record"""
+    lines = []
+    for record in records:
+        lines.append(
+            codec.dumps_line(
+                {
+                    "message_id": record["messageId"],
+                    "timestamp": record["attributes"]["SentTimestamp"],
+                    "approximate_receive_count": record["attributes"]["ApproximateReceiveCount"],
+                    "data": codec.loads(record["body"]),
+                }
+            )
+        )
+    return lines
+
+
+def best_of(rounds: int, codec: StdlibJsonCodec, records: List[Dict[str, Any]]) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        enrich(codec, records)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sqs-firehose-powertools JSON codecs")
+    parser.add_argument("--count", type=int, default=10000, help="Number of messages (default: 10000)")
+    parser.add_argument("--rounds", type=int, default=5, help="Number of timed rounds (default: 5)")
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("Error: orjson is not installed. Please install it with: pip install orjson")
+        sys.exit(1)
+
+    records = [
+        {
+            "messageId": str(uuid.uuid4()),
+            "body": generate_body(i),
+            "attributes": {"SentTimestamp": str(int(time.time() * 1000)), "ApproximateReceiveCount": "1"},
+        }
+        for i in range(args.count)
+    ]
+    payload_bytes = sum(len(r["body"].encode("utf-8")) for r in records)
+
+    stdlib_codec = StdlibJsonCodec()
+    orjson_codec = OrjsonCodec()
+
+    stdlib_lines = enrich(stdlib_codec, records)
+    orjson_lines = enrich(orjson_codec, records)
+    mismatches = sum(1 for a, b in zip(stdlib_lines, orjson_lines) if a != b)
+    if mismatches:
+        print(f"✗ {mismatches} of {args.count} records differ between codecs")
+        sys.exit(1)
+    print(f"✓ Output is byte-identical for {args.count} records ({payload_bytes / 1024:.1f} KiB of bodies)")
+
+    stdlib_time = best_of(args.rounds, stdlib_codec, records)
+    orjson_time = best_of(args.rounds, orjson_codec, records)
+
+    print()
+    print(f"{'codec':<8} {'total (ms)':>12} {'per record (µs)':>16}")
+    for name, elapsed in (("stdlib", stdlib_time), ("orjson", orjson_time)):
+        print(f"{name:<8} {elapsed * 1000:>12.1f} {elapsed / args.count * 1e6:>16.2f}")
+    print()
+    print(f"Speedup: {stdlib_time / orjson_time:.2f}x (best of {args.rounds} rounds)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+X-Ray Tracing Level Benchmark
+
+Runs the sqs-firehose-powertools Lambda handler locally on the same SQS batch
+with each tracing level and compares the invocation duration:
+
+- disabled: POWERTOOLS_TRACE_DISABLED=true (baseline)
+- record:   TRACING_LEVEL=record (a subsegment per record)
+- batch:    TRACING_LEVEL=batch (invocation and Firehose flush only)
+- sampled:  TRACING_LEVEL=batch with TRACING_RECORD_SAMPLE_RATE=--sample-rate
+
+Firehose calls are answered by a botocore event handler instead of AWS, so no
+credentials are needed. The Lambda environment is emulated so that the X-Ray
+SDK builds real segments; they are emitted over UDP to AWS_XRAY_DAEMON_ADDRESS
+(default 127.0.0.1:2000), where nothing needs to be listening.
+
+Each level runs in its own Python process because the handler reads its
+configuration at import time.
+
+Usage:
+    python benchmark-tracing.py [--batch-size N] [--invocations N] [--send-mode MODE]
+
+Examples:
+    # Default: batches of 1,000 messages, 20 invocations, "batch" send mode
+    python benchmark-tracing.py
+
+    # One PutRecord per message (adds a botocore subsegment per message at every level)
+    python benchmark-tracing.py --send-mode record --batch-size 100
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Dict, List
+
+LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "../../../common/src/python-lambda/sqs-firehose-powertools",
+)
+
+LEVELS = ["disabled", "record", "batch", "sampled"]
+
+
+class FakeLambdaContext:
+    """Minimal LambdaContext for local invocations"""
+
+    function_name = "sqs-firehose-benchmark"
+    function_version = "$LATEST"
+    invoked_function_arn = "arn:aws:lambda:ap-northeast-1:123456789012:function:sqs-firehose-benchmark"
+    memory_limit_in_mb = 1024
+    aws_request_id = "benchmark"
+    log_group_name = "/aws/lambda/sqs-firehose-benchmark"
+    log_stream_name = "benchmark"
+
+    def get_remaining_time_in_millis(self) -> int:
+        return 300000
+
+
+def generate_event(batch_size: int) -> Dict[str, Any]:
+    """Generate an SQS event with messages in the format of send-sqs-messages.py"""
+    records = []
+    for i in range(batch_size):
+        body = {
+            "messageId": str(uuid.uuid4()),
+            "sequenceNumber": i,
+            "data": {"product": "Laptop", "quantity": i % 100 + 1, "price": 999.99, "status": "pending"},
+            "metadata": {"source": "test-script", "version": "1.0", "environment": "test"},
+        }
+        records.append(
+            {
+                "messageId": str(uuid.uuid4()),
+                "receiptHandle": "benchmark",
+                "body": json.dumps(body),
+                "attributes": {
+                    "ApproximateReceiveCount": "1",
+                    "SentTimestamp": str(int(time.time() * 1000)),
+                },
+                "messageAttributes": {},
+                "md5OfBody": "",
+                "eventSource": "aws:sqs",
+                "eventSourceARN": "arn:aws:sqs:ap-northeast-1:123456789012:benchmark",
+                "awsRegion": "ap-northeast-1",
+            }
+        )
+    return {"Records": records}
+
+
+def stub_firehose(client) -> None:
+    """Answer Firehose calls locally; the patched botocore call is still traced."""
+    from botocore.awsrequest import AWSResponse
+
+    def remember_record_count(params, context, **kwargs):
+        context["record_count"] = len(params.get("Records", []))
+
+    def respond(model, context, **kwargs):
+        if model.name == "PutRecordBatch":
+            count = context.get("record_count", 0)
+            parsed = {
+                "FailedPutCount": 0,
+                "Encrypted": False,
+                "RequestResponses": [{"RecordId": str(i)} for i in range(count)],
+            }
+        else:
+            parsed = {"RecordId": "0", "Encrypted": False}
+        return AWSResponse(None, 200, {}, None), parsed
+
+    client.meta.events.register("before-parameter-build.firehose", remember_record_count)
+    client.meta.events.register("before-call.firehose", respond)
+
+
+def run_worker(level: str, batch_size: int, invocations: int) -> None:
+    """Invoke the handler in this process and print the durations (ms) as JSON"""
+    result_stream = sys.stdout
+    # Logs and EMF metrics go to stdout in Lambda; keep them out of the result
+    sys.stdout = open(os.devnull, "w")
+
+    sys.path.insert(0, LAMBDA_DIR)
+    import index  # noqa: E402
+
+    stub_firehose(index.firehose_client)
+    event = generate_event(batch_size)
+    context = FakeLambdaContext()
+
+    durations: List[float] = []
+    for i in range(invocations + 1):
+        # A new trace per invocation, as the Lambda service would set it
+        os.environ["_X_AMZN_TRACE_ID"] = (
+            f"Root=1-{int(time.time()):08x}-{uuid.uuid4().hex[:24]};Parent={uuid.uuid4().hex[:16]};Sampled=1"
+        )
+        started = time.perf_counter()
+        response = index.lambda_handler(event, context)
+        elapsed = (time.perf_counter() - started) * 1000
+        if response["batchItemFailures"]:
+            raise RuntimeError(f"Unexpected failures: {len(response['batchItemFailures'])}")
+        if i > 0:  # first invocation is a warm-up (cold start)
+            durations.append(elapsed)
+
+    print(json.dumps(durations), file=result_stream)
+
+
+def run_level(level: str, args: argparse.Namespace) -> List[float]:
+    """Run one tracing level in a child process"""
+    env = dict(os.environ)
+    env.update(
+        {
+            "AWS_DEFAULT_REGION": env.get("AWS_DEFAULT_REGION", "ap-northeast-1"),
+            "AWS_ACCESS_KEY_ID": "benchmark",
+            "AWS_SECRET_ACCESS_KEY": "benchmark",
+            "AWS_LAMBDA_FUNCTION_NAME": FakeLambdaContext.function_name,
+            "LAMBDA_TASK_ROOT": LAMBDA_DIR,
+            "AWS_XRAY_DAEMON_ADDRESS": env.get("AWS_XRAY_DAEMON_ADDRESS", "127.0.0.1:2000"),
+            "AWS_XRAY_CONTEXT_MISSING": "IGNORE_ERROR",
+            "POWERTOOLS_LOG_LEVEL": "WARNING",
+            "FIREHOSE_DELIVERY_STREAM_NAME": "benchmark-stream",
+            "FIREHOSE_SEND_MODE": args.send_mode,
+            "POWERTOOLS_TRACE_DISABLED": "true" if level == "disabled" else "false",
+            "TRACING_LEVEL": "record" if level in ("disabled", "record") else "batch",
+            "TRACING_RECORD_SAMPLE_RATE": str(args.sample_rate if level == "sampled" else 0),
+        }
+    )
+    output = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--worker",
+            level,
+            "--batch-size",
+            str(args.batch_size),
+            "--invocations",
+            str(args.invocations),
+        ],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the X-Ray tracing levels of sqs-firehose-powertools")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Messages per batch (default: 1000)")
+    parser.add_argument("--invocations", type=int, default=20, help="Timed invocations per level (default: 20)")
+    parser.add_argument(
+        "--send-mode", choices=["record", "batch"], default="batch", help="FIREHOSE_SEND_MODE (default: batch)"
+    )
+    parser.add_argument(
+        "--sample-rate", type=float, default=0.01, help="Record sample rate of the sampled level (default: 0.01)"
+    )
+    parser.add_argument("--worker", choices=LEVELS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.batch_size, args.invocations)
+        return
+
+    print(
+        f"Batch size: {args.batch_size}, invocations: {args.invocations}, send mode: {args.send_mode}"
+    )
+    print()
+    print(f"{'level':<10} {'median (ms)':>12} {'p90 (ms)':>10} {'vs disabled':>12}")
+
+    baseline = None
+    for level in LEVELS:
+        try:
+            durations = run_level(level, args)
+        except subprocess.CalledProcessError as e:
+            print(f"✗ {level} failed:\n{e.stderr}")
+            sys.exit(1)
+        median = statistics.median(durations)
+        p90 = statistics.quantiles(durations, n=10)[-1] if len(durations) > 1 else median
+        baseline = baseline or median
+        print(f"{level:<10} {median:>12.1f} {p90:>10.1f} {median / baseline:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Dedup Store Checker
+
+Checks the redelivery dedup layer of the sqs-firehose-powertools Lambda
+offline, against DynamoDB Local instead of AWS:
+
+1. LocalDedupCache: TTL expiry and LRU eviction
+2. DynamoDBDedupStore: batched writes, lookups and expired items
+3. Handler: a batch redelivered to a new container (empty local cache) is
+   skipped through the shared store and not sent to Firehose again
+4. Handler: records sent before an invocation is interrupted are skipped
+   when the batch is redelivered
+
+Firehose calls are answered by a botocore event handler, so no AWS
+credentials are needed.
+
+Usage:
+    python check-dedup-store.py [--endpoint-url URL] [--table-name NAME]
+
+Examples:
+    # Start DynamoDB Local first
+    docker run --rm -p 8000:8000 amazon/dynamodb-local
+
+    # Run the checks (the table is created if it does not exist)
+    python check-dedup-store.py --endpoint-url http://localhost:8000
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, Dict, List
+
+try:
+    import boto3
+    from botocore.awsrequest import AWSResponse
+    from botocore.exceptions import ClientError, EndpointConnectionError
+except ImportError:
+    print("Error: boto3 is not installed. Please install it with: pip install boto3")
+    sys.exit(1)
+
+LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "../../../common/src/python-lambda/sqs-firehose-powertools",
+)
+
+
+class DedupChecker:
+    """Runs the dedup checks and counts failures"""
+
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, description: str, condition: bool) -> None:
+        if condition:
+            print(f"  ✓ {description}")
+        else:
+            print(f"  ✗ {description}")
+            self.failures += 1
+
+
+def ensure_table(client, table_name: str) -> None:
+    """Create the dedup table as deployed by the stack, if it does not exist"""
+    try:
+        client.describe_table(TableName=table_name)
+        return
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ResourceNotFoundException":
+            raise
+    client.create_table(
+        TableName=table_name,
+        KeySchema=[{"AttributeName": "message_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "message_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    client.get_waiter("table_exists").wait(TableName=table_name)
+    print(f"✓ Created table: {table_name}")
+
+
+def check_local_cache(checker: DedupChecker) -> None:
+    from dedup_store import LocalDedupCache
+
+    print("\nLocalDedupCache")
+    now = [1000.0]
+    cache = LocalDedupCache(max_entries=3, ttl_seconds=60, clock=lambda: now[0])
+    cache.add_many(["a", "b", "c"])
+    checker.check("delivered IDs are found", cache.contains("a") and cache.contains("c"))
+    checker.check("unknown IDs are not found", not cache.contains("x"))
+
+    # "a" was used last, so "b" is the least recently used
+    cache.contains("a")
+    cache.add_many(["d"])
+    checker.check("least recently used ID is evicted", not cache.contains("b") and cache.contains("a"))
+    checker.check("cache size is bounded", len(cache) == 3)
+
+    now[0] += 61
+    checker.check("IDs expire after the TTL", not cache.contains("a") and len(cache) == 2)
+
+
+def check_shared_store(checker: DedupChecker, client, table_name: str) -> None:
+    from dedup_store import DynamoDBDedupStore
+
+    print("\nDynamoDBDedupStore")
+    store = DynamoDBDedupStore(table_name, ttl_seconds=3600, client=client)
+    message_ids = [str(uuid.uuid4()) for _ in range(60)]
+    store.add_many(message_ids)
+    checker.check(
+        "IDs written in several BatchWriteItem calls are found",
+        all(store.contains(message_id) for message_id in message_ids[::7]),
+    )
+    checker.check("unknown IDs are not found", not store.contains(str(uuid.uuid4())))
+
+    expired_id = str(uuid.uuid4())
+    client.put_item(
+        TableName=table_name,
+        Item={"message_id": {"S": expired_id}, "expires_at": {"N": str(int(time.time()) - 1)}},
+    )
+    checker.check("expired items not yet deleted by TTL are ignored", not store.contains(expired_id))
+
+
+def generate_event(count: int, receive_count: int, message_ids: List[str]) -> Dict[str, Any]:
+    """Generate an SQS event with messages in the format of send-sqs-messages.py"""
+    return {
+        "Records": [
+            {
+                "messageId": message_ids[i],
+                "receiptHandle": "check",
+                "body": json.dumps({"sequenceNumber": i, "data": {"product": "Laptop", "quantity": i + 1}}),
+                "attributes": {
+                    "ApproximateReceiveCount": str(receive_count),
+                    "SentTimestamp": str(int(time.time() * 1000)),
+                },
+                "messageAttributes": {},
+                "md5OfBody": "",
+                "eventSource": "aws:sqs",
+                "eventSourceARN": "arn:aws:sqs:ap-northeast-1:123456789012:check",
+                "awsRegion": "ap-northeast-1",
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def check_handler(checker: DedupChecker) -> None:
+    # Handler logs and EMF metrics go to stdout; the logger binds its stream at import
+    devnull = open(os.devnull, "w")
+    with contextlib.redirect_stdout(devnull):
+        import index
+
+    print("\nHandler")
+    sent: List[int] = []
+
+    def respond(model, **kwargs):
+        sent.append(1)
+        return AWSResponse(None, 200, {}, None), {"RecordId": "0", "Encrypted": False}
+
+    index.firehose_client.meta.events.register("before-call.firehose", respond)
+
+    class FakeLambdaContext:
+        function_name = "check-dedup-store"
+        memory_limit_in_mb = 256
+        invoked_function_arn = "arn:aws:lambda:ap-northeast-1:123456789012:function:check-dedup-store"
+        aws_request_id = "check"
+
+        def get_remaining_time_in_millis(self) -> int:
+            return 30000
+
+    message_ids = [str(uuid.uuid4()) for _ in range(5)]
+    with contextlib.redirect_stdout(devnull):
+        response = index.lambda_handler(generate_event(5, 1, message_ids), FakeLambdaContext())
+    checker.check("first delivery sends every record", len(sent) == 5 and not response["batchItemFailures"])
+
+    # Same messages redelivered to another container
+    index.dedup_store.local.clear()
+    sent.clear()
+    with contextlib.redirect_stdout(devnull):
+        response = index.lambda_handler(generate_event(5, 2, message_ids), FakeLambdaContext())
+    checker.check("redelivered records are skipped via the shared store", len(sent) == 0)
+    checker.check("skipped records are reported as successful", not response["batchItemFailures"])
+
+    new_ids = [str(uuid.uuid4()) for _ in range(5)]
+    sent.clear()
+    with contextlib.redirect_stdout(devnull):
+        index.lambda_handler(generate_event(5, 2, new_ids), FakeLambdaContext())
+    checker.check("redelivered records that were never delivered are sent", len(sent) == 5)
+
+    # The invocation dies (e.g. times out) after two records were sent
+    class Interrupted(BaseException):
+        pass
+
+    def interrupt(model, **kwargs):
+        if len(sent) == 2:
+            raise Interrupted()
+        return respond(model, **kwargs)
+
+    index.firehose_client.meta.events.unregister("before-call.firehose", respond)
+    index.firehose_client.meta.events.register("before-call.firehose", interrupt)
+    interrupted_ids = [str(uuid.uuid4()) for _ in range(5)]
+    sent.clear()
+    with contextlib.redirect_stdout(devnull), contextlib.suppress(Interrupted):
+        index.lambda_handler(generate_event(5, 1, interrupted_ids), FakeLambdaContext())
+    index.firehose_client.meta.events.unregister("before-call.firehose", interrupt)
+    index.firehose_client.meta.events.register("before-call.firehose", respond)
+
+    index.dedup_store.local.clear()
+    sent.clear()
+    with contextlib.redirect_stdout(devnull):
+        index.lambda_handler(generate_event(5, 2, interrupted_ids), FakeLambdaContext())
+    checker.check("records sent before an interrupted invocation are skipped", len(sent) == 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the dedup store against DynamoDB Local")
+    parser.add_argument(
+        "--endpoint-url", default="http://localhost:8000", help="DynamoDB endpoint (default: http://localhost:8000)"
+    )
+    parser.add_argument(
+        "--table-name", default="sqs-firehose-dedup-check", help="Dedup table name (default: sqs-firehose-dedup-check)"
+    )
+    args = parser.parse_args()
+
+    # Configure the handler before it is imported; DynamoDB Local accepts any credentials
+    os.environ.update(
+        {
+            "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "ap-northeast-1"),
+            "AWS_ACCESS_KEY_ID": "local",
+            "AWS_SECRET_ACCESS_KEY": "local",
+            "POWERTOOLS_TRACE_DISABLED": "true",
+            "POWERTOOLS_LOG_LEVEL": "WARNING",
+            "FIREHOSE_DELIVERY_STREAM_NAME": "check-stream",
+            "DEDUP_ENABLED": "true",
+            "DEDUP_TABLE_NAME": args.table_name,
+            "DEDUP_ENDPOINT_URL": args.endpoint_url,
+        }
+    )
+    sys.path.insert(0, LAMBDA_DIR)
+
+    client = boto3.client("dynamodb", endpoint_url=args.endpoint_url)
+    try:
+        ensure_table(client, args.table_name)
+    except EndpointConnectionError:
+        print(f"Error: DynamoDB Local is not reachable at {args.endpoint_url}")
+        sys.exit(1)
+
+    checker = DedupChecker()
+    check_local_cache(checker)
+    check_shared_store(checker, client, args.table_name)
+    check_handler(checker)
+
+    print()
+    if checker.failures:
+        print(f"✗ {checker.failures} check(s) failed")
+        sys.exit(1)
+    print("✓ All checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import json
+import os
 import boto3
 import base64
 import gzip
@@ -7,15 +8,16 @@ from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
 # from aws_lambda_powertools.logging.formatters.datadog import DatadogLogFormatter
-from aws_xray_sdk.core import patch_all
+
+# Libraries instrumented by X-Ray (comma-separated); only the AWS SDK is patched by default
+TRACING_PATCH_MODULES = [
+    module.strip() for module in os.environ.get("TRACING_PATCH_MODULES", "botocore").split(",") if module.strip()
+]
 
 logger = Logger(service="natgw-scheduler")
-tracer = Tracer(service="natgw-scheduler")
+tracer = Tracer(service="natgw-scheduler", patch_modules=TRACING_PATCH_MODULES)
 metrics = Metrics(namespace="NatgwScheduler", service="natgw-scheduler")
 
-# Initialize X-Ray SDK
-patch_all()
-
 
 @logger.inject_lambda_context(log_event=True)
 @tracer.capture_lambda_handler
@@ -398,7 +398,7 @@ export class WafLogReportingAthenaReportStack extends cdk.Stack {
             new iam.PolicyStatement({
                 actions: [
                     'athena:StartQueryExecution',
-                    'athena:GetQueryExecution',
+                    'athena:BatchGetQueryExecution',
                     'athena:GetQueryResults',
                     'athena:StopQueryExecution',
                 ],
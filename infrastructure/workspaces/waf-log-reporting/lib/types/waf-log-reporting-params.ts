@@ -39,8 +39,9 @@ export const defaultReportConfig = {
     locale: 'ja' as const,
     notificationEmail: 'change-me@example.com',
     functionMemorySize: 256,
-    // Both report Lambdas run several sequential Logs Insights / Athena
-    // queries per invocation, each of which can itself take up to ~60s.
+    // Both report Lambdas run several Logs Insights / Athena queries per
+    // invocation concurrently; the slowest one can itself take up to ~60s
+    // (Logs Insights) or ~120s (Athena), plus waiting for a free query slot.
     functionTimeout: cdk.Duration.minutes(5),
     functionLogRetention: logs.RetentionDays.ONE_MONTH,
 };
@@ -7,7 +7,7 @@ breakdown, top rules/IPs/countries/URIs, a day-over-day anomaly check), and
 publishes it to an SNS topic.
 
 Unlike the CloudWatch Logs Insights version (see the cwlogs-report Lambda),
-`query_count_mode_rules` here uses `CROSS JOIN UNNEST` to count every
+`count_mode_rules_sql` here uses `CROSS JOIN UNNEST` to count every
 COUNT-mode rule match per request exactly, including requests that matched
 more than one COUNT-mode rule.
 
@@ -24,6 +24,10 @@ Environment variables:
   ANOMALY_THRESHOLD_PERCENT - Request-volume increase (%) that triggers an
                                anomaly warning (default 50).
   LOCALE                    - Report language: "ja" or "en" (default "ja").
+
+All queries of a report are submitted at once and tracked by one polling loop
+(see `run_athena_queries`), so a report takes about as long as its slowest
+query rather than the sum of all of them.
 """
 
 import json
@@ -33,6 +37,7 @@ import time
 from datetime import date, datetime, timedelta, timezone
 
 import boto3
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -50,35 +55,101 @@ ANOMALY_THRESHOLD_PERCENT = float(os.environ.get("ANOMALY_THRESHOLD_PERCENT", "5
 LOCALE = os.environ.get("LOCALE", "ja")
 
 QUERY_TIMEOUT_SECONDS = 120
-POLL_INTERVAL_SECONDS = 2
+# Time left at the overall deadline to stop the queries and publish the report
+TIME_RESERVE_SECONDS = 15
+# The poll interval grows while no query finishes and resets when one does
+POLL_INTERVAL_MIN_SECONDS = 0.5
+POLL_INTERVAL_MAX_SECONDS = 5
+POLL_BACKOFF_FACTOR = 1.5
+ACTIVE_STATES = ("QUEUED", "RUNNING")
+# BatchGetQueryExecution accepts up to 50 IDs per call
+BATCH_GET_MAX_IDS = 50
+THROTTLING_ERROR_CODES = ("ThrottlingException", "TooManyRequestsException")
 
 TABLE_FQN = f'"{DATABASE}"."{TABLE}"'
 
 
-def run_athena_query(sql: str) -> list[dict]:
-    start = athena.start_query_execution(
-        QueryString=sql,
-        QueryExecutionContext={"Database": DATABASE},
-        WorkGroup=WORKGROUP,
-    )
-    query_execution_id = start["QueryExecutionId"]
-
-    deadline = time.monotonic() + QUERY_TIMEOUT_SECONDS
-    state = "QUEUED"
-    status = {}
-    while state in ("QUEUED", "RUNNING") and time.monotonic() < deadline:
-        execution = athena.get_query_execution(QueryExecutionId=query_execution_id)
-        status = execution["QueryExecution"]["Status"]
-        state = status["State"]
-        if state in ("QUEUED", "RUNNING"):
-            time.sleep(POLL_INTERVAL_SECONDS)
-
-    if state != "SUCCEEDED":
-        if state in ("QUEUED", "RUNNING"):
-            athena.stop_query_execution(QueryExecutionId=query_execution_id)
-        reason = status.get("StateChangeReason", "unknown reason")
-        raise RuntimeError(f"Athena query did not succeed (state={state}, reason={reason}): {sql}")
-
+def run_athena_queries(queries: dict[str, str], deadline: float | None = None) -> dict[str, list[dict]]:
+    """
+    Run {key: sql} and return {key: rows}.
+
+    Every query is submitted up front; a submission refused with
+    TooManyRequestsException (the account's concurrent-query quota) is retried
+    on the next round. One loop tracks all executions, up to 50 per
+    BatchGetQueryExecution call, sleeping longer while none finishes and
+    backing off further when throttled. If a query fails, is cancelled or runs
+    longer than QUERY_TIMEOUT_SECONDS, or queries are still pending or running
+    at `deadline` (time.monotonic()), the queries still queued or running are
+    stopped and RuntimeError is raised.
+    """
+    pending = list(queries)
+    running: dict[str, tuple[str, float]] = {}
+    results = {}
+    interval = POLL_INTERVAL_MIN_SECONDS
+    try:
+        while pending or running:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise RuntimeError(
+                    f"Athena queries did not finish in time: {len(pending)} not submitted, {len(running)} running"
+                )
+            while pending:
+                try:
+                    start = athena.start_query_execution(
+                        QueryString=queries[pending[0]],
+                        QueryExecutionContext={"Database": DATABASE},
+                        WorkGroup=WORKGROUP,
+                    )
+                except athena.exceptions.TooManyRequestsException:
+                    break
+                running[start["QueryExecutionId"]] = (pending.pop(0), time.monotonic() + QUERY_TIMEOUT_SECONDS)
+
+            completed = throttled = False
+            execution_ids = list(running)
+            for offset in range(0, len(execution_ids), BATCH_GET_MAX_IDS):
+                try:
+                    response = athena.batch_get_query_execution(
+                        QueryExecutionIds=execution_ids[offset : offset + BATCH_GET_MAX_IDS]
+                    )
+                except ClientError as e:
+                    if e.response["Error"]["Code"] not in THROTTLING_ERROR_CODES:
+                        raise
+                    throttled = True
+                    break
+                # Unprocessed IDs stay in `running` and are checked again next round
+                for execution in response["QueryExecutions"]:
+                    execution_id = execution["QueryExecutionId"]
+                    key, query_deadline = running[execution_id]
+                    status = execution["Status"]
+                    state = status["State"]
+                    if state == "SUCCEEDED":
+                        del running[execution_id]
+                        results[key] = get_query_rows(execution_id)
+                        completed = True
+                    elif state not in ACTIVE_STATES or time.monotonic() >= query_deadline:
+                        if state not in ACTIVE_STATES:
+                            del running[execution_id]
+                        reason = status.get("StateChangeReason", "unknown reason")
+                        raise RuntimeError(f"Athena query did not succeed (state={state}, reason={reason}): {queries[key]}")
+
+            if throttled:
+                interval = min(interval * 2, POLL_INTERVAL_MAX_SECONDS)
+            elif completed:
+                interval = POLL_INTERVAL_MIN_SECONDS
+            else:
+                interval = min(interval * POLL_BACKOFF_FACTOR, POLL_INTERVAL_MAX_SECONDS)
+            if running or pending:
+                time.sleep(interval)
+    finally:
+        # Only left non-empty by a failure: cancel the sibling queries
+        for execution_id in running:
+            try:
+                athena.stop_query_execution(QueryExecutionId=execution_id)
+            except ClientError as e:
+                logger.warning(f"Could not stop Athena query {execution_id}: {e}")
+    return results
+
+
+def get_query_rows(query_execution_id: str) -> list[dict]:
     rows: list[dict] = []
     columns: list[str] | None = None
     paginator = athena.get_paginator("get_query_results")
@@ -99,43 +170,63 @@ def partition_where(target_date: date) -> str:
     return f"year = '{target_date.year:04d}' AND month = '{target_date.month:02d}' AND day = '{target_date.day:02d}'"
 
 
-def query_action_breakdown(target_date: date) -> dict[str, int]:
-    sql = f"SELECT action, COUNT(*) AS cnt FROM {TABLE_FQN} WHERE {partition_where(target_date)} GROUP BY action"
-    return {row["action"]: int(row["cnt"]) for row in run_athena_query(sql)}
+def action_breakdown_sql(target_date: date) -> str:
+    return f"SELECT action, COUNT(*) AS cnt FROM {TABLE_FQN} WHERE {partition_where(target_date)} GROUP BY action"
+
+
+def parse_action_breakdown(rows: list[dict]) -> dict[str, int]:
+    return {row["action"]: int(row["cnt"]) for row in rows}
 
 
-def query_top_blocked(field: str, alias: str, target_date: date) -> list[tuple[str, int]]:
-    sql = (
+def top_blocked_sql(field: str, alias: str, target_date: date) -> str:
+    return (
         f"SELECT {field} AS {alias}, COUNT(*) AS cnt FROM {TABLE_FQN} "
         f"WHERE {partition_where(target_date)} AND action = 'BLOCK' "
         f"GROUP BY {field} ORDER BY cnt DESC LIMIT {TOP_N}"
     )
-    return [(row[alias] or "-", int(row["cnt"])) for row in run_athena_query(sql)]
 
 
-def query_count_mode_rules(target_date: date) -> list[tuple[str, int]]:
-    sql = (
+def count_mode_rules_sql(target_date: date) -> str:
+    return (
         f"SELECT rule.ruleid AS rule_id, COUNT(*) AS cnt FROM {TABLE_FQN} "
         f"CROSS JOIN UNNEST(nonterminatingmatchingrules) AS t(rule) "
         f"WHERE {partition_where(target_date)} AND rule.action = 'COUNT' "
         f"GROUP BY rule.ruleid ORDER BY cnt DESC LIMIT {TOP_N}"
     )
-    return [(row["rule_id"] or "-", int(row["cnt"])) for row in run_athena_query(sql)]
 
 
-def build_report(target_date: date, prev_date: date) -> dict:
-    action_breakdown = query_action_breakdown(target_date)
-    prev_action_breakdown = query_action_breakdown(prev_date)
+def parse_top(rows: list[dict], alias: str) -> list[tuple[str, int]]:
+    return [(row[alias] or "-", int(row["cnt"])) for row in rows]
+
+
+def build_report(target_date: date, prev_date: date, deadline: float | None = None) -> dict:
+    # The Top-N queries are submitted with the others instead of after the
+    # BLOCK count is known; their rows are ignored when nothing was blocked
+    top_fields = {
+        "top_blocked_rules": ("terminatingruleid", "rule_id"),
+        "top_blocked_ips": ("httprequest.clientip", "client_ip"),
+        "top_blocked_countries": ("httprequest.country", "country"),
+        "top_blocked_uris": ("httprequest.uri", "uri"),
+    }
+    rows = run_athena_queries(
+        {
+            "action_breakdown": action_breakdown_sql(target_date),
+            "prev_action_breakdown": action_breakdown_sql(prev_date),
+            **{key: top_blocked_sql(field, alias, target_date) for key, (field, alias) in top_fields.items()},
+            "top_count_mode_rules": count_mode_rules_sql(target_date),
+        },
+        deadline,
+    )
+
+    action_breakdown = parse_action_breakdown(rows["action_breakdown"])
+    prev_action_breakdown = parse_action_breakdown(rows["prev_action_breakdown"])
 
     total = sum(action_breakdown.values())
     prev_total = sum(prev_action_breakdown.values())
     block_total = action_breakdown.get("BLOCK", 0)
 
-    top_blocked_rules = query_top_blocked("terminatingruleid", "rule_id", target_date) if block_total else []
-    top_blocked_ips = query_top_blocked("httprequest.clientip", "client_ip", target_date) if block_total else []
-    top_blocked_countries = query_top_blocked("httprequest.country", "country", target_date) if block_total else []
-    top_blocked_uris = query_top_blocked("httprequest.uri", "uri", target_date) if block_total else []
-    top_count_mode_rules = query_count_mode_rules(target_date)
+    top_blocked = {key: parse_top(rows[key], alias) if block_total else [] for key, (_, alias) in top_fields.items()}
+    top_count_mode_rules = parse_top(rows["top_count_mode_rules"], "rule_id")
 
     change_percent = round((total - prev_total) / prev_total * 100, 1) if prev_total else None
 
@@ -145,10 +236,7 @@ def build_report(target_date: date, prev_date: date) -> dict:
         "prev_total": prev_total,
         "change_percent": change_percent,
         "action_breakdown": action_breakdown,
-        "top_blocked_rules": top_blocked_rules,
-        "top_blocked_ips": top_blocked_ips,
-        "top_blocked_countries": top_blocked_countries,
-        "top_blocked_uris": top_blocked_uris,
+        **top_blocked,
         "top_count_mode_rules": top_count_mode_rules,
     }
 
@@ -244,7 +332,10 @@ def lambda_handler(event, context):
     target_date = (now - timedelta(days=1)).date()
     prev_date = target_date - timedelta(days=1)
 
-    report = build_report(target_date, prev_date)
+    deadline = None
+    if context is not None:
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - TIME_RESERVE_SECONDS
+    report = build_report(target_date, prev_date, deadline)
     subject, body = build_report_text(report)
 
     logger.info(json.dumps({"targetDate": target_date.isoformat(), "total": report["total"]}))
@@ -14,9 +14,15 @@ Environment variables:
   ANOMALY_THRESHOLD_PERCENT - Request-volume increase (%) that triggers an
                                anomaly warning (default 50).
   LOCALE                    - Report language: "ja" or "en" (default "ja").
+  MAX_CONCURRENT_QUERIES    - Queries run at the same time (default 30, the
+                               account's Logs Insights concurrent-query quota).
+
+All queries of a report are started up front and polled together (see
+`run_insights_queries`), so a report takes about as long as its slowest query
+rather than the sum of all of them.
 
 Caveat: CloudWatch Logs Insights cannot unnest JSON arrays, so
-`query_count_mode_rules` only inspects the first entry of each request's
+`count_mode_rules_query` only inspects the first entry of each request's
 `nonTerminatingMatchingRules` array. A request that matched more than one
 COUNT-mode rule is attributed to its first match only. Pattern 2 (Athena,
 `CROSS JOIN UNNEST`) counts every match exactly -- see the athena-report
@@ -30,6 +36,7 @@ import time
 from datetime import datetime, timedelta, timezone
 
 import boto3
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -43,54 +50,125 @@ REPORT_PERIOD_HOURS = int(os.environ.get("REPORT_PERIOD_HOURS", "24"))
 TOP_N = int(os.environ.get("TOP_N", "5"))
 ANOMALY_THRESHOLD_PERCENT = float(os.environ.get("ANOMALY_THRESHOLD_PERCENT", "50"))
 LOCALE = os.environ.get("LOCALE", "ja")
+MAX_CONCURRENT_QUERIES = int(os.environ.get("MAX_CONCURRENT_QUERIES", "30"))
 
 QUERY_TIMEOUT_SECONDS = 60
-POLL_INTERVAL_SECONDS = 2
-
-
-def run_insights_query(start_time: int, end_time: int, query_string: str) -> list[dict]:
-    start_resp = logs_client.start_query(
-        logGroupName=LOG_GROUP_NAME,
-        startTime=start_time,
-        endTime=end_time,
-        queryString=query_string,
-        limit=10000,
-    )
-    query_id = start_resp["queryId"]
-
-    deadline = time.monotonic() + QUERY_TIMEOUT_SECONDS
-    result = logs_client.get_query_results(queryId=query_id)
-    while result["status"] in ("Scheduled", "Running") and time.monotonic() < deadline:
-        time.sleep(POLL_INTERVAL_SECONDS)
-        result = logs_client.get_query_results(queryId=query_id)
-
-    if result["status"] != "Complete":
-        if result["status"] in ("Scheduled", "Running"):
-            logs_client.stop_query(queryId=query_id)
-        raise RuntimeError(f"Logs Insights query did not complete (status={result['status']}): {query_string}")
-
-    return [{field["field"]: field["value"] for field in record} for record in result["results"]]
-
-
-def query_action_breakdown(start_time: int, end_time: int) -> dict[str, int]:
-    rows = run_insights_query(start_time, end_time, "stats count(*) as cnt by action | sort cnt desc")
+# Time left at the overall deadline to stop the queries and publish the report
+TIME_RESERVE_SECONDS = 15
+# The poll interval grows while no query completes and resets when one does
+POLL_INTERVAL_MIN_SECONDS = 0.5
+POLL_INTERVAL_MAX_SECONDS = 5
+POLL_BACKOFF_FACTOR = 1.5
+ACTIVE_STATUSES = ("Scheduled", "Running")
+
+ACTION_BREAKDOWN_QUERY = "stats count(*) as cnt by action | sort cnt desc"
+COUNT_MODE_RULE_FIELD = "nonTerminatingMatchingRules.0.ruleId"
+
+
+def run_insights_queries(
+    queries: dict[str, tuple[int, int, str]], deadline: float | None = None
+) -> dict[str, list[dict]]:
+    """
+    Run {key: (start_time, end_time, query_string)} and return {key: rows}.
+
+    Every query is started up front, up to MAX_CONCURRENT_QUERIES; the rest
+    start as slots free up, as does a query refused with LimitExceededException
+    (slots used by other clients) or ThrottlingException (StartQuery quota).
+    One loop polls all running queries, sleeping longer while none completes
+    and backing off further when throttled. If a query fails or runs longer
+    than QUERY_TIMEOUT_SECONDS, or queries are still pending or running at
+    `deadline` (time.monotonic()), the queries still running are stopped and
+    RuntimeError is raised.
+    """
+    pending = list(queries)
+    running: dict[str, tuple[str, float]] = {}
+    results = {}
+    interval = POLL_INTERVAL_MIN_SECONDS
+    try:
+        while pending or running:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise RuntimeError(
+                    f"Logs Insights queries did not finish in time: {len(pending)} not started, {len(running)} running"
+                )
+            completed = throttled = False
+            while pending and len(running) < MAX_CONCURRENT_QUERIES:
+                start_time, end_time, query_string = queries[pending[0]]
+                try:
+                    start_resp = logs_client.start_query(
+                        logGroupName=LOG_GROUP_NAME,
+                        startTime=start_time,
+                        endTime=end_time,
+                        queryString=query_string,
+                        limit=10000,
+                    )
+                except logs_client.exceptions.LimitExceededException:
+                    break
+                except ClientError as e:
+                    if e.response["Error"]["Code"] != "ThrottlingException":
+                        raise
+                    throttled = True
+                    break
+                running[pending.pop(0)] = (start_resp["queryId"], time.monotonic() + QUERY_TIMEOUT_SECONDS)
+
+            for key, (query_id, query_deadline) in list(running.items()):
+                try:
+                    result = logs_client.get_query_results(queryId=query_id)
+                except ClientError as e:
+                    if e.response["Error"]["Code"] != "ThrottlingException":
+                        raise
+                    throttled = True
+                    break
+                if result["status"] == "Complete":
+                    results[key] = [{field["field"]: field["value"] for field in record} for record in result["results"]]
+                    del running[key]
+                    completed = True
+                elif result["status"] not in ACTIVE_STATUSES:
+                    del running[key]
+                    raise RuntimeError(
+                        f"Logs Insights query did not complete (status={result['status']}): {queries[key][2]}"
+                    )
+                elif time.monotonic() >= query_deadline:
+                    raise RuntimeError(f"Logs Insights query did not complete (status=Timeout): {queries[key][2]}")
+                else:
+                    # Polled queries go last, so a throttled round resumes with the others
+                    running[key] = running.pop(key)
+
+            if throttled:
+                interval = min(interval * 2, POLL_INTERVAL_MAX_SECONDS)
+            elif completed:
+                interval = POLL_INTERVAL_MIN_SECONDS
+            else:
+                interval = min(interval * POLL_BACKOFF_FACTOR, POLL_INTERVAL_MAX_SECONDS)
+            if running or pending:
+                time.sleep(interval)
+    finally:
+        # Only left non-empty by a failure: stop the sibling queries
+        for query_id, _ in running.values():
+            try:
+                logs_client.stop_query(queryId=query_id)
+            except ClientError as e:
+                logger.warning(f"Could not stop Logs Insights query {query_id}: {e}")
+    return results
+
+
+def parse_action_breakdown(rows: list[dict]) -> dict[str, int]:
     return {row["action"]: int(row["cnt"]) for row in rows}
 
 
-def query_top_blocked(field: str, start_time: int, end_time: int) -> list[tuple[str, int]]:
-    query = f'filter action = "BLOCK" | stats count(*) as cnt by {field} | sort cnt desc | limit {TOP_N}'
-    rows = run_insights_query(start_time, end_time, query)
-    return [(row.get(field, "-"), int(row["cnt"])) for row in rows]
+def top_blocked_query(field: str) -> str:
+    return f'filter action = "BLOCK" | stats count(*) as cnt by {field} | sort cnt desc | limit {TOP_N}'
 
 
-def query_count_mode_rules(start_time: int, end_time: int) -> list[tuple[str, int]]:
-    field = "nonTerminatingMatchingRules.0.ruleId"
-    query = (
+def count_mode_rules_query() -> str:
+    field = COUNT_MODE_RULE_FIELD
+    return (
         f"filter ispresent({field}) "
         f"| stats count(*) as cnt by {field} "
         f"| sort cnt desc | limit {TOP_N}"
     )
-    rows = run_insights_query(start_time, end_time, query)
+
+
+def parse_top(rows: list[dict], field: str) -> list[tuple[str, int]]:
     return [(row.get(field, "-"), int(row["cnt"])) for row in rows]
 
 
@@ -98,7 +176,7 @@ def to_epoch_millis(dt: datetime) -> int:
     return int(dt.timestamp())
 
 
-def build_report(now: datetime) -> dict:
+def build_report(now: datetime, deadline: float | None = None) -> dict:
     period_end = now
     period_start = now - timedelta(hours=REPORT_PERIOD_HOURS)
     prev_period_end = period_start
@@ -107,18 +185,33 @@ def build_report(now: datetime) -> dict:
     start_time, end_time = to_epoch_millis(period_start), to_epoch_millis(period_end)
     prev_start_time, prev_end_time = to_epoch_millis(prev_period_start), to_epoch_millis(prev_period_end)
 
-    action_breakdown = query_action_breakdown(start_time, end_time)
-    prev_action_breakdown = query_action_breakdown(prev_start_time, prev_end_time)
+    # The Top-N queries are started with the others instead of after the
+    # BLOCK count is known; they are simply ignored when nothing was blocked
+    top_fields = {
+        "top_blocked_rules": "terminatingRuleId",
+        "top_blocked_ips": "httpRequest.clientIp",
+        "top_blocked_countries": "httpRequest.country",
+        "top_blocked_uris": "httpRequest.uri",
+    }
+    rows = run_insights_queries(
+        {
+            "action_breakdown": (start_time, end_time, ACTION_BREAKDOWN_QUERY),
+            "prev_action_breakdown": (prev_start_time, prev_end_time, ACTION_BREAKDOWN_QUERY),
+            **{key: (start_time, end_time, top_blocked_query(field)) for key, field in top_fields.items()},
+            "top_count_mode_rules": (start_time, end_time, count_mode_rules_query()),
+        },
+        deadline,
+    )
+
+    action_breakdown = parse_action_breakdown(rows["action_breakdown"])
+    prev_action_breakdown = parse_action_breakdown(rows["prev_action_breakdown"])
 
     total = sum(action_breakdown.values())
     prev_total = sum(prev_action_breakdown.values())
     block_total = action_breakdown.get("BLOCK", 0)
 
-    top_blocked_rules = query_top_blocked("terminatingRuleId", start_time, end_time) if block_total else []
-    top_blocked_ips = query_top_blocked("httpRequest.clientIp", start_time, end_time) if block_total else []
-    top_blocked_countries = query_top_blocked("httpRequest.country", start_time, end_time) if block_total else []
-    top_blocked_uris = query_top_blocked("httpRequest.uri", start_time, end_time) if block_total else []
-    top_count_mode_rules = query_count_mode_rules(start_time, end_time)
+    top_blocked = {key: parse_top(rows[key], field) if block_total else [] for key, field in top_fields.items()}
+    top_count_mode_rules = parse_top(rows["top_count_mode_rules"], COUNT_MODE_RULE_FIELD)
 
     change_percent = None
     if prev_total > 0:
@@ -131,10 +224,7 @@ def build_report(now: datetime) -> dict:
         "prev_total": prev_total,
         "change_percent": change_percent,
         "action_breakdown": action_breakdown,
-        "top_blocked_rules": top_blocked_rules,
-        "top_blocked_ips": top_blocked_ips,
-        "top_blocked_countries": top_blocked_countries,
-        "top_blocked_uris": top_blocked_uris,
+        **top_blocked,
         "top_count_mode_rules": top_count_mode_rules,
     }
 
@@ -251,7 +341,10 @@ def build_report_text(report: dict) -> tuple[str, str]:
 
 def lambda_handler(event, context):
     now = datetime.now(timezone.utc)
-    report = build_report(now)
+    deadline = None
+    if context is not None:
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - TIME_RESERVE_SECONDS
+    report = build_report(now, deadline)
     subject, body = build_report_text(report)
 
     logger.info(json.dumps({"total": report["total"], "changePercent": report["change_percent"]}))
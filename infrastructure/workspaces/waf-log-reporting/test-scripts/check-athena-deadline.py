@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Athena Report Deadline Checker
+
+Runs `run_athena_queries` of the athena-report Lambda offline against a
+stubbed Athena API whose queries never finish, on a simulated clock:
+
+1. An overall deadline shorter than QUERY_TIMEOUT_SECONDS stops the run at
+   the deadline, not at the per-query timeout
+2. The queries still running at the deadline are stopped
+3. Without an overall deadline, the run stops at QUERY_TIMEOUT_SECONDS
+
+No AWS credentials or local services are needed.
+
+Usage:
+    python check-athena-deadline.py [--deadline SECONDS]
+
+Examples:
+    # Default: an overall deadline of 3 seconds
+    python check-athena-deadline.py
+
+    python check-athena-deadline.py --deadline 30
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+
+try:
+    import boto3  # noqa: F401 (imported by the Lambda)
+except ImportError:
+    print("Error: boto3 is not installed. Please install it with: pip install boto3")
+    sys.exit(1)
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src/lambda/athena-report")
+
+QUERIES = {"total": "SELECT 1", "by_action": "SELECT 2", "top_ips": "SELECT 3"}
+
+
+class FakeClock:
+    """Stands in for the `time` module: sleep() advances monotonic()"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class FakeAthenaClient:
+    """Athena API whose queries stay RUNNING until stopped"""
+
+    class exceptions:
+        class TooManyRequestsException(Exception):
+            pass
+
+    def __init__(self):
+        self.started = []
+        self.stopped = []
+
+    def start_query_execution(self, **kwargs):
+        execution_id = f"execution-{len(self.started)}"
+        self.started.append(execution_id)
+        return {"QueryExecutionId": execution_id}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        return {
+            "QueryExecutions": [
+                {"QueryExecutionId": execution_id, "Status": {"State": "RUNNING"}}
+                for execution_id in QueryExecutionIds
+            ]
+        }
+
+    def stop_query_execution(self, QueryExecutionId):
+        self.stopped.append(QueryExecutionId)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the Athena report stops at its overall deadline")
+    parser.add_argument("--deadline", type=float, default=3, help="Overall deadline in seconds (default: 3)")
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "ap-northeast-1"),
+            "ATHENA_DATABASE": "waf_logs",
+            "ATHENA_TABLE": "waf_logs",
+            "ATHENA_WORKGROUP": "waf-report",
+            "TOPIC_ARN": "arn:aws:sns:ap-northeast-1:123456789012:waf-report",
+        }
+    )
+    spec = importlib.util.spec_from_file_location("athena_report", os.path.join(LAMBDA_DIR, "index.py"))
+    index = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(index)
+
+    if args.deadline >= index.QUERY_TIMEOUT_SECONDS:
+        parser.error(f"--deadline must be shorter than QUERY_TIMEOUT_SECONDS ({index.QUERY_TIMEOUT_SECONDS})")
+
+    failures = 0
+
+    def check(description: str, condition: bool) -> None:
+        nonlocal failures
+        print(f"  {'✓' if condition else '✗'} {description}")
+        failures += 0 if condition else 1
+
+    def run(deadline: float | None) -> tuple[FakeAthenaClient, float, str]:
+        athena = FakeAthenaClient()
+        clock = FakeClock()
+        index.athena = athena
+        index.time = clock
+        try:
+            index.run_athena_queries(QUERIES, None if deadline is None else clock.monotonic() + deadline)
+        except RuntimeError as e:
+            return athena, clock.now, str(e)
+        return athena, clock.now, ""
+
+    print(f"\nOverall deadline of {args.deadline:g}s (query timeout {index.QUERY_TIMEOUT_SECONDS}s)")
+    athena, elapsed, error = run(args.deadline)
+    check("the run fails with RuntimeError", bool(error))
+    check(
+        f"the run stops at the overall deadline ({elapsed:.1f}s)",
+        args.deadline <= elapsed < args.deadline + index.POLL_INTERVAL_MAX_SECONDS,
+    )
+    check("the error names the overall deadline", "did not finish in time" in error)
+    check(f"every running query is stopped ({len(athena.stopped)}/{len(QUERIES)})", sorted(athena.stopped) == sorted(athena.started))
+
+    print("\nNo overall deadline")
+    athena, elapsed, error = run(None)
+    check(
+        f"the run stops at the query timeout ({elapsed:.1f}s)",
+        index.QUERY_TIMEOUT_SECONDS <= elapsed < index.QUERY_TIMEOUT_SECONDS + index.POLL_INTERVAL_MAX_SECONDS,
+    )
+    check("the error names the query timeout", "did not succeed" in error)
+    check(f"every running query is stopped ({len(athena.stopped)}/{len(QUERIES)})", sorted(athena.stopped) == sorted(athena.started))
+
+    print()
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("✓ All checks passed")
+
+
+if __name__ == "__main__":
+    main()